@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class DrfConfig(AppConfig):
+    name = 'drf'
+
+    def ready(self):
+        from drf import signals  # NOQA
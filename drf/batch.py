@@ -0,0 +1,126 @@
+"""
+Batched sub-requests for the batch endpoint.
+The batch request is authenticated once; every sub-request calls the view of
+its url directly (no middleware) with that user forced, so no sub-request
+authenticates again. Only reads are allowed and they run concurrently, on
+gevent greenlets when the worker is monkey patched, else on a small thread
+pool per process. Each thread gives its database connection back to the pool
+(drf/db/pool.py) when its sub-request is done.
+"""
+
+import logging
+import os
+import sys
+import time
+
+from django.conf import settings as django_settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.urlresolvers import Resolver404, resolve
+from django.db import connections
+from django.utils import six
+from django.utils.six.moves.urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_pools = {}
+
+
+def _gevent_patched():
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def _map(func, items):
+    """ ``map`` on the worker's greenlets or on this process' thread pool """
+    size = getattr(django_settings, 'BATCH_CONCURRENCY', 4)
+    if _gevent_patched():
+        from gevent.pool import Pool
+        return Pool(size).map(func, items)
+    pid = os.getpid()
+    if pid not in _pools:
+        from multiprocessing.pool import ThreadPool
+        _pools.clear()
+        _pools[pid] = ThreadPool(size)
+    return _pools[pid].map(func, items)
+
+
+def sub_request(request, method, url):
+    """ a WSGIRequest for ``url`` sharing the META and the user of the batch ``request`` """
+    parts = urlsplit(url)
+    environ = dict(request.META)
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'CONTENT_LENGTH': '0',
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': six.BytesIO(b''),
+    })
+    environ.pop('CONTENT_TYPE', None)
+    sub = WSGIRequest(environ)
+    sub.user = request.user
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    return sub
+
+
+def _error(status, detail):
+    return status, {'detail': detail}
+
+
+def execute(request, item):
+    """ (status, body) of one sub-request ``item`` = {'method', 'url'} """
+    method = (item.get('method') or 'GET').upper()
+    url = item.get('url')
+    if not url:
+        return _error(400, 'url is required')
+    if method not in SAFE_METHODS:
+        return _error(405, 'only %s sub-requests are allowed' % ', '.join(SAFE_METHODS))
+    try:
+        match = resolve(urlsplit(url).path)
+    except Resolver404:
+        return _error(404, 'Not found.')
+    if match.url_name in getattr(django_settings, 'BATCH_EXCLUDED_VIEWS', ()):
+        return _error(400, '%s is not available in a batch' % match.url_name)
+
+    sub = sub_request(request, method, url)
+    sub.resolver_match = match
+    response = match.func(sub, *match.args, **match.kwargs)
+    if response.streaming:
+        return _error(400, 'streaming responses are not available in a batch')
+    if hasattr(response, 'data'):
+        return response.status_code, response.data
+    return response.status_code, response.content.decode(response.charset)
+
+
+def run(request, items):
+    """ [{'id', 'method', 'url', 'status', 'duration_ms', 'body'}, ...] in the order of ``items`` """
+    concurrent = len(items) > 1 and getattr(django_settings, 'BATCH_CONCURRENCY', 4) > 1
+
+    def timed(item):
+        start = time.time()
+        try:
+            status, body = execute(request, item)
+        except Exception:
+            # the details go to the log, not to the caller
+            logger.exception('batch sub-request %s %s failed', item.get('method') or 'GET', item.get('url'))
+            status, body = _error(500, 'Internal server error')
+        finally:
+            if concurrent:
+                connections.close_all()
+        return {
+            'id': item.get('id'),
+            'method': (item.get('method') or 'GET').upper(),
+            'url': item.get('url'),
+            'status': status,
+            'duration_ms': round((time.time() - start) * 1000, 2),
+            'body': body,
+        }
+
+    if concurrent:
+        return _map(timed, items)
+    return [timed(item) for item in items]
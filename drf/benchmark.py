@@ -0,0 +1,203 @@
+"""
+Endpoint benchmark harness, driven by ``manage.py benchmark``.
+Every named url of ``webizcafe/urls.py`` is requested through the test client
+and latency percentiles, SQL query count and response size are collected.
+Results are plain JSON so two runs can be compared with ``compare``.
+"""
+
+import json
+import math
+import time
+
+from django.core.urlresolvers import RegexURLPattern, reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import six, timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from drf.models import Author, Post, Comment, Booking, Location, BoxedLocation
+
+# urls which are not API endpoints or need a request body
+SKIP = ('jwt-obtain', 'jwt-verify', 'jwt-refresh', 'postimage-detail', 'comment-create', 'booking-create',
+        'postbooking-stream', 'authorbooking-stream', 'batch', 'bookingseries-create', 'export')
+
+# sample object used for the ``pk`` of each url name prefix
+SAMPLE_MODELS = (
+    ('post', Post),
+    ('comment', Comment),
+    ('booking', Booking),
+    ('boxedlocation', BoxedLocation),
+    ('location', Location),
+)
+
+# query strings for endpoints that need parameters to do real work
+QUERY_STRINGS = {
+    'location-list_contained_in_bbox_filter': 'in_bbox=0,0,180,90',
+    'location-list_within_distance_of_point_filter': 'point=39.9,116.4&dist=5000',
+    'bookingsearch-list': 'from=2016-01-01T00:00:00Z&to=2016-02-01T00:00:00Z',
+}
+
+
+def percentile(values, p):
+    """ nearest-rank percentile of a list of numbers """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def endpoints(urlconf=None):
+    """ (name, url) of every benchmarkable named url """
+    if urlconf is None:
+        from webizcafe import urls as urlconf
+
+    seen = set()
+    samples = {}
+    for pattern in urlconf.urlpatterns:
+        if not isinstance(pattern, RegexURLPattern) or not pattern.name:
+            continue
+        if pattern.name in seen or pattern.name in SKIP:
+            continue
+        seen.add(pattern.name)
+
+        kwargs = {}
+        if 'pk' in pattern.regex.groupindex:
+            model = [m for prefix, m in SAMPLE_MODELS if pattern.name.startswith(prefix)]
+            if not model:
+                continue
+            if model[0] not in samples:
+                samples[model[0]] = model[0].objects.order_by('pk').values_list('pk', flat=True).first()
+            if samples[model[0]] is None:
+                continue
+            kwargs['pk'] = samples[model[0]]
+
+        url = reverse(pattern.name, kwargs=kwargs)
+        if pattern.name in QUERY_STRINGS:
+            url += '?' + QUERY_STRINGS[pattern.name]
+        yield pattern.name, url
+
+
+def measure(client, url, iterations, warmup=1):
+    timings = []
+    queries = None
+    size = None
+    status = None
+    for i in range(warmup + iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.time()
+            response = client.get(url)
+            if response.streaming:
+                content = b''.join(response.streaming_content)
+            else:
+                content = response.content
+            elapsed = (time.time() - start) * 1000
+        if i < warmup:
+            continue
+        timings.append(elapsed)
+        queries = len(context.captured_queries)
+        size = len(content)
+        status = response.status_code
+    return {
+        'status': status,
+        'iterations': iterations,
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'mean_ms': sum(timings) / len(timings),
+        'queries': queries,
+        'bytes': size,
+    }
+
+
+def run(iterations=20, user=None, names=None, urlconf=None):
+    client = APIClient()
+    if user is None:
+        user = Author.objects.filter(is_active=True, posts__isnull=False).order_by('pk').first()
+    if user is not None:
+        client.force_authenticate(user=user)
+
+    results = {}
+    for name, url in endpoints(urlconf):
+        if names and name not in names:
+            continue
+        result = measure(client, url, iterations)
+        result['url'] = url
+        results[name] = result
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'counts': dict((model.__name__, model.objects.count()) for model in (Author, Post, Comment, Booking, Location)),
+        'endpoints': results,
+    }
+
+
+def pages(page_size=1000):
+    """ serialized pages of generated posts, locations and bookings, as the renderer gets them """
+    from drf.serializers import PostSerializer, LocationSerializer, BookingSerializer
+    context = {'request': Request(APIRequestFactory().get('/'))}
+    return {
+        'post': PostSerializer(Post.objects.order_by('pk')[:page_size], many=True, context=context).data,
+        'location': LocationSerializer(Location.objects.order_by('pk')[:page_size], many=True, context=context).data,
+        'booking': BookingSerializer(Booking.objects.order_by('pk')[:page_size], many=True, context=context).data,
+    }
+
+
+def codecs(iterations=20, page_size=1000, renderer_classes=None, parser_classes=None):
+    """
+    Render and parse timings of ``pages`` with the stock JSON renderer and
+    parser and with ours. Returns {page: {class name: {'render_ms', 'parse_ms', 'bytes'}}}.
+    """
+    from drf.parsers import FastJSONParser
+    from drf.renderers import FastJSONRenderer
+    renderer_classes = renderer_classes or (JSONRenderer, FastJSONRenderer)
+    parser_classes = parser_classes or (JSONParser, FastJSONParser)
+
+    results = {}
+    for name, data in pages(page_size).items():
+        results[name] = {}
+        for renderer_class, parser_class in zip(renderer_classes, parser_classes):
+            renderer, parser = renderer_class(), parser_class()
+            render_timings, parse_timings = [], []
+            for i in range(iterations):
+                start = time.time()
+                content = renderer.render(data, 'application/json', {})
+                render_timings.append((time.time() - start) * 1000)
+                start = time.time()
+                parser.parse(six.BytesIO(content))
+                parse_timings.append((time.time() - start) * 1000)
+            results[name][renderer_class.__name__] = {
+                'rows': len(data),
+                'bytes': len(content),
+                'render_ms': percentile(render_timings, 50),
+                'parse_ms': percentile(parse_timings, 50),
+            }
+    return results
+
+
+def compare(previous, current, threshold=10.0, metric='p95_ms'):
+    """
+    Compare two ``run`` results. Returns rows of
+    (name, previous, current, change in percent, regressed).
+    """
+    rows = []
+    for name, result in sorted(current['endpoints'].items()):
+        before = previous['endpoints'].get(name)
+        if not before or not before.get(metric):
+            continue
+        change = (result[metric] - before[metric]) * 100.0 / before[metric]
+        regressed = change > threshold or (result['queries'] or 0) > (before['queries'] or 0)
+        rows.append((name, before[metric], result[metric], change, regressed))
+    return rows
+
+
+def dump(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,209 @@
+"""
+Post page bundle: the post with its images, the first top-level comment
+threads, upcoming bookings and rating aggregates in one response.
+Every section is built with a fixed number of queries whatever the amount
+of data (comment threads come from one recursive query), and the whole
+bundle runs under a query budget, ``BUNDLE_QUERY_BUDGET``. Sections with a
+timeout in ``BUNDLE_CACHE_SECONDS`` are cached until it expires or the post,
+its images, comments or bookings change.
+"""
+
+import logging
+from collections import OrderedDict
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import exceptions
+
+from drf import partitions
+from drf.fastserializers import PostValuesSerializer, CommentValuesSerializer, BookingValuesSerializer
+from drf.models import Author, Post, Comment, Booking
+
+logger = logging.getLogger(__name__)
+
+SECTIONS = ('post', 'comments', 'bookings', 'ratings')
+
+# sorl-thumbnail's key value store is cached and missing thumbnails are only
+# queued as jobs (drf/fields.py), neither counts
+UNCOUNTED_TABLES = ('thumbnail_kvstore', 'drf_job')
+
+
+class QueryBudgetExceeded(exceptions.APIException):
+    default_detail = 'Query budget exceeded.'
+
+
+class QueryBudget(object):
+    """
+    Counts the queries run inside the block on all connections. Going over
+    ``budget`` raises QueryBudgetExceeded when ``strict``, else it is logged.
+    """
+
+    def __init__(self, budget, strict=False, name='bundle'):
+        self.budget = budget
+        self.strict = strict
+        self.name = name
+        self.used = 0
+
+    def __enter__(self):
+        self.state = []
+        for connection in connections.all():
+            self.state.append((connection, connection.force_debug_cursor, len(connection.queries_log)))
+            connection.force_debug_cursor = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for connection, forced, start in self.state:
+            queries = list(connection.queries_log)[start:]
+            self.used += len([q for q in queries if not any(table in q['sql'] for table in UNCOUNTED_TABLES)])
+            connection.force_debug_cursor = forced
+        if exc_type is None and self.used > self.budget:
+            message = '%s ran %d queries, over its budget of %d' % (self.name, self.used, self.budget)
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+
+def _generation_key(pk):
+    return 'post-bundle:%s:generation' % pk
+
+
+def invalidate(pk):
+    try:
+        cache.incr(_generation_key(pk))
+    except ValueError:
+        cache.set(_generation_key(pk), 1, None)
+
+
+def _cached(pk, section, variant, build):
+    timeout = getattr(django_settings, 'BUNDLE_CACHE_SECONDS', {}).get(section)
+    if not timeout:
+        return build()
+    generation = cache.get(_generation_key(pk)) or 0
+    key = 'post-bundle:%s:%s:%s:%s' % (pk, generation, section, variant)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout)
+    return data
+
+
+class ThreadValuesSerializer(CommentValuesSerializer):
+    """ comment trees from rows which are all in memory already """
+
+    def __init__(self, rows, context=None):
+        super(ThreadValuesSerializer, self).__init__(context)
+        self.replies = {}
+        for row in sorted(rows, key=lambda row: (row['created'], row['id'])):
+            self.replies.setdefault(row['parent'], []).append(row)
+
+    def related_children(self, rows):
+        return dict((row['id'], self.serialize(self.replies.get(row['id'], []))) for row in rows)
+
+    def threads(self):
+        return self.serialize(self.replies.get(None, []))
+
+
+def thread_rows(post_pk, limit):
+    """ the first ``limit`` top-level comments of a post and all their replies, in one query """
+    comment, author = Comment._meta, Author._meta
+    sql = '''
+        WITH RECURSIVE thread AS (
+            (SELECT * FROM {comment} WHERE {post} = %s AND {parent} IS NULL ORDER BY {created}, id LIMIT %s)
+            UNION ALL
+            SELECT reply.* FROM {comment} reply JOIN thread ON reply.{parent} = thread.id
+        )
+        SELECT thread.id, {author}.{username}, thread.{post}, thread.{parent}, thread.{content},
+               thread.{rating}, thread.{created}, thread.{updated}
+        FROM thread JOIN {author} ON {author}.id = thread.{author_id}
+    '''.format(
+        comment=comment.db_table, author=author.db_table, username=author.get_field('username').column,
+        post=comment.get_field('post').column, parent=comment.get_field('parent').column,
+        author_id=comment.get_field('author').column, content=comment.get_field('content').column,
+        rating=comment.get_field('rating').column, created=comment.get_field('created').column,
+        updated=comment.get_field('updated').column,
+    )
+    names = ('id', 'author__username', 'post', 'parent', 'content', 'rating', 'created', 'updated')
+    cursor = connections[Comment.objects.db].cursor()
+    try:
+        cursor.execute(sql, [post_pk, limit])
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def post_section(pk, context):
+    serializer = PostValuesSerializer(context)
+    rows = list(serializer.values(Post.objects.filter(pk=pk)))
+    if not rows:
+        raise Http404
+    return serializer.serialize(rows)[0]
+
+
+def comments_section(pk, threads, context):
+    rows = thread_rows(pk, threads + 1)
+    roots = sorted((row for row in rows if row['parent'] is None), key=lambda row: (row['created'], row['id']))
+    if len(roots) > threads:
+        # drop the extra thread, fetched only to know there are more
+        replies = {}
+        for row in rows:
+            replies.setdefault(row['parent'], []).append(row['id'])
+        dropped, pending = set(), [roots[-1]['id']]
+        while pending:
+            comment = pending.pop()
+            dropped.add(comment)
+            pending.extend(replies.get(comment, ()))
+        rows = [row for row in rows if row['id'] not in dropped]
+    return OrderedDict((
+        ('has_more', len(roots) > threads),
+        ('threads', ThreadValuesSerializer(rows, context).threads()),
+    ))
+
+
+def bookings_section(pk, limit, context):
+    serializer = BookingValuesSerializer(context)
+    queryset = partitions.ending_after(Booking.objects.filter(post=pk), timezone.now()).order_by('begin')[:limit]
+    return serializer.serialize(serializer.values(queryset))
+
+
+def ratings_section(pk):
+    scale = getattr(django_settings, 'COMMENT_RATING_MAX', 5)
+    distribution = OrderedDict((str(rating), 0) for rating in range(1, scale + 1))
+    rows = Comment.objects.filter(post=pk).order_by().values_list('rating').annotate(n=Count('id'))
+    count = total = 0
+    for rating, n in rows:
+        if rating < 1:
+            continue
+        # ratings above the scale count as its maximum, as for trending and similar posts
+        rating = min(rating, scale)
+        distribution[str(rating)] += n
+        count += n
+        total += rating * n
+    return OrderedDict((
+        ('count', count),
+        ('average', round(float(total) / count, 2) if count else None),
+        ('distribution', distribution),
+    ))
+
+
+def build(pk, context, threads=None, bookings=None):
+    """ OrderedDict of all SECTIONS of the post ``pk`` """
+    threads = threads or getattr(django_settings, 'BUNDLE_COMMENT_THREADS', 10)
+    bookings = bookings or getattr(django_settings, 'BUNDLE_UPCOMING_BOOKINGS', 20)
+    request = context.get('request')
+    # hyperlinks depend on the host and format of the request
+    origin = '%s:%s' % (request.build_absolute_uri('/') if request else '', context.get('format'))
+
+    budget = QueryBudget(getattr(django_settings, 'BUNDLE_QUERY_BUDGET', 8),
+                         getattr(django_settings, 'BUNDLE_QUERY_BUDGET_STRICT', django_settings.DEBUG),
+                         name='post %s bundle' % pk)
+    with budget:
+        bundle = OrderedDict()
+        bundle['post'] = _cached(pk, 'post', origin, lambda: post_section(pk, context))
+        bundle['comments'] = _cached(pk, 'comments', threads, lambda: comments_section(pk, threads, context))
+        bundle['bookings'] = _cached(pk, 'bookings', bookings, lambda: bookings_section(pk, bookings, context))
+        bundle['ratings'] = _cached(pk, 'ratings', '', lambda: ratings_section(pk))
+    return bundle
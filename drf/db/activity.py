@@ -0,0 +1,37 @@
+"""
+What other sessions of the database are doing, from ``pg_stat_activity``.
+Timestamps such as ``updated`` or ``Change.created`` are taken before their
+row commits, so readers walking them in order (drf/exports.py, drf/sync.py)
+must not move past the start of the oldest transaction still open. Sessions
+of other database users only show when the user may read all statistics
+(pg_read_all_stats).
+"""
+
+from datetime import timedelta
+
+from django.db import connections, router
+from django.utils import timezone
+
+
+def oldest_transaction_start(using):
+    """ the start of the oldest transaction open in another session of ``using``'s database, or None """
+    cursor = connections[using].cursor()
+    try:
+        cursor.execute('''
+            SELECT min(xact_start) FROM pg_stat_activity
+            WHERE datname = current_database() AND backend_type = 'client backend' AND pid <> pg_backend_pid()
+        ''')
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def settled(model, seconds):
+    """
+    The time before which every row of ``model`` has committed, give or take
+    ``seconds`` of clock skew and stamping ahead of the transaction: ``seconds``
+    before now or before the oldest open transaction, whichever is earlier.
+    """
+    now = timezone.now()
+    oldest = oldest_transaction_start(router.db_for_write(model))
+    return min(now, oldest or now) - timedelta(seconds=seconds)
@@ -0,0 +1,30 @@
+"""
+PostGIS backend whose connections come from the worker's drf.db.pool.
+Connections are returned to the pool where Django would close them (end of
+request with CONN_MAX_AGE = 0). Pool options live in ``DATABASES[alias]['POOL']``.
+"""
+
+from django.contrib.gis.db.backends.postgis.base import DatabaseWrapper as PostGISDatabaseWrapper
+
+from drf.db.pool import PooledConnection, get_pool
+
+
+class DatabaseWrapper(PostGISDatabaseWrapper):
+
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        def connect():
+            connection = super(DatabaseWrapper, self).get_new_connection(conn_params)
+            return PooledConnection(connection, self.isolation_level)
+
+        # checked in to the same pool, even when the settings changed meanwhile
+        self._pool = self.pool()
+        item = self._pool.checkout(connect)
+        self.isolation_level = item.isolation_level
+        return item.connection
+
+    def _close(self):
+        if self.connection is not None:
+            (getattr(self, '_pool', None) or self.pool()).checkin(self.connection)
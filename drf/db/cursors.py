@@ -0,0 +1,28 @@
+"""
+Server-side (named) cursors for streaming large querysets in constant memory.
+Django 1.8's ``QuerySet.iterator()`` still fetches the whole result set into
+the client, so rows are read through a psycopg2 named cursor instead.
+"""
+
+import uuid
+
+from django.db import connections, transaction
+
+
+def stream_rows(queryset, fields, itersize=2000):
+    """
+    Yield ``values_list(*fields)`` tuples of ``queryset`` fetched ``itersize``
+    rows at a time. Runs in a transaction for as long as the generator is consumed.
+    """
+    sql, params = queryset.values_list(*fields).query.sql_with_params()
+    connection = connections[queryset.db]
+    with transaction.atomic(using=queryset.db):
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(name='stream_%s' % uuid.uuid4().hex)
+        cursor.itersize = itersize
+        try:
+            cursor.execute(sql, params)
+            for row in cursor:
+                yield row
+        finally:
+            cursor.close()
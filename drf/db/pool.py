@@ -0,0 +1,193 @@
+"""
+A small bounded connection pool shared by all threads or greenlets of a worker.
+Checkout blocks for at most ``TIMEOUT`` seconds when every connection is in
+use; idle connections are health checked before reuse and recycled after
+``MAX_LIFETIME``. The queue is built on ``threading`` primitives, so it is
+cooperative once gevent has monkey patched the worker; ``patch_psycopg`` makes
+psycopg2 itself yield to other greenlets while waiting on the server.
+"""
+
+import os
+import time
+
+import psycopg2
+from psycopg2 import extensions
+from django.utils.six.moves import queue
+
+from drf import metrics
+
+DEFAULTS = {
+    'SIZE': 10,
+    'TIMEOUT': 5.0,
+    'HEALTH_CHECK_INTERVAL': 30.0,
+    'MAX_LIFETIME': 1800.0,
+}
+
+# a pool only hands out connections made with the same settings
+CONNECTION_SETTINGS = ('NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')
+
+_pools = {}
+
+
+class PooledConnection(object):
+
+    def __init__(self, connection, isolation_level):
+        self.connection = connection
+        self.isolation_level = isolation_level
+        self.created = self.last_used = time.time()
+
+
+class ConnectionPool(object):
+    """
+    ``size`` slots, each either empty (None) or holding an idle connection.
+    Holding a slot is what bounds the number of open connections.
+    """
+
+    def __init__(self, alias, size, timeout, health_check_interval, max_lifetime):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+        self.retired = False
+        self.slots = queue.LifoQueue()
+        for i in range(size):
+            self.slots.put(None)
+        self.in_use = {}
+        self.stats = {'created': 0, 'discarded': 0, 'checkouts': 0, 'timeouts': 0}
+
+    def checkout(self, connect):
+        """ Return a usable PooledConnection, calling ``connect`` to open a new one if needed """
+        start = time.time()
+        try:
+            item = self.slots.get(timeout=self.timeout)
+        except queue.Empty:
+            self.stats['timeouts'] += 1
+            raise psycopg2.OperationalError(
+                'connection pool %r exhausted: no connection free after %.1fs' % (self.alias, self.timeout))
+        metrics.observe('drf_db_pool_wait_seconds', time.time() - start, alias=self.alias)
+
+        try:
+            if item is not None and not self.healthy(item):
+                self.close(item)
+                item = None
+            if item is None:
+                item = connect()
+                self.stats['created'] += 1
+        except Exception:
+            self.slots.put(None)
+            raise
+
+        self.stats['checkouts'] += 1
+        self.in_use[id(item.connection)] = item
+        return item
+
+    def checkin(self, connection):
+        item = self.in_use.pop(id(connection), None)
+        if item is None or self.retired:
+            connection.close()
+            return
+        try:
+            if connection.closed:
+                raise psycopg2.InterfaceError('connection already closed')
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            self.close(item)
+            self.slots.put(None)
+            return
+        item.last_used = time.time()
+        self.slots.put(item)
+
+    def healthy(self, item):
+        now = time.time()
+        if item.connection.closed or now - item.created > self.max_lifetime:
+            return False
+        if now - item.last_used > self.health_check_interval:
+            try:
+                cursor = item.connection.cursor()
+                cursor.execute('SELECT 1')
+                cursor.close()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def close(self, item):
+        self.stats['discarded'] += 1
+        try:
+            item.connection.close()
+        except psycopg2.Error:
+            pass
+
+    def retire(self):
+        """ Close the idle connections; the ones in use are closed when checked in """
+        self.retired = True
+        while True:
+            try:
+                item = self.slots.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.close(item)
+
+    def gauges(self):
+        return {
+            'size': self.size,
+            'in_use': len(self.in_use),
+            'idle': len([item for item in list(self.slots.queue) if item is not None]),
+        }
+
+
+def _pool_key(alias, settings_dict):
+    options = settings_dict.get('OPTIONS') or {}
+    return ((alias,) + tuple(settings_dict.get(name) for name in CONNECTION_SETTINGS) +
+            (tuple(sorted((name, repr(value)) for name, value in options.items())),))
+
+
+def get_pool(alias, settings_dict):
+    key = _pool_key(alias, settings_dict)
+    pool = _pools.get(key)
+    if pool is None or pool.pid != os.getpid():
+        for other in [other for other in _pools if other[0] == alias]:
+            # settings changed, e.g. to the test database; never close the connections of a forked parent
+            previous = _pools.pop(other)
+            if previous.pid == os.getpid():
+                previous.retire()
+        options = dict(DEFAULTS, **settings_dict.get('POOL', {}))
+        pool = _pools[key] = ConnectionPool(
+            alias, options['SIZE'], options['TIMEOUT'], options['HEALTH_CHECK_INTERVAL'], options['MAX_LIFETIME'])
+    return pool
+
+
+def _pool_values(label, values):
+    return [(dict(alias=pool.alias, **{label: key}), value)
+            for pool in list(_pools.values()) if pool.pid == os.getpid()
+            for key, value in values(pool).items()]
+
+
+metrics.register_gauge('drf_db_pool_connections', 'Pooled connections by state.',
+                       lambda: _pool_values('state', lambda pool: pool.gauges()))
+metrics.register_gauge('drf_db_pool_events', 'Connections created and discarded, checkouts and checkout timeouts.',
+                       lambda: _pool_values('event', lambda pool: pool.stats))
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """ psycopg2 wait callback yielding to the gevent hub, as in psycogreen """
+    from gevent.socket import wait_read, wait_write
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError('Bad result from poll: %r' % state)
+
+
+def patch_psycopg():
+    """ Make psycopg2 cooperative, call in gevent workers (gunicorn post_fork) """
+    extensions.set_wait_callback(gevent_wait_callback)
@@ -0,0 +1,155 @@
+"""
+Booking events for server-sent event streams.
+Model hooks (drf/signals.py) publish ``booking.created``, ``booking.updated``
+and ``booking.status`` events on the channels ``post:<id>`` and
+``author:<id>`` (guest and host). Subscribers are the open streams of this
+worker; ``EVENTS_TRANSPORT`` decides how events reach the other workers:
+    'local'     dispatch in this process only (development, tests)
+    'postgres'  NOTIFY on commit, every worker LISTENs on one dedicated
+                connection, so all workers of all hosts see every event
+"""
+
+import itertools
+import json
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+from django.conf import settings as django_settings
+from django.db import connection, connections
+from django.utils.six.moves import queue
+
+logger = logging.getLogger(__name__)
+
+PG_CHANNEL = 'drf_events'
+
+
+class Broker(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.ids = itertools.count(1)
+        self.listener = None
+
+    def subscribe(self, channels):
+        subscription = queue.Queue(maxsize=1000)
+        with self.lock:
+            for channel in channels:
+                self.subscribers.setdefault(channel, set()).add(subscription)
+        if _transport() == 'postgres':
+            self.ensure_listener()
+        return subscription
+
+    def unsubscribe(self, channels, subscription):
+        with self.lock:
+            for channel in channels:
+                self.subscribers.get(channel, set()).discard(subscription)
+                if not self.subscribers.get(channel):
+                    self.subscribers.pop(channel, None)
+
+    def dispatch(self, channels, event):
+        event = dict(event, id=next(self.ids))
+        with self.lock:
+            targets = set()
+            for channel in channels:
+                targets.update(self.subscribers.get(channel, ()))
+        for subscription in targets:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # a stalled client must not block the publisher, it resyncs on reconnect
+                pass
+
+    def publish(self, channels, event):
+        if _transport() == 'postgres':
+            cursor = connection.cursor()
+            cursor.execute('SELECT pg_notify(%s, %s)', [PG_CHANNEL, json.dumps({'channels': channels, 'event': event})])
+        else:
+            self.dispatch(channels, event)
+
+    def ensure_listener(self):
+        with self.lock:
+            if self.listener is None or not self.listener.is_alive():
+                self.listener = threading.Thread(target=self.listen, name='drf-events-listener')
+                self.listener.daemon = True
+                self.listener.start()
+
+    def listen(self):
+        """ LISTEN on a dedicated connection and dispatch notifications, reconnecting on errors """
+        while True:
+            try:
+                conn = psycopg2.connect(**connections['default'].get_connection_params())
+                conn.autocommit = True
+                conn.cursor().execute('LISTEN %s' % PG_CHANNEL)
+                while True:
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        message = json.loads(notify.payload)
+                        self.dispatch(message['channels'], message['event'])
+            except Exception:
+                logger.exception('booking event listener failed, reconnecting')
+                time.sleep(1)
+
+
+def _transport():
+    return getattr(django_settings, 'EVENTS_TRANSPORT', 'local')
+
+
+broker = Broker()
+
+
+def booking_event(booking, host_id, previous_status=None):
+    """ (channels, event) describing a saved booking """
+    if previous_status is None:
+        kind = 'booking.created'
+    elif previous_status != booking.status:
+        kind = 'booking.status'
+    else:
+        kind = 'booking.updated'
+    event = {
+        'type': kind,
+        'booking': {
+            'id': booking.pk,
+            'post': booking.post_id,
+            'author': booking.author_id,
+            'title': booking.title,
+            'begin': booking.begin.isoformat(),
+            'end': booking.end.isoformat(),
+            'status': booking.status,
+            'updated': booking.updated.isoformat(),
+        },
+    }
+    if kind == 'booking.status':
+        event['previous_status'] = previous_status
+    channels = ['post:%s' % booking.post_id, 'author:%s' % booking.author_id]
+    if host_id != booking.author_id:
+        channels.append('author:%s' % host_id)
+    return channels, event
+
+
+def stream(channels, timeout=None, heartbeat=None):
+    """
+    Generator of server-sent event frames for ``channels``. Ends after
+    ``EVENTS_STREAM_TIMEOUT`` seconds, EventSource clients reconnect by themselves.
+    """
+    timeout = timeout or getattr(django_settings, 'EVENTS_STREAM_TIMEOUT', 300)
+    heartbeat = heartbeat or getattr(django_settings, 'EVENTS_HEARTBEAT', 15)
+    subscription = broker.subscribe(channels)
+    deadline = time.time() + timeout
+    try:
+        yield 'retry: 3000\n\n'
+        while time.time() < deadline:
+            try:
+                event = subscription.get(timeout=min(heartbeat, max(deadline - time.time(), 0.01)))
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield 'id: %d\nevent: %s\ndata: %s\n\n' % (event['id'], event['type'], json.dumps(event))
+    finally:
+        broker.unsubscribe(channels, subscription)
@@ -0,0 +1,143 @@
+"""
+Bulk export of posts, comments, bookings and locations as NDJSON or CSV, for
+``manage.py exportdata`` and the admin only ``/api/v1/export/<model>/``.
+Rows are read through a server-side cursor (drf/db/cursors.py) and encoded
+as they arrive, so memory use stays flat however large the table is.
+
+An export covers a window of ``updated``: since < updated <= until, ordered
+by (updated, id) along the indexes of migration 0015. ``updated`` is stamped
+before the row commits, by as much as the writing transaction lasts (an
+import stamps its rows with the start of its transaction). So ``until``
+defaults to ``EXPORT_SETTLE_SECONDS`` before now or before the start of the
+oldest transaction still open, whichever is earlier: rows of transactions in
+flight land in a later window, and starting the next export at the ``until``
+of the last one picks up what changed in between. This needs the database
+user to see the other sessions in pg_stat_activity (the same user, or a
+member of pg_read_all_stats); ``until`` given by hand is taken as is.
+Deleted rows are not exported, the delta sync (drf/sync.py) keeps their
+tombstones.
+"""
+
+import csv
+import io
+from collections import OrderedDict
+from datetime import timedelta
+
+import simplejson
+from django.conf import settings as django_settings
+from django.contrib.gis.geos import GEOSGeometry
+from django.utils import six, timezone
+from django.utils.dateparse import parse_datetime
+
+from drf.db import activity
+from drf.db.cursors import stream_rows
+from drf.models import Post, Comment, Booking, Location
+from drf.renderers import _datetime, _default
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# foreign keys are exported as ids
+EXPORTS = OrderedDict((
+    ('post', (Post, ('id', 'author', 'location', 'title', 'content', 'price', 'capacity', 'city', 'posttype',
+                     'created', 'updated'))),
+    ('comment', (Comment, ('id', 'author', 'post', 'parent', 'content', 'rating', 'status', 'created', 'updated'))),
+    ('booking', (Booking, ('id', 'author', 'post', 'begin', 'end', 'title', 'status', 'version', 'created',
+                           'updated'))),
+    ('location', (Location, ('id', 'address', 'geometry', 'created', 'updated'))),
+))
+
+# a named cursor hands out geometries as hex EWKB; exported as WKT, POINT (lat lng)
+CONVERTERS = {
+    'geometry': lambda value: GEOSGeometry(value).wkt if value else None,
+}
+
+CHUNK_ROWS = 1000
+
+
+def parse_time(value):
+    """ an aware datetime from ISO 8601, UTC when without offset; None for None """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError('%s is not an ISO 8601 date and time' % value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.utc)
+    return parsed
+
+
+def default_until():
+    """ EXPORT_SETTLE_SECONDS before now or before the oldest open transaction, whichever is earlier """
+    return activity.settled(Post, getattr(django_settings, 'EXPORT_SETTLE_SECONDS', 5))
+
+
+def window(name, since=None, until=None):
+    """ the rows of ``name`` updated in (since, until], in export order """
+    model, fields = EXPORTS[name]
+    queryset = model.objects.filter(updated__lte=until or default_until())
+    if since is not None:
+        queryset = queryset.filter(updated__gt=since)
+    return queryset.order_by('updated', 'pk')
+
+
+def _ndjson(fields):
+    def encode(row):
+        return simplejson.dumps(OrderedDict(zip(fields, row)), default=_default, use_decimal=True,
+                                ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+    return encode
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'utcoffset'):
+        return _datetime(value)
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def _csv(fields):
+    buffer = io.BytesIO() if six.PY2 else io.StringIO()
+    writer = csv.writer(buffer)
+
+    def encode(row):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([_csv_value(value) for value in row])
+        line = buffer.getvalue()
+        return line if six.PY2 else line.encode('utf-8')
+    return encode
+
+
+def export(name, format='ndjson', since=None, until=None, stats=None):
+    """
+    Generator of the encoded chunks of an export of ``name`` in ``format``
+    (see FORMATS); counts the rows in ``stats['rows']`` when given.
+    """
+    model, fields = EXPORTS[name]
+    encode = _ndjson(fields) if format == 'ndjson' else _csv(fields)
+    if format == 'csv':
+        yield encode(fields)
+    converters = [(n, CONVERTERS[field]) for n, field in enumerate(fields) if field in CONVERTERS]
+    rows = stream_rows(window(name, since, until), fields,
+                       itersize=getattr(django_settings, 'EXPORT_ITERSIZE', 2000))
+    chunk = []
+    for row in rows:
+        if converters:
+            row = list(row)
+            for n, convert in converters:
+                row[n] = convert(row[n])
+        chunk.append(encode(row))
+        if len(chunk) == CHUNK_ROWS:
+            if stats is not None:
+                stats['rows'] = stats.get('rows', 0) + len(chunk)
+            yield b''.join(chunk)
+            chunk = []
+    if chunk:
+        if stats is not None:
+            stats['rows'] = stats.get('rows', 0) + len(chunk)
+        yield b''.join(chunk)
@@ -0,0 +1,101 @@
+"""
+Facet counts for the post search UI.
+All facets of a filtered post queryset are counted in one grouped query
+(GROUPING SETS) and cached per filter signature. The cache is invalidated
+by bumping a generation number whenever a post (or a comment, which the
+``min_rating`` filter depends on) changes.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import connections
+
+GENERATION_KEY = 'post-facets:generation'
+
+# query parameters which do not change the facet counts
+IGNORED_PARAMS = ('page', 'page_size', 'format', 'facets')
+
+
+def _buckets(column, edges):
+    """ SQL CASE expression labelling ``column`` with its bucket, e.g. '100-500' or '5000+' """
+    whens = ' '.join("WHEN %s < %s THEN '%s-%s'" % (column, float(high), low, high)
+                     for low, high in zip(edges, edges[1:]))
+    return "CASE %s ELSE '%s+' END" % (whens, edges[-1])
+
+
+def _labels(edges):
+    return ['%s-%s' % (low, high) for low, high in zip(edges, edges[1:])] + ['%s+' % edges[-1]]
+
+
+def count(queryset):
+    """ {'count': n, 'city': {...}, 'posttype': {...}, 'price': {...}, 'capacity': {...}} """
+    price_edges = getattr(django_settings, 'POST_FACET_PRICE_BUCKETS', (0, 100, 500, 1000, 5000))
+    capacity_edges = getattr(django_settings, 'POST_FACET_CAPACITY_BUCKETS', (0, 5, 10, 20, 50, 100))
+
+    inner, params = queryset.order_by().values('id', 'city', 'posttype', 'price', 'capacity').distinct().query.sql_with_params()
+    sql = '''
+        SELECT city, posttype, price_bucket, capacity_bucket, COUNT(*)
+        FROM (
+            SELECT city, posttype, %s AS price_bucket, %s AS capacity_bucket
+            FROM (%s) AS filtered
+        ) AS bucketed
+        GROUP BY GROUPING SETS ((city), (posttype), (price_bucket), (capacity_bucket), ())
+    ''' % (_buckets('price', price_edges), _buckets('capacity', capacity_edges), inner)
+
+    cursor = connections[queryset.db].cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    facets = OrderedDict((
+        ('count', 0),
+        ('city', OrderedDict()),
+        ('posttype', OrderedDict()),
+        ('price', OrderedDict((label, 0) for label in _labels(price_edges))),
+        ('capacity', OrderedDict((label, 0) for label in _labels(capacity_edges))),
+    ))
+    for city, posttype, price, capacity, n in sorted(rows, key=lambda row: -row[4]):
+        # exactly one grouping column is set, none for the grand total
+        if city is not None:
+            facets['city'][city] = n
+        elif posttype is not None:
+            facets['posttype'][posttype] = n
+        elif price is not None:
+            facets['price'][price] = n
+        elif capacity is not None:
+            facets['capacity'][capacity] = n
+        else:
+            facets['count'] = n
+    return facets
+
+
+def signature(params):
+    items = sorted((key, sorted(params.getlist(key))) for key in params if key not in IGNORED_PARAMS)
+    return hashlib.sha1(json.dumps(items).encode('utf-8')).hexdigest()
+
+
+def cached_count(queryset, params):
+    """ ``count`` cached per filter signature of the query parameters """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = 1
+        cache.add(GENERATION_KEY, generation, None)
+    key = 'post-facets:%s:%s' % (generation, signature(params))
+    facets = cache.get(key)
+    if facets is None:
+        facets = count(queryset)
+        cache.set(key, facets, getattr(django_settings, 'POST_FACETS_CACHE_TIMEOUT', 300))
+    return facets
+
+
+def invalidate():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
@@ -0,0 +1,220 @@
+"""
+Read-only list serializers working on ``QuerySet.values()`` rows.
+Each one mirrors a ModelSerializer of drf/serializers.py: the fields of that
+serializer are compiled once into (values lookup, converter) pairs, so a list
+page costs one query for the rows plus one batched query per relation, and no
+model instances or DRF field objects per row. The output is the same as the
+ModelSerializer's, which the tests check byte for byte; related lists are in
+primary key order on both sides (PkOrdered* of drf/serializers.py).
+Views opt in with ``values_serializer_class`` (drf/views.py ValuesListMixin)
+while the ``FAST_LIST_SERIALIZERS`` setting is on (off by default).
+"""
+
+import decimal
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
+from rest_framework import ISO_8601, fields, relations, serializers
+from rest_framework_gis.fields import GeoJsonDict, GeometryField
+
+from drf.models import PostImage, Location, Comment
+from drf.serializers import PostSerializer, PostImageSerializer, CommentSerializer, BookingSerializer, LocationSerializer
+
+
+def _identity(value):
+    return value
+
+
+def _decimal(field):
+    context = decimal.getcontext().copy()
+    context.prec = field.max_digits
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(six.text_type(value).strip())
+        quantized = value.quantize(exponent, context=context)
+        return '{0:f}'.format(quantized) if field.coerce_to_string else quantized
+    return convert
+
+
+def _datetime(field):
+    if field.format is None:
+        return _identity
+    if field.format.lower() == ISO_8601:
+        def convert(value):
+            value = value.isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return convert
+    return lambda value: value.strftime(field.format)
+
+
+def _geometry(value):
+    if isinstance(value, dict):
+        return value
+    return GeoJsonDict((
+        ('type', value.geom_type),
+        ('coordinates', value.coords),
+    ))
+
+
+def _hyperlink(field, context):
+    request = context.get('request')
+    format = context.get('format')
+    if format and field.format and field.format != format:
+        format = field.format
+    return lambda value: field.reverse(field.view_name, kwargs={field.lookup_url_kwarg: value},
+                                       request=request, format=format)
+
+
+def compile_field(field, context):
+    """ (values lookup, converter) of a serializer field """
+    lookup = '__'.join(field.source_attrs)
+    if isinstance(field, relations.HyperlinkedIdentityField):
+        return field.lookup_field, _hyperlink(field, context)
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        # values() of a foreign key is its primary key
+        return lookup, _identity
+    if isinstance(field, fields.ReadOnlyField):
+        return lookup, _identity
+    if isinstance(field, fields.DecimalField):
+        return lookup, _decimal(field)
+    if isinstance(field, fields.DateTimeField):
+        return lookup, _datetime(field)
+    if isinstance(field, (fields.CharField, fields.IntegerField)):
+        return lookup, field.to_representation
+    if isinstance(field, GeometryField):
+        return lookup, _geometry
+    raise ImproperlyConfigured('%s can not be compiled to a values converter' % field.__class__.__name__)
+
+
+class ValuesSerializer(object):
+    """
+    Compiles ``serializer_class``. Fields without a plain converter are
+    filled per page by a ``related_<field name>(rows)`` method returning
+    {row id: value}; many=True primary key fields get one automatically.
+    """
+    serializer_class = None
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        self.model = self.serializer_class.Meta.model
+        self.fields = []
+        self.lookups = ['id']
+        for name, field in self.get_fields().items():
+            if field.write_only:
+                continue
+            if hasattr(self, 'related_%s' % name):
+                related = getattr(self, 'related_%s' % name)
+            elif isinstance(field, relations.ManyRelatedField) and \
+                    isinstance(field.child_relation, relations.PrimaryKeyRelatedField):
+                related = self.related_pks(field.source)
+            else:
+                lookup, convert = compile_field(field, self.context)
+                if lookup not in self.lookups:
+                    self.lookups.append(lookup)
+                self.fields.append((name, lookup, convert, None))
+                continue
+            self.fields.append((name, None, None, related))
+
+    def get_fields(self):
+        return self.serializer_class(context=self.context).fields
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def related_pks(self, source):
+        """ {row id: [related pk, ...]} of a reverse foreign key in one query """
+        field = self.model._meta.get_field(source).field
+
+        def related(rows):
+            pks = dict((row['id'], []) for row in rows)
+            queryset = field.model._default_manager.filter(**{'%s__in' % field.name: list(pks)}).order_by('pk')
+            for owner, pk in queryset.values_list(field.attname, 'pk'):
+                pks[owner].append(pk)
+            return pks
+        return related
+
+    def serialize(self, rows):
+        """ list of OrderedDicts for ``rows`` of ``values(queryset)`` """
+        rows = list(rows)
+        related = dict((name, fetch(rows)) for name, lookup, convert, fetch in self.fields if fetch and rows)
+        data = []
+        for row in rows:
+            item = OrderedDict()
+            for name, lookup, convert, fetch in self.fields:
+                if fetch:
+                    item[name] = related[name].get(row['id'])
+                else:
+                    value = row[lookup]
+                    item[name] = None if value is None else convert(value)
+            data.append(item)
+        return data
+
+
+class FeatureValuesSerializer(ValuesSerializer):
+    """ GeoJSON features like rest_framework_gis' GeoFeatureModelSerializer """
+
+    def serialize(self, rows):
+        meta = self.serializer_class.Meta
+        features = []
+        for item in super(FeatureValuesSerializer, self).serialize(rows):
+            feature = OrderedDict()
+            if meta.id_field:
+                feature['id'] = item.pop(meta.id_field)
+            feature['type'] = 'Feature'
+            feature['geometry'] = item.pop(meta.geo_field)
+            if getattr(meta, 'bbox_geo_field', None):
+                bbox = item.pop(meta.bbox_geo_field)
+                feature['bbox'] = bbox.extent if hasattr(bbox, 'extent') else None
+            feature['properties'] = item
+            features.append(feature)
+        return features
+
+
+class LocationValuesSerializer(FeatureValuesSerializer):
+    serializer_class = LocationSerializer
+
+
+class PostValuesSerializer(ValuesSerializer):
+    serializer_class = PostSerializer
+
+    def __init__(self, context=None):
+        super(PostValuesSerializer, self).__init__(context)
+        self.lookups.append('location')
+
+    def related_images(self, rows):
+        # few per post and their thumbnails need sorl, so these go through PostImageSerializer
+        images = dict((row['id'], []) for row in rows)
+        queryset = PostImage.objects.filter(post__in=list(images)).select_related('author').order_by('pk')
+        instances = list(queryset)
+        for image, item in zip(instances, PostImageSerializer(instances, many=True, context=self.context).data):
+            images[image.post_id].append(item)
+        return images
+
+    def related_location(self, rows):
+        serializer = LocationValuesSerializer(self.context)
+        locations = serializer.values(Location.objects.filter(pk__in=set(row['location'] for row in rows)))
+        locations = list(locations)
+        features = dict((location['id'], feature)
+                        for location, feature in zip(locations, serializer.serialize(locations)))
+        return dict((row['id'], features.get(row['location'])) for row in rows)
+
+
+class CommentValuesSerializer(ValuesSerializer):
+    serializer_class = CommentSerializer
+
+    def related_children(self, rows):
+        # one query per level of the comment tree
+        children = dict((row['id'], []) for row in rows)
+        replies = list(self.values(Comment.objects.filter(parent__in=list(children)).order_by('pk')))
+        for reply, item in zip(replies, self.serialize(replies)):
+            children[reply['parent']].append(item)
+        return children
+
+
+class BookingValuesSerializer(ValuesSerializer):
+    serializer_class = BookingSerializer
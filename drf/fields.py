@@ -30,8 +30,11 @@ Example Usage:
     ]
 """
 
+from django.conf import settings as django_settings
+from django.core.cache import cache
 from rest_framework import serializers
-from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
 
 
 class HyperlinkedSorlImageField(serializers.ImageField):
@@ -46,12 +49,16 @@ class HyperlinkedSorlImageField(serializers.ImageField):
             options (Optional[dict]): A dict of sorl options.
             *args: (Optional) Default serializers.ImageField arguments.
             **kwargs: (Optional) Default serializers.ImageField keyword
-            arguments.
+            arguments. Pass ``defer=True`` to never render a missing
+            thumbnail inside the request; the original image is returned
+            and the ``generate_thumbnails`` job of the image, the one
+            queued when it is saved, renders every size instead.
         For a description of sorl geometry strings and additional sorl options,
         please see https://sorl-thumbnail.readthedocs.org/en/latest/examples.html?highlight=geometry#low-level-api-examples
         """  # NOQA
         self.geometry_string = geometry_string
         self.options = options
+        self.defer = kwargs.pop('defer', False)
 
         super(HyperlinkedSorlImageField, self).__init__(*args, **kwargs)
 
@@ -66,15 +73,28 @@ class HyperlinkedSorlImageField(serializers.ImageField):
         if not value:
             return None
 
+        if self.defer and not default.kvstore.get(ImageFile(value)):
+            # sorl records the source image once its thumbnails exist; the same
+            # job as queue_thumbnails, so a still queued one is reused. The
+            # cache remembers the job for a while, so the queue is not read
+            # for every image of every request meanwhile
+            if cache.add('thumbnails-queued:%d' % value.instance.pk, True,
+                         getattr(django_settings, 'JOBS_STALE_TIMEOUT', 600)):
+                from drf.jobs import enqueue
+                enqueue('drf.tasks.generate_thumbnails', (value.instance.pk,), unique=True)
+            return self.absolute_url(value.url)
+
         image = get_thumbnail(value, self.geometry_string, **self.options)
+        return self.absolute_url(image.url)
+    to_native = to_representation
 
+    def absolute_url(self, url):
         try:
             request = self.context.get('request', None)
-            return request.build_absolute_uri(image.url)
+            return request.build_absolute_uri(url)
         except:
             try:
-                return super(HyperlinkedSorlImageField, self).to_representation(image.url)
+                return super(HyperlinkedSorlImageField, self).to_representation(url)
             except AttributeError:  # NOQA
-                return super(HyperlinkedSorlImageField, self).to_native(image.url)  # NOQA
-    to_native = to_representation
+                return super(HyperlinkedSorlImageField, self).to_native(url)  # NOQA
 
@@ -0,0 +1,49 @@
+"""
+Distance queries in meters on ``Location.geography``.
+
+Locations are stored as POINT(lat lng) in SRID 4326 (see
+tasks.geocode_location), so distances on ``geometry`` are in degrees of a
+swapped plane. ``geography`` holds the same shapes with (lng lat) axes as the
+geography type: ST_DWithin and ``<->`` on it are exact in meters on the
+spheroid and use its own spatial index. A trigger of migration 0013 keeps it
+in step with ``geometry`` on every INSERT and UPDATE, including bulk ones.
+"""
+
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from rest_framework.exceptions import ParseError
+from rest_framework.filters import BaseFilterBackend
+
+
+def point(lat, lng):
+    """ a point to compare with ``geography`` """
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('%s,%s is not a lat,lng pair' % (lat, lng))
+    return Point(lng, lat, srid=4326)
+
+
+def within(queryset, field, lat, lng, meters):
+    """ the rows of ``queryset`` whose geography ``field`` is at most ``meters`` from lat,lng """
+    return queryset.filter(**{'%s__dwithin' % field: (point(lat, lng), D(m=meters))})
+
+
+class DistanceFilter(BaseFilterBackend):
+    """
+    ``point=<lat>,<lng>&dist=<meters>`` (dist defaults to 1000) on the
+    geography field ``distance_filter_field`` of the view, e.g.
+    ``location__geography`` for posts
+    """
+    point_param = 'point'
+    dist_param = 'dist'
+
+    def filter_queryset(self, request, queryset, view):
+        field = getattr(view, 'distance_filter_field', None)
+        value = request.query_params.get(self.point_param)
+        if not field or not value:
+            return queryset
+        try:
+            lat, lng = (float(n) for n in value.split(','))
+            meters = float(request.query_params.get(self.dist_param, 1000))
+            return within(queryset, field, lat, lng, meters)
+        except ValueError:
+            raise ParseError('%s must be <lat>,<lng> and %s meters' % (self.point_param, self.dist_param))
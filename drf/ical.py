@@ -0,0 +1,88 @@
+"""
+iCalendar (RFC 5545) feeds of bookings, streamed from a server-side cursor.
+"""
+
+import calendar
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings as django_settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from drf import partitions
+from drf.db.cursors import stream_rows
+
+STATUSES = {
+    'proposed': 'TENTATIVE',
+    'confirmed': 'CONFIRMED',
+    'cancelled': 'CANCELLED',
+}
+
+FIELDS = ('id', 'title', 'begin', 'end', 'status', 'created', 'updated')
+
+
+def window(queryset):
+    """ bookings a calendar client cares about: not older than ICS_PAST_DAYS """
+    days = getattr(django_settings, 'ICS_PAST_DAYS', 90)
+    return partitions.ending_after(queryset, timezone.now() - timedelta(days=days)).order_by('begin')
+
+
+def version(queryset):
+    """ (etag, last modified) of a booking feed, from one aggregate query """
+    state = queryset.order_by().aggregate(last=Max('updated'), count=Count('id'))
+    etag = '"%s"' % hashlib.sha1(('%s:%s' % (state['last'], state['count'])).encode('utf-8')).hexdigest()
+    return etag, state['last']
+
+
+def timestamp(value):
+    return calendar.timegm(value.utctimetuple())
+
+
+def _escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _datetime(value):
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _fold(line):
+    """ lines are folded after 75 octets, continuation lines start with a space """
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return data + b'\r\n'
+    chunks = []
+    while data:
+        size = 75 if not chunks else 74
+        # don't split a multi-byte character
+        while size < len(data) and (ord(data[size:size + 1]) & 0xC0) == 0x80:
+            size -= 1
+        chunks.append(data[:size])
+        data = data[size:]
+    return b'\r\n '.join(chunks) + b'\r\n'
+
+
+def feed(queryset, name):
+    """ generator of the encoded lines of a VCALENDAR of the bookings in ``queryset`` """
+    domain = django_settings.DJOSER.get('DOMAIN', 'webizcafe')
+    yield _fold('BEGIN:VCALENDAR')
+    yield _fold('VERSION:2.0')
+    yield _fold('PRODID:-//webizcafe//bookings//EN')
+    yield _fold('CALSCALE:GREGORIAN')
+    yield _fold('X-WR-CALNAME:%s' % _escape(name))
+    for pk, title, begin, end, status, created, updated in stream_rows(queryset, FIELDS):
+        lines = (
+            'BEGIN:VEVENT',
+            'UID:booking-%s@%s' % (pk, domain),
+            'DTSTAMP:%s' % _datetime(updated),
+            'CREATED:%s' % _datetime(created),
+            'LAST-MODIFIED:%s' % _datetime(updated),
+            'DTSTART:%s' % _datetime(begin),
+            'DTEND:%s' % _datetime(end),
+            'SUMMARY:%s' % _escape(title),
+            'STATUS:%s' % STATUSES.get(status, 'TENTATIVE'),
+            'END:VEVENT',
+        )
+        yield b''.join(_fold(line) for line in lines)
+    yield _fold('END:VCALENDAR')
@@ -0,0 +1,485 @@
+"""
+Bulk import of a partner's posts and historical bookings, run by ``manage.py
+importdata``.
+
+Input rows (CSV with a header line, or NDJSON) are streamed into temporary
+staging tables with COPY and checked there with one statement per check.
+Rows failing a check are reported as rejects (line and reason), the others
+are imported in one transaction:
+
+- locations are matched on address; new addresses get the coordinates of
+  the row (``lat``, ``lng``) or of the offline geocode file, rows without
+  any are rejected rather than geocoded online one by one;
+- posts and bookings are upserted on the ids they have in the ``source``,
+  kept in the ``ExternalKey`` table, so importing a file again updates what
+  it imported before and leaves unchanged rows alone;
+- ids of new rows are drawn from the sequences while staging, so every
+  upsert is one INSERT ... SELECT or UPDATE ... FROM.
+
+Post columns: id, author (username, else the default author), title,
+content, price, capacity, city, posttype, address, lat, lng, images ('|'
+separated image paths, or a list in NDJSON). Booking columns: id, post (the
+post's id in the source), author, title, begin, end, status, created, with
+timestamps in ISO 8601 (UTC without an offset). Geocode columns: address,
+lat, lng.
+No model signals are sent: sync changes, bundles and facets are taken care
+of here, similar posts and trending scores are left to ``manage.py
+similarposts`` and ``manage.py trending --rebuild``.
+"""
+
+import csv
+import io
+import json
+import os
+import time
+from collections import OrderedDict
+
+from django.db import connection, transaction
+from django.utils import six, timezone
+
+from drf import bundles, facets, partitions, sync, transitions
+from drf.models import Author, Post, PostImage, Booking, Location, ExternalKey
+
+POST_COLUMNS = ('id', 'author', 'title', 'content', 'price', 'capacity', 'city', 'posttype',
+                'address', 'lat', 'lng', 'images')
+BOOKING_COLUMNS = ('id', 'post', 'author', 'title', 'begin', 'end', 'status', 'created')
+GEOCODE_COLUMNS = ('address', 'lat', 'lng')
+
+PRICE = r'^\s*\d{1,6}(\.\d{1,2})?\s*$'
+CAPACITY = r'^\s*\d{1,9}\s*$'
+
+# conversions which return NULL instead of failing the statement
+FUNCTIONS = '''
+CREATE OR REPLACE FUNCTION pg_temp.import_float(value text) RETURNS double precision AS $$
+BEGIN
+    RETURN value::double precision;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION pg_temp.import_timestamptz(value text) RETURNS timestamptz AS $$
+BEGIN
+    RETURN value::timestamptz;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql STABLE;
+'''
+
+STAGING = {
+    'import_post': POST_COLUMNS + ('author_id integer', 'location_id integer', 'post_id integer',
+                                   'new boolean', 'image_list text[]', 'images_changed boolean'),
+    'import_booking': BOOKING_COLUMNS + ('post_id integer', 'author_id integer', 'booking_id integer',
+                                         'new boolean', 'begin_at timestamptz', 'end_at timestamptz',
+                                         'created_at timestamptz'),
+    'import_geocode': GEOCODE_COLUMNS,
+}
+
+
+def _column(name):
+    # staged input columns are text, the others carry their type
+    return name if ' ' in name else '"%s" text' % name
+
+
+def _default(model, name):
+    return model._meta.get_field(name).get_default()
+
+
+def _max_length(model, name):
+    return model._meta.get_field(name).max_length
+
+
+def _text(value):
+    if value is None or isinstance(value, six.text_type):
+        return value
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, (list, tuple)):
+        return u'|'.join(_text(item) for item in value)
+    return six.text_type(value)
+
+
+def _csv_lines(path):
+    if six.PY2:
+        with open(path, 'rb') as f:
+            reader = csv.reader(f)
+            for row in reader:
+                yield reader.line_num, [value.decode('utf-8') for value in row]
+    else:
+        with io.open(path, encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def read(path, columns):
+    """
+    (line, [value or None per column], None) for every row of a CSV or NDJSON
+    (.ndjson, .jsonl or .json) file, (line, None, reason) for unreadable ones
+    """
+    if path.endswith(('.ndjson', '.jsonl', '.json')):
+        with io.open(path, encoding='utf-8') as f:
+            for line, text in enumerate(f, 1):
+                if not text.strip():
+                    continue
+                try:
+                    item = json.loads(text)
+                except ValueError:
+                    yield line, None, 'invalid JSON'
+                    continue
+                if not isinstance(item, dict):
+                    yield line, None, 'not a JSON object'
+                    continue
+                yield line, [_text(item.get(column)) or None for column in columns], None
+        return
+
+    rows = _csv_lines(path)
+    try:
+        line, header = next(rows)
+    except StopIteration:
+        return
+    header = [name.strip() for name in header]
+    positions = [header.index(column) if column in header else None for column in columns]
+    for line, row in rows:
+        if not row:
+            continue
+        if len(row) != len(header):
+            yield line, None, 'expected %d fields, found %d' % (len(header), len(row))
+            continue
+        yield line, [(row[n] or None) if n is not None else None for n in positions], None
+
+
+def _copy_value(value):
+    if value is None:
+        return u'\\N'
+    return value.replace(u'\\', u'\\\\').replace(u'\t', u'\\t').replace(u'\n', u'\\n').replace(u'\r', u'\\r')
+
+
+class Import(object):
+    """
+    One import of ``source`` in the current transaction. ``log`` gets the
+    progress messages; ``counts`` and ``rejects`` ([(file, line, reason)])
+    make the report.
+    """
+
+    def __init__(self, source, default_author=None, dry_run=False, chunk=10000, log=None):
+        self.source = source
+        self.dry_run = dry_run
+        self.default_author = default_author
+        self.chunk = chunk
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.started = time.time()
+        self.counts = OrderedDict()
+        self.rejects = []
+        self.changed_posts = set()
+        self.changed_bookings = set()
+        self.touched_posts = set()
+        self.cursor = connection.cursor()
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def execute(self, sql, params=None):
+        self.cursor.execute(sql, params)
+        return self.cursor
+
+    def prepare(self):
+        # imports of one source wait for each other
+        self.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', ['drf_import:' + self.source])
+        # rows are stamped with the start of the transaction, which bounds the exports (drf/exports.py)
+        self.now = self.execute('SELECT now()').fetchone()[0]
+        self.execute(FUNCTIONS)
+        for table, columns in STAGING.items():
+            self.execute('CREATE TEMP TABLE %s (line integer, %s) ON COMMIT DROP'
+                         % (table, ', '.join(_column(name) for name in columns)))
+
+    def stage(self, path, table, columns):
+        """ COPY the rows of ``path`` into ``table`` in chunks; returns the number staged """
+        name = os.path.basename(path)
+        start, staged, batch = time.time(), 0, []
+        sql = 'COPY %s (line, %s) FROM STDIN' % (table, ', '.join('"%s"' % column for column in columns))
+
+        def copy():
+            data = u''.join(u'\t'.join([six.text_type(line)] + [_copy_value(value) for value in values]) + u'\n'
+                            for line, values in batch)
+            self.cursor.copy_expert(sql, io.BytesIO(data.encode('utf-8')))
+            self.log('%s: %d rows staged (%d rows/s)' % (
+                name, staged + len(batch), (staged + len(batch)) / max(time.time() - start, 0.001)))
+            return len(batch)
+
+        for line, values, error in read(path, columns):
+            if error:
+                self.rejects.append((name, line, error))
+                continue
+            batch.append((line, values))
+            if len(batch) == self.chunk:
+                staged += copy()
+                batch = []
+        if batch:
+            staged += copy()
+        self.execute('ANALYZE %s' % table)
+        self.count('%s rows' % table[len('import_'):], staged)
+        return staged
+
+    def reject(self, table, name, checks):
+        """ delete the staged rows of ``table`` matching the (reason, condition, params) ``checks`` """
+        for reason, condition, params in checks:
+            lines = self.execute('DELETE FROM %s s WHERE %s RETURNING line' % (table, condition), params).fetchall()
+            self.rejects.extend((name, line, reason) for line, in sorted(lines))
+
+    def _length_checks(self, fields):
+        return [('%s longer than %d characters' % (column, _max_length(model, field)),
+                 'length(s.%s) > %%s' % column, [_max_length(model, field)])
+                for column, model, field in fields]
+
+    def _duplicates(self, table):
+        return ('duplicate id, a later line has it too',
+                's.line IN (SELECT line FROM (SELECT line, row_number() OVER (PARTITION BY id ORDER BY line DESC) AS n '
+                'FROM %s) AS numbered WHERE n > 1)' % table, [])
+
+    def _resolve(self, table, model, column, key):
+        """ set ``column`` of the staged rows from the ExternalKey of their ``key`` when its row still exists """
+        self.execute('''
+            UPDATE {table} s SET {column} = k.object_id FROM {keys} k
+            WHERE k.source = %s AND k.model = %s AND k.external_id = s.{key}
+                AND EXISTS (SELECT 1 FROM {model} m WHERE m.id = k.object_id)
+        '''.format(table=table, column=column, key=key, keys=ExternalKey._meta.db_table,
+                   model=model._meta.db_table), [self.source, model.__name__.lower()])
+
+    def _allocate(self, table, column, model):
+        """ mark the staged rows without ``column`` new and give them ids of the model's sequence """
+        self.execute("UPDATE {table} SET new = {column} IS NULL, {column} = COALESCE({column}, "
+                     "nextval(pg_get_serial_sequence('{model}', 'id')))".format(
+                         table=table, column=column, model=model._meta.db_table))
+
+    def _keep_keys(self, table, column, model):
+        self.execute('''
+            INSERT INTO {keys} (source, model, external_id, object_id)
+            SELECT %s, %s, id, {column} FROM {table} WHERE new
+            ON CONFLICT (source, model, external_id) DO UPDATE SET object_id = EXCLUDED.object_id
+        '''.format(keys=ExternalKey._meta.db_table, table=table, column=column),
+            [self.source, model.__name__.lower()])
+
+    def geocode(self, path):
+        self.stage(path, 'import_geocode', GEOCODE_COLUMNS)
+        self.reject('import_geocode', os.path.basename(path), [
+            ('missing address', 's.address IS NULL', []),
+            ('invalid lat/lng', 'pg_temp.import_float(s.lat) NOT BETWEEN -90 AND 90 '
+                                'OR pg_temp.import_float(s.lng) NOT BETWEEN -180 AND 180 '
+                                'OR pg_temp.import_float(s.lat) IS NULL OR pg_temp.import_float(s.lng) IS NULL', []),
+        ])
+
+    def posts(self, path):
+        name = os.path.basename(path)
+        self.stage(path, 'import_post', POST_COLUMNS)
+        self.execute('UPDATE import_post s SET author_id = a.id FROM {author} a WHERE a.username = COALESCE(s.author, %s)'
+                     .format(author=Author._meta.db_table), [self.default_author])
+        self.execute("UPDATE import_post SET image_list = ARRAY(SELECT trim(path) FROM unnest(string_to_array(images, '|')) "
+                     "AS path WHERE trim(path) <> '') WHERE images IS NOT NULL")
+        image_length = _max_length(PostImage, 'image')
+        self.reject('import_post', name, [
+            ('missing id', 's.id IS NULL', []),
+            self._duplicates('import_post'),
+            ('unknown author', 's.author_id IS NULL', []),
+            ('missing address', 's.address IS NULL', []),
+            ('invalid price', 's.price IS NULL OR s.price !~ %s', [PRICE]),
+            ('invalid capacity', 's.capacity IS NULL OR s.capacity !~ %s', [CAPACITY]),
+            ('invalid lat/lng', '(s.lat IS NOT NULL OR s.lng IS NOT NULL) AND NOT COALESCE('
+                                'pg_temp.import_float(s.lat) BETWEEN -90 AND 90 '
+                                'AND pg_temp.import_float(s.lng) BETWEEN -180 AND 180, false)', []),
+            ('image path longer than %d characters' % image_length,
+             'EXISTS (SELECT 1 FROM unnest(s.image_list) AS path WHERE length(path) > %s)', [image_length]),
+        ] + self._length_checks([('id', ExternalKey, 'external_id'), ('title', Post, 'title'), ('city', Post, 'city'),
+                                 ('posttype', Post, 'posttype'), ('address', Location, 'address')]))
+
+        # locations: known addresses, then new ones at the coordinates of the row or the geocode file
+        update_locations = ('UPDATE import_post s SET location_id = l.id FROM {location} l '
+                            'WHERE l.address = s.address AND s.location_id IS NULL').format(
+                                location=Location._meta.db_table)
+        self.execute(update_locations)
+        created = self.execute('''
+            WITH new AS (
+                SELECT DISTINCT ON (s.address) s.address,
+                    COALESCE(pg_temp.import_float(s.lat), pg_temp.import_float(g.lat)) AS lat,
+                    COALESCE(pg_temp.import_float(s.lng), pg_temp.import_float(g.lng)) AS lng
+                FROM import_post s LEFT JOIN import_geocode g ON g.address = s.address
+                WHERE s.location_id IS NULL
+                ORDER BY s.address, s.lat IS NULL, s.line DESC, g.line DESC
+            )
+            INSERT INTO {location} (geometry, address, created, updated)
+            -- stored as POINT(lat lng), see tasks.geocode_location
+            SELECT ST_SetSRID(ST_MakePoint(lat, lng), 4326), address, %s, %s FROM new
+            WHERE lat IS NOT NULL AND lng IS NOT NULL
+            ON CONFLICT (address) DO NOTHING
+        '''.format(location=Location._meta.db_table), [self.now, self.now]).rowcount
+        self.count('locations created', created)
+        self.execute(update_locations)
+        self.reject('import_post', name, [('address not geocoded', 's.location_id IS NULL', [])])
+
+        self._resolve('import_post', Post, 'post_id', 'id')
+        self._allocate('import_post', 'post_id', Post)
+        self.execute('''
+            UPDATE import_post s SET images_changed = s.image_list IS DISTINCT FROM
+                (SELECT array_agg(i.image ORDER BY i.id) FROM {image} i WHERE i.post_id = s.post_id)
+            WHERE s.image_list IS NOT NULL AND NOT s.new
+        '''.format(image=PostImage._meta.db_table))
+
+        defaults = [_default(Post, 'title'), _default(Post, 'city'), _default(Post, 'posttype')]
+        values = ("s.author_id, s.location_id, COALESCE(s.title, %s), s.content, trim(s.price)::numeric, "
+                  "trim(s.capacity)::integer, COALESCE(s.city, %s), COALESCE(s.posttype, %s)")
+        inserted = self.execute('''
+            INSERT INTO {post} (id, author_id, location_id, title, content, price, capacity, city, posttype, created, updated)
+            SELECT s.post_id, {values}, %s, %s FROM import_post s WHERE s.new RETURNING id
+        '''.format(post=Post._meta.db_table, values=values), defaults + [self.now, self.now]).fetchall()
+        updated = self.execute('''
+            UPDATE {post} p SET (author_id, location_id, title, content, price, capacity, city, posttype, updated)
+                = ({values}, %s)
+            FROM import_post s
+            WHERE p.id = s.post_id AND NOT s.new
+                AND (p.author_id, p.location_id, p.title, p.content, p.price, p.capacity, p.city, p.posttype)
+                    IS DISTINCT FROM ({values})
+            RETURNING p.id
+        '''.format(post=Post._meta.db_table, values=values), defaults + [self.now] + defaults).fetchall()
+        self._keep_keys('import_post', 'post_id', Post)
+
+        self.execute('DELETE FROM {image} i USING import_post s WHERE i.post_id = s.post_id AND s.images_changed'
+                     .format(image=PostImage._meta.db_table))
+        images = self.execute('''
+            INSERT INTO {image} (author_id, post_id, image, created, updated)
+            SELECT s.author_id, s.post_id, image.path, %s, %s
+            FROM import_post s, unnest(s.image_list) WITH ORDINALITY AS image (path, n)
+            WHERE s.new OR s.images_changed
+            ORDER BY s.post_id, image.n
+        '''.format(image=PostImage._meta.db_table), [self.now, self.now]).rowcount
+        with_images = [pk for pk, in self.execute('SELECT post_id FROM import_post WHERE images_changed').fetchall()]
+
+        self.count('posts created', len(inserted))
+        self.count('posts updated', len(updated))
+        self.count('images imported', images)
+        self.changed_posts.update(pk for pk, in inserted + updated)
+        self.changed_posts.update(with_images)
+        self.touched_posts.update(pk for pk, in updated)
+        self.touched_posts.update(with_images)
+
+    def bookings(self, path):
+        name = os.path.basename(path)
+        self.stage(path, 'import_booking', BOOKING_COLUMNS)
+        self._resolve('import_booking', Post, 'post_id', 'post')
+        self.execute('UPDATE import_booking s SET author_id = a.id FROM {author} a WHERE a.username = COALESCE(s.author, %s)'
+                     .format(author=Author._meta.db_table), [self.default_author])
+        self.execute('UPDATE import_booking SET begin_at = pg_temp.import_timestamptz("begin"), '
+                     'end_at = pg_temp.import_timestamptz("end"), '
+                     'created_at = COALESCE(pg_temp.import_timestamptz(created), %s)', [self.now])
+        statuses = sorted(transitions.TRANSITIONS)
+        self.reject('import_booking', name, [
+            ('missing id', 's.id IS NULL', []),
+            self._duplicates('import_booking'),
+            ('unknown post', 's.post_id IS NULL', []),
+            ('unknown author', 's.author_id IS NULL', []),
+            ('invalid begin', 's.begin_at IS NULL', []),
+            ('invalid end', 's.end_at IS NULL', []),
+            ('invalid created', 's.created IS NOT NULL AND pg_temp.import_timestamptz(s.created) IS NULL', []),
+            ('end before begin', 's.end_at < s.begin_at', []),
+            ("longer than %d days" % partitions.max_duration().days, 's.end_at - s.begin_at > %s',
+             [partitions.max_duration()]),
+            ('invalid status', 's.status IS NOT NULL AND s.status <> ALL(%s)', [statuses]),
+        ] + self._length_checks([('id', ExternalKey, 'external_id'), ('title', Booking, 'title')]))
+
+        self._resolve('import_booking', Booking, 'booking_id', 'id')
+        self.execute('CREATE INDEX ON import_booking (post_id, begin_at)')
+        self.execute('ANALYZE import_booking')
+        # the bookings being imported again are checked in their new place only;
+        # cancelled bookings are final and overlap nothing
+        self.reject('import_booking', name, [
+            ('overlaps a booking of the post', '''s.status IS DISTINCT FROM %s AND EXISTS (
+                SELECT 1 FROM {booking} b
+                WHERE b.post_id = s.post_id AND b."begin" <= s.end_at AND b."end" >= s.begin_at
+                    AND b."begin" >= s.begin_at - %s AND b.status <> %s
+                    AND b.id NOT IN (SELECT booking_id FROM import_booking WHERE booking_id IS NOT NULL))
+             '''.format(booking=Booking._meta.db_table),
+             [Booking.CANCELLED, partitions.max_duration(), Booking.CANCELLED]),
+            ('overlaps an earlier line', '''s.status IS DISTINCT FROM %s AND EXISTS (
+                SELECT 1 FROM import_booking o
+                WHERE o.post_id = s.post_id AND o.line < s.line AND o.begin_at <= s.end_at AND o.end_at >= s.begin_at
+                    AND o.begin_at >= s.begin_at - %s AND o.status IS DISTINCT FROM %s)''',
+             [Booking.CANCELLED, partitions.max_duration(), Booking.CANCELLED]),
+        ])
+
+        months = [row[0] for row in self.execute(
+            "SELECT DISTINCT date_trunc('month', begin_at AT TIME ZONE 'UTC')::date FROM import_booking").fetchall()]
+        if not self.dry_run:
+            for month in partitions.ensure(months):
+                self.log('created %s' % partitions.partition_name(month))
+
+        self._allocate('import_booking', 'booking_id', Booking)
+        defaults = [_default(Booking, 'title'), _default(Booking, 'status')]
+        values = 's.author_id, s.post_id, s.begin_at, s.end_at, COALESCE(s.title, %s), COALESCE(s.status, %s)'
+        inserted = self.execute('''
+            INSERT INTO {booking} (id, author_id, post_id, "begin", "end", title, status, version, created, updated)
+            SELECT s.booking_id, {values}, 1, s.created_at, %s FROM import_booking s WHERE s.new
+            RETURNING id, post_id
+        '''.format(booking=Booking._meta.db_table, values=values), defaults + [self.now]).fetchall()
+        updated = self.execute('''
+            UPDATE {booking} b SET (author_id, post_id, "begin", "end", title, status, version, updated)
+                = ({values}, b.version + 1, %s)
+            FROM import_booking s
+            WHERE b.id = s.booking_id AND NOT s.new
+                AND (b.author_id, b.post_id, b."begin", b."end", b.title, b.status) IS DISTINCT FROM ({values})
+            RETURNING b.id, b.post_id
+        '''.format(booking=Booking._meta.db_table, values=values), defaults + [self.now] + defaults).fetchall()
+        self._keep_keys('import_booking', 'booking_id', Booking)
+
+        self.count('bookings created', len(inserted))
+        self.count('bookings updated', len(updated))
+        self.changed_bookings.update(pk for pk, post_id in inserted + updated)
+        self.touched_posts.update(post_id for pk, post_id in inserted + updated)
+
+    def record_changes(self):
+        """ what the post_save hooks of drf/signals.py do, in bulk """
+        for model, pks in ((Post, sorted(self.changed_posts)), (Booking, sorted(self.changed_bookings))):
+            for start in range(0, len(pks), 10000):
+                sync.record_many(model, pks[start:start + 10000])
+
+    def invalidate_caches(self):
+        """ once committed """
+        for pk in self.touched_posts:
+            bundles.invalidate(pk)
+        if self.changed_posts:
+            facets.invalidate()
+
+    def report(self):
+        elapsed = time.time() - self.started
+        staged = sum(n for name, n in self.counts.items() if name.endswith(' rows'))
+        report = OrderedDict(self.counts)
+        report['rejects'] = len(self.rejects)
+        report['seconds'] = round(elapsed, 2)
+        report['rows/s'] = int(staged / max(elapsed, 0.001))
+        return report
+
+
+def run(source, posts=None, bookings=None, geocode=None, default_author=None, dry_run=False, chunk=10000, log=None):
+    """
+    Import the ``posts`` and ``bookings`` files of ``source``, locating new
+    addresses with the ``geocode`` file. Returns the Import, whose ``report()``
+    and ``rejects`` tell what happened. Nothing is written with ``dry_run``.
+    """
+    job = Import(source, default_author=default_author, dry_run=dry_run, chunk=chunk, log=log)
+    try:
+        with transaction.atomic():
+            job.prepare()
+            if geocode:
+                job.geocode(geocode)
+            if posts:
+                job.posts(posts)
+            if bookings:
+                job.bookings(bookings)
+            job.record_changes()
+            if dry_run:
+                transaction.set_rollback(True)
+    finally:
+        job.cursor.close()
+    if not dry_run:
+        job.invalidate_caches()
+    return job
@@ -0,0 +1,150 @@
+"""
+A small database backed job queue for side effects that should not run
+inside the request (geocoding, thumbnails, outgoing email).
+Jobs are rows of the ``Job`` table, so no external broker is required; they are
+picked up by ``manage.py runjobs``, which runs a pool of worker processes.
+Example Usage:
+    # tasks.py
+    from drf.jobs import task
+    @task
+    def geocode_location(location_id):
+        ...
+    # anywhere in a view or serializer
+    geocode_location.delay(location.pk)
+"""
+
+import json
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings as django_settings
+from django.db import router
+from django.db.models import F
+from django.utils import six, timezone
+from django.utils.module_loading import import_string
+
+from drf.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(django_settings, 'JOBS_' + name, default)
+
+
+def _job_name(func):
+    if isinstance(func, six.string_types):
+        return func
+    return '%s.%s' % (func.__module__, func.__name__)
+
+
+def enqueue(func, args=(), kwargs=None, unique=False, delay=0, max_attempts=None):
+    """
+    Queue a call of ``func`` (a function or its dotted path).
+    Args and kwargs must be JSON serializable. With ``unique`` an identical job
+    that is still queued or running is reused instead of queueing another one;
+    the check reads the primary, a replica may not have the job yet.
+    """
+    name = _job_name(func)
+    payload = json.dumps({'args': list(args), 'kwargs': kwargs or {}}, sort_keys=True)
+
+    if _setting('ALWAYS_EAGER', False):
+        import_string(name)(*args, **(kwargs or {}))
+        return None
+
+    if unique:
+        existing = Job.objects.db_manager(router.db_for_write(Job)).filter(
+            name=name, payload=payload, status__in=(Job.QUEUED, Job.RUNNING)).first()
+        if existing is not None:
+            return existing
+
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or _setting('MAX_ATTEMPTS', 5),
+    )
+
+
+def task(func):
+    """ Decorator adding ``func.delay(*args, **kwargs)`` which queues the call """
+    def delay(*args, **kwargs):
+        return enqueue(func, args, kwargs)
+    func.delay = delay
+    return func
+
+
+def backoff(attempts):
+    """ Seconds to wait before retrying a job which failed ``attempts`` times """
+    base = _setting('RETRY_BACKOFF', 10)
+    return min(base * 2 ** (attempts - 1), _setting('RETRY_BACKOFF_MAX', 3600))
+
+
+def requeue_stale():
+    """ Put back jobs of workers which died while running them """
+    limit = timezone.now() - timedelta(seconds=_setting('STALE_TIMEOUT', 600))
+    return Job.objects.filter(status=Job.RUNNING, updated__lt=limit).update(status=Job.QUEUED, updated=timezone.now())
+
+
+def claim():
+    """
+    Atomically take the next due job, or return None.
+    A conditional UPDATE is used as compare-and-swap, so concurrent workers
+    never run the same job twice.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at').values_list('pk', flat=True)
+    for pk in candidates[:10]:
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            attempts=F('attempts') + 1,
+            updated=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def execute(job):
+    """ Run a claimed job and record its outcome and timing """
+    start = time.time()
+    try:
+        payload = json.loads(job.payload)
+        import_string(job.name)(*payload.get('args', []), **payload.get('kwargs', {}))
+    except Exception:
+        duration = time.time() - start
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            status = Job.FAILED
+            run_at = job.run_at
+        else:
+            status = Job.QUEUED
+            run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+        Job.objects.filter(pk=job.pk).update(
+            status=status, run_at=run_at, last_error=error, duration=duration, updated=timezone.now())
+        logger.warning('job %s %s (attempt %d/%d) failed in %.3fs\n%s',
+                       job.pk, job.name, job.attempts, job.max_attempts, duration, error)
+        return status
+
+    duration = time.time() - start
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, duration=duration, updated=timezone.now())
+    logger.info('job %s %s done in %.3fs', job.pk, job.name, duration)
+    return Job.DONE
+
+
+def work(burst=False, sleep=1.0):
+    """
+    Worker loop: run due jobs until interrupted.
+    With ``burst`` the loop returns as soon as no job is due.
+    """
+    requeue_stale()
+    while True:
+        job = claim()
+        if job is not None:
+            execute(job)
+        elif burst:
+            return
+        else:
+            time.sleep(sleep)
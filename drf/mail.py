@@ -0,0 +1,26 @@
+from django.core.mail.backends.base import BaseEmailBackend
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    Email backend which queues messages as background jobs instead of
+    talking to the mail server inside the request.
+    The job delivers them through ``settings.JOBS_EMAIL_BACKEND``.
+    Attachments are not supported.
+    """
+
+    def send_messages(self, email_messages):
+        from drf.tasks import send_email
+
+        for message in email_messages:
+            send_email.delay(
+                message.subject,
+                message.body,
+                message.from_email,
+                list(message.to),
+                cc=list(message.cc),
+                bcc=list(message.bcc),
+                reply_to=list(message.reply_to),
+                alternatives=[list(alternative) for alternative in getattr(message, 'alternatives', [])],
+            )
+        return len(email_messages)
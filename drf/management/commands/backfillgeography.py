@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+from drf.models import Location
+
+
+class Command(BaseCommand):
+    help = ('Fill drf_location.geography of the rows older than migration 0013, --batch ids per '
+            'transaction so the table stays writable; new and changed rows are kept up to date by a trigger')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=10000, help='ids per UPDATE')
+
+    def handle(self, *args, **options):
+        table = Location._meta.db_table
+        cursor = connections[router.db_for_write(Location)].cursor()
+        start = time.time()
+        filled = 0
+        try:
+            cursor.execute('SELECT min(id), max(id) FROM %s WHERE geography IS NULL AND geometry IS NOT NULL' % table)
+            low, high = cursor.fetchone()
+            if low is not None:
+                # autocommit, every batch commits on its own
+                for first in range(low, high + 1, options['batch']):
+                    cursor.execute('''
+                        UPDATE {table} SET geography = ST_FlipCoordinates(geometry)::geography
+                        WHERE id >= %s AND id < %s AND geography IS NULL AND geometry IS NOT NULL
+                    '''.format(table=table), [first, first + options['batch']])
+                    filled += cursor.rowcount
+        finally:
+            cursor.close()
+        self.stdout.write('filled the geography of %d locations in %.1f s' % (filled, time.time() - start))
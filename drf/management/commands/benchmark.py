@@ -0,0 +1,83 @@
+import sys
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_test_environment
+
+from drf import benchmark, profiling
+from drf.models import Author
+
+
+@contextmanager
+def _nullcontext():
+    yield None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every API endpoint through the test client (see also `generatedata`)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--user', help='username to authenticate /me/ endpoints as')
+        parser.add_argument('--endpoint', action='append', dest='names', help='only benchmark this url name')
+        parser.add_argument('--output', help='write the results as JSON to this file')
+        parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='percent p95 slowdown reported as a regression')
+        parser.add_argument('--profile-fields', action='store_true', default=False,
+                            help='profile serializer fields over the whole run')
+        parser.add_argument('--codecs', action='store_true', default=False,
+                            help='only compare JSON renderers and parsers on generated post, location and booking pages')
+        parser.add_argument('--page-size', type=int, default=1000, help='rows per page for --codecs')
+        parser.add_argument('--fast-serializers', choices=('on', 'off'),
+                            help='override FAST_LIST_SERIALIZERS, e.g. to --compare the two list paths')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+
+        user = None
+        if options['user']:
+            try:
+                user = Author.objects.get(username=options['user'])
+            except Author.DoesNotExist:
+                raise CommandError('No author %r' % options['user'])
+
+        if options['codecs']:
+            self.stdout.write('%-10s %-20s %6s %10s %10s %10s' % ('page', 'renderer', 'rows', 'bytes', 'render ms', 'parse ms'))
+            for page, results in sorted(benchmark.codecs(options['iterations'], options['page_size']).items()):
+                for name, result in sorted(results.items()):
+                    self.stdout.write('%-10s %-20s %6d %10d %10.2f %10.2f' % (
+                        page, name, result['rows'], result['bytes'], result['render_ms'], result['parse_ms']))
+            return
+
+        overrides = {}
+        if options['fast_serializers']:
+            overrides['FAST_LIST_SERIALIZERS'] = options['fast_serializers'] == 'on'
+
+        with override_settings(**overrides):
+            with profiling.profile() if options['profile_fields'] else _nullcontext() as field_profile:
+                results = benchmark.run(options['iterations'], user=user, names=options['names'])
+
+        self.stdout.write('%-48s %6s %9s %9s %9s %7s %10s' % ('endpoint', 'status', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'bytes'))
+        for name, result in sorted(results['endpoints'].items()):
+            self.stdout.write('%-48s %6s %9.2f %9.2f %9.2f %7d %10d' % (
+                name, result['status'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['queries'], result['bytes']))
+
+        if field_profile is not None:
+            results['fields'] = field_profile.as_dict()
+            self.stdout.write('\n' + field_profile.report(limit=50))
+
+        if options['output']:
+            benchmark.dump(results, options['output'])
+
+        if options['compare']:
+            regressions = 0
+            self.stdout.write('\n%-48s %9s %9s %8s' % ('endpoint', 'before', 'after', 'change'))
+            for name, before, after, change, regressed in benchmark.compare(
+                    benchmark.load(options['compare']), results, options['threshold']):
+                regressions += regressed
+                self.stdout.write('%-48s %9.2f %9.2f %+7.1f%%%s' % (
+                    name, before, after, change, '  REGRESSION' if regressed else ''))
+            if regressions:
+                sys.exit(1)
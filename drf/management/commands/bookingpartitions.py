@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.conf import settings as django_settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from drf import partitions
+
+
+class Command(BaseCommand):
+    help = ('Create the monthly booking partitions up to BOOKING_PARTITION_MONTHS_AHEAD months ahead '
+            'and, with --archive, detach the old ones. Run it daily from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archive', action='store_true', default=False,
+                            help='archive the partitions older than BOOKING_ARCHIVE_AFTER_MONTHS')
+        parser.add_argument('--before', help='YYYY-MM, archive the partitions of the months before this one')
+        parser.add_argument('--dump', metavar='DIR',
+                            help='write archived partitions to DIR as gzipped CSV and drop them, '
+                                 'instead of moving them to BOOKING_ARCHIVE_SCHEMA')
+
+    def handle(self, *args, **options):
+        for month in partitions.ensure_ahead():
+            self.stdout.write('created %s' % partitions.partition_name(month))
+
+        if not options['archive'] and not options['before']:
+            return
+        if options['before']:
+            try:
+                before = datetime.strptime(options['before'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--before takes a month as YYYY-MM')
+        else:
+            keep = getattr(django_settings, 'BOOKING_ARCHIVE_AFTER_MONTHS', 12)
+            before = partitions.add_months(partitions.month_of(timezone.now()), -keep)
+        for name, count in partitions.archive(before, dump_dir=options['dump']):
+            self.stdout.write('archived %s (%d bookings)' % (name, count))
@@ -0,0 +1,100 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from drf import exports, partitions, views
+from drf.models import Author, Post, Booking, TrendingScore
+
+
+def view_queryset(view_class, user, query=None, **kwargs):
+    """
+    the queryset of the first page ``view_class`` lists for a GET by ``user``
+    with ``query``, built by the view itself so that the check follows it
+    """
+    request = Request(APIRequestFactory().get('/', query or {}))
+    request.user = user
+    view = view_class(request=request, args=(), kwargs=kwargs, format_kwarg=None)
+    queryset = view.filter_queryset(view.get_queryset())
+    if view.paginator is not None:
+        queryset = queryset[:view.paginator.get_page_size(request)]
+    return queryset
+
+
+def hot_paths():
+    """ (name, queryset) pairs of the views of drf/views.py and other hot queries, on sample rows """
+    post = Post.objects.order_by('pk').first()
+    author = Author.objects.filter(is_active=True, posts__isnull=False).order_by('pk').first()
+    booking = Booking.objects.order_by('pk').first()
+    if post is None or author is None or booking is None:
+        raise CommandError('No data to explain, run `manage.py generatedata` first')
+    # stored as POINT(lat lng)
+    center = post.location.geometry.centroid
+    point = {'point': '%f,%f' % (center.x, center.y), 'dist': 5000}
+
+    return (
+        ('authorpost-list', view_queryset(views.AuthorPostListView, author)),
+        ('postcomment-list', view_queryset(views.PostCommentListView, author, pk=post.pk)),
+        ('authorcomment-list', view_queryset(views.AuthorCommentListView, author)),
+        ('postbooking-list', view_queryset(views.PostBookingListView, author, pk=post.pk)),
+        ('booking overlap check', partitions.overlapping(
+            Booking.objects.filter(post__pk=post.pk), booking.begin, booking.end)),
+        ('post-list-create filter', view_queryset(views.PostListCreateView, author, {
+            'city': post.city, 'posttype': post.posttype, 'min_price': post.price, 'max_price': post.price * 2})),
+        ('author-list', view_queryset(views.AuthorListView, author)),
+        ('location distance filter', view_queryset(views.LocationWithinDistanceOfPointListView, author, point)),
+        ('post distance filter', view_queryset(views.PostListCreateView, author, point)),
+        ('post export window', exports.window('post', since=post.updated - timedelta(days=1), until=post.updated)),
+        ('booking export window', exports.window('booking', since=booking.updated - timedelta(days=1),
+                                                 until=booking.updated)),
+        ('trending board', TrendingScore.objects.filter(
+            city=post.city, posttype=post.posttype).order_by('-score', 'post')[:100]),
+    )
+
+
+def seq_scans(plan):
+    """ relation names scanned sequentially anywhere in an EXPLAIN (FORMAT JSON) plan """
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan.get('Relation Name'))
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot view querysets and fail if any of them uses a sequential scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--disable-seqscan', action='store_true', default=False,
+                            help='SET enable_seqscan = off, to check that an index is usable at all on small data sets')
+        parser.add_argument('--verbose-plans', action='store_true', default=False)
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            cursor = connection.cursor()
+            if options['disable_seqscan']:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, queryset in hot_paths():
+                sql, params = queryset.query.sql_with_params()
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+                if not isinstance(plan, list):
+                    plan = json.loads(plan)
+                plan = plan[0]['Plan']
+
+                scans = seq_scans(plan)
+                self.stdout.write('%-28s %-8s cost=%s %s' % (
+                    name, 'SEQSCAN' if scans else 'ok', plan['Total Cost'], ', '.join(scans)))
+                if options['verbose_plans']:
+                    self.stdout.write(json.dumps(plan, indent=2))
+                if scans:
+                    failures.append(name)
+
+        if failures:
+            raise CommandError('Sequential scans on hot paths: %s' % ', '.join(failures))
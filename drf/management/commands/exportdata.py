@@ -0,0 +1,40 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from drf import exports
+
+
+class Command(BaseCommand):
+    help = ('Stream the posts, comments, bookings or locations updated in a window to NDJSON or CSV '
+            'from a server-side cursor, see drf/exports.py')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=list(exports.EXPORTS))
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='ndjson')
+        parser.add_argument('--since', help='ISO 8601, export the rows updated after it, '
+                                            'e.g. the until of the last export')
+        parser.add_argument('--until', help='ISO 8601, default EXPORT_SETTLE_SECONDS ago')
+        parser.add_argument('--output', metavar='FILE', help='default stdout')
+
+    def handle(self, *args, **options):
+        try:
+            since = exports.parse_time(options['since'])
+            until = exports.parse_time(options['until']) or exports.default_until()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        stats = {'rows': 0}
+        start = time.time()
+        output = open(options['output'], 'wb') if options['output'] else getattr(sys.stdout, 'buffer', sys.stdout)
+        try:
+            for chunk in exports.export(options['model'], options['format'], since, until, stats=stats):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+        elapsed = time.time() - start
+        # the data may be on stdout
+        self.stderr.write('exported %d %ss in %.1f s (%d rows/s), next --since %s' % (
+            stats['rows'], options['model'], elapsed, stats['rows'] / max(elapsed, 0.001), until.isoformat()))
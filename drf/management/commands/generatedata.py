@@ -0,0 +1,135 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings as django_settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from drf.models import Author, Post, PostImage, Comment, Booking, Location
+
+CITIES = {
+    'beijing': (39.90, 116.40),
+    'shanghai': (31.23, 121.47),
+    'shenzhen': (22.54, 114.06),
+    'guangzhou': (23.13, 113.26),
+    'hangzhou': (30.27, 120.15),
+}
+POSTTYPES = ('office', 'desk', 'meetingroom', 'studio', 'event')
+BOOKING_STATUSES = ('proposed', 'confirmed', 'cancelled')
+WORDS = ('quiet', 'bright', 'central', 'spacious', 'cozy', 'modern', 'shared',
+         'private', 'open', 'creative', 'downtown', 'view', 'coffee', 'wifi')
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _new_ids(model, after):
+    """ ids of the rows bulk_create just inserted (bulk_create does not return them) """
+    return list(model.objects.filter(pk__gt=after or 0).order_by('pk').values_list('pk', flat=True))
+
+
+def _max_id(model):
+    return model.objects.aggregate(Max('pk'))['pk__max'] or 0
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic authors, posts, locations, images, comment trees and bookings for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10, help='posts per author')
+        parser.add_argument('--images', type=int, default=3, help='image rows per post')
+        parser.add_argument('--comments', type=int, default=5, help='top level comments per post')
+        parser.add_argument('--depth', type=int, default=4, help='depth of every comment thread')
+        parser.add_argument('--bookings', type=int, default=40, help='bookings per post')
+        parser.add_argument('--prefix', default='bench', help='prefix of generated usernames and addresses')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--flush', action='store_true', default=False,
+                            help='delete data previously generated with the same prefix first')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        now = timezone.now()
+
+        with transaction.atomic():
+            if options['flush']:
+                Author.objects.filter(username__startswith=prefix).delete()
+                Location.objects.filter(address__startswith=prefix).delete()
+
+            password = make_password(prefix)
+            before = _max_id(Author)
+            Author.objects.bulk_create([
+                Author(username='%s_%d_%d' % (prefix, before, i), email='%s%d@example.com' % (prefix, i),
+                       password=password, date_joined=now, is_active=True)
+                for i in range(options['authors'])
+            ])
+            author_ids = _new_ids(Author, before)
+
+            before = _max_id(Location)
+            locations = []
+            for i in range(len(author_ids) * options['posts']):
+                city = rng.choice(list(CITIES))
+                lat, lng = CITIES[city]
+                lat += rng.uniform(-0.2, 0.2)
+                lng += rng.uniform(-0.2, 0.2)
+                locations.append(Location(
+                    address='%s %d-%d %s road, %s' % (prefix, before, i, rng.choice(WORDS), city),
+                    geometry=GEOSGeometry('POINT(%f %f)' % (lat, lng)),
+                    created=now, updated=now))
+            Location.objects.bulk_create(locations)
+            location_ids = _new_ids(Location, before)
+
+            before = _max_id(Post)
+            posts = []
+            for i, location_id in enumerate(location_ids):
+                updated = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                posts.append(Post(
+                    author_id=author_ids[i % len(author_ids)], location_id=location_id,
+                    title=_text(rng, 4), content=_text(rng, 40),
+                    price=Decimal('%d.%02d' % (rng.randint(10, 5000), rng.randint(0, 99))),
+                    capacity=rng.randint(1, 200), city=locations[i].address.rsplit(', ', 1)[1],
+                    posttype=rng.choice(POSTTYPES), created=updated, updated=updated))
+            Post.objects.bulk_create(posts)
+            post_rows = list(Post.objects.filter(pk__gt=before).values_list('pk', 'author_id'))
+
+            PostImage.objects.bulk_create([
+                PostImage(author_id=author_id, post_id=post_id, created=now, updated=now,
+                          image='post_image/author_%d/post_%d/%s_%d.jpg' % (author_id, post_id, prefix, i))
+                for post_id, author_id in post_rows for i in range(options['images'])
+            ])
+
+            # comment threads, one level per bulk insert so parents have ids
+            parents = [(post_id, None) for post_id, author_id in post_rows for _ in range(options['comments'])]
+            stars = getattr(django_settings, 'COMMENT_RATING_MAX', 5)
+            for level in range(options['depth']):
+                before = _max_id(Comment)
+                Comment.objects.bulk_create([
+                    Comment(author_id=rng.choice(author_ids), post_id=post_id, parent_id=parent_id,
+                            content=_text(rng, 20), rating=rng.randint(1, stars), created=now, updated=now)
+                    for post_id, parent_id in parents
+                ])
+                parents = [(post_id, pk) for pk, post_id in
+                           Comment.objects.filter(pk__gt=before).values_list('pk', 'post_id')]
+
+            bookings = []
+            for post_id, author_id in post_rows:
+                begin = now - timedelta(days=30)
+                for i in range(options['bookings']):
+                    begin += timedelta(hours=rng.randint(1, 24))
+                    end = begin + timedelta(hours=rng.randint(1, 8))
+                    bookings.append(Booking(
+                        author_id=rng.choice(author_ids), post_id=post_id, begin=begin, end=end,
+                        title=_text(rng, 3), status=rng.choice(BOOKING_STATUSES), created=now, updated=now))
+                    begin = end
+            Booking.objects.bulk_create(bookings, batch_size=5000)
+
+        self.stdout.write('Generated %d authors, %d posts, %d images, %d comments, %d bookings' % (
+            len(author_ids), len(post_rows), len(post_rows) * options['images'],
+            len(post_rows) * options['comments'] * options['depth'], len(bookings)))
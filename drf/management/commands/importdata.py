@@ -0,0 +1,58 @@
+import csv
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import six
+
+from drf import imports
+from drf.models import Author, ExternalKey
+
+
+class Command(BaseCommand):
+    help = ('Bulk import the posts (with locations and images) and bookings of a partner from CSV or NDJSON '
+            'files through COPY and set-wise upserts, see drf/imports.py')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', required=True,
+                            help='name of the partner; ids of the files are unique per source')
+        parser.add_argument('--posts', metavar='FILE', help='posts, .csv or .ndjson')
+        parser.add_argument('--bookings', metavar='FILE', help='bookings, .csv or .ndjson')
+        parser.add_argument('--geocode', metavar='FILE', help='address, lat, lng of new addresses, .csv or .ndjson')
+        parser.add_argument('--author', help='username of the rows without an author')
+        parser.add_argument('--rejects', metavar='FILE', help='write the rejected lines with their reason to FILE (CSV)')
+        parser.add_argument('--chunk', type=int, default=10000, help='rows per COPY')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='check and report, then roll back')
+
+    def handle(self, *args, **options):
+        if not options['posts'] and not options['bookings']:
+            raise CommandError('Nothing to import, give --posts and/or --bookings')
+        max_length = ExternalKey._meta.get_field('source').max_length
+        if len(options['source']) > max_length:
+            raise CommandError('--source is longer than %d characters' % max_length)
+        if options['author'] and not Author.objects.filter(username=options['author']).exists():
+            raise CommandError('Unknown author %s' % options['author'])
+
+        job = imports.run(options['source'], posts=options['posts'], bookings=options['bookings'],
+                          geocode=options['geocode'], default_author=options['author'],
+                          dry_run=options['dry_run'], chunk=options['chunk'], log=self.stdout.write)
+
+        for name, value in job.report().items():
+            self.stdout.write('%-20s %s' % (name, value))
+        for name, line, reason in job.rejects[:20]:
+            self.stdout.write('rejected %s:%d %s' % (name, line, reason))
+        if len(job.rejects) > 20:
+            self.stdout.write('... %d more rejects' % (len(job.rejects) - 20))
+        if options['rejects']:
+            if six.PY2:
+                f = open(options['rejects'], 'wb')
+            else:
+                f = io.open(options['rejects'], 'w', encoding='utf-8', newline='')
+            with f:
+                writer = csv.writer(f)
+                writer.writerow(['file', 'line', 'reason'])
+                writer.writerows(job.rejects)
+        if options['dry_run']:
+            self.stdout.write('dry run, nothing was written')
+        elif job.changed_posts or job.changed_bookings:
+            self.stdout.write('run `manage.py similarposts` and `manage.py trending --rebuild` to rank the new data')
@@ -0,0 +1,43 @@
+import multiprocessing
+
+from django.conf import settings as django_settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from drf import jobs
+
+
+def _initializer():
+    # every worker process opens its own database connection
+    connections.close_all()
+
+
+def _work(args):
+    burst, sleep = args
+    jobs.work(burst=burst, sleep=sleep)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(django_settings, 'JOBS_WORKERS', 2),
+                            help='number of worker processes')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true', default=False,
+                            help='exit once no job is due')
+
+    def handle(self, *args, **options):
+        connections.close_all()
+        workers = options['workers']
+        self.stdout.write('Starting %d job workers' % workers)
+        pool = multiprocessing.Pool(workers, initializer=_initializer)
+        try:
+            # map_async().get() with a timeout keeps KeyboardInterrupt deliverable
+            pool.map_async(_work, [(options['burst'], options['sleep'])] * workers).get(timeout=10 ** 9)
+        except KeyboardInterrupt:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
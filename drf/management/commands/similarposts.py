@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from drf import similar
+from drf.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Compute the similar posts of every post (or of --post), '
+            'e.g. after loading data with signals off; saved posts are refreshed by jobs')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--post', type=int, action='append', default=[], help='post id, repeatable')
+
+    def handle(self, *args, **options):
+        pks = options['post'] or list(Post.objects.order_by('pk').values_list('pk', flat=True))
+        start = time.time()
+        for n, pk in enumerate(pks, 1):
+            # every list is computed anyway, no merging into the neighbors' lists
+            similar.refresh(pk, merge=bool(options['post']))
+            if n % 1000 == 0:
+                self.stdout.write('%d/%d posts, %.0f posts/s' % (n, len(pks), n / (time.time() - start)))
+        self.stdout.write('computed the similar posts of %d posts in %.1f s' % (len(pks), time.time() - start))
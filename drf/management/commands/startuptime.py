@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings as django_settings
+from django.core.management.base import BaseCommand, CommandError
+
+from drf.benchmark import percentile
+
+
+class Command(BaseCommand):
+    help = ('Measure how long a worker takes to start the WSGI application under --settings, '
+            'its resident memory and the slowest imports, in fresh interpreters')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=30, help='number of imports listed')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'webizcafe.settings'))
+        runs = []
+        for i in range(options['repeat']):
+            try:
+                output = subprocess.check_output([sys.executable, '-m', 'drf.startup', str(options['limit'])],
+                                                 cwd=django_settings.BASE_DIR, env=env)
+            except subprocess.CalledProcessError as e:
+                raise CommandError('startup failed with exit code %d' % e.returncode)
+            runs.append(json.loads(output.decode('utf-8')))
+
+        last = runs[-1]
+        self.stdout.write('settings   %s' % env['DJANGO_SETTINGS_MODULE'])
+        self.stdout.write('setup      %.3f s (median of %d)' % (percentile([r['setup_seconds'] for r in runs], 50), len(runs)))
+        self.stdout.write('preloaded  %.3f s' % percentile([r['total_seconds'] for r in runs], 50))
+        self.stdout.write('rss        %d kB' % percentile([r['rss_kb'] for r in runs], 50))
+        self.stdout.write('modules    %d\n' % last['modules'])
+        self.stdout.write('%-60s %9s %9s' % ('import', 'cum ms', 'own ms'))
+        for name, cumulative, own in last['imports']:
+            self.stdout.write('%-60s %9.1f %9.1f' % (name, cumulative * 1000, own * 1000))
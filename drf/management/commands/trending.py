@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from drf import trending
+from drf.models import TrendingScore
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the trending scores from the recent comments, ratings and bookings, '
+            'prune decayed ones and show a trending board')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', default=False,
+                            help='recompute every score from TRENDING_REBUILD_DAYS of history')
+        parser.add_argument('--prune', action='store_true', default=False,
+                            help='delete scores which decayed below TRENDING_MIN_SCORE, run it from cron')
+        parser.add_argument('--city', default=trending.ANY)
+        parser.add_argument('--posttype', default=trending.ANY)
+        parser.add_argument('--limit', type=int, default=10, help='number of posts shown')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write('rebuilt %d scores' % trending.rebuild())
+        if options['prune']:
+            self.stdout.write('pruned %d scores' % trending.prune())
+
+        now = timezone.now()
+        ranked = trending.tracker.top(options['city'], options['posttype'])[:options['limit']]
+        scores = dict(TrendingScore.objects.filter(post__in=ranked).values_list('post', 'score'))
+        self.stdout.write('%-10s %12s' % ('post', 'score'))
+        for post_id in ranked:
+            if post_id in scores:
+                self.stdout.write('%-10s %12.3f' % (post_id, trending.current(scores[post_id], now)))
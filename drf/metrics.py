@@ -0,0 +1,259 @@
+"""
+In-process request metrics exposed in the Prometheus text format.
+Every worker process keeps its own histograms and periodically writes a
+snapshot to ``settings.METRICS_DIR``; the ``/metrics`` view merges the
+snapshots of all workers, so any gunicorn/uWSGI worker can answer a scrape.
+The snapshots of exited workers are folded into one file of their own, so
+the directory does not grow as workers are recycled.
+"""
+
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings as django_settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+DEFAULT_BUCKETS = {
+    'seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'queries': (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    'bytes': (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+}
+
+# the histograms of exited workers, see compact
+EXITED = 'metrics-exited.json'
+
+# pid -> name of the snapshot file of that process, see snapshot_name
+_snapshot_names = {}
+_lock = threading.Lock()
+_last_flush = [0.0]
+
+
+class Histogram(object):
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = json.dumps(sorted(labels.items()))
+        with _lock:
+            if key not in self.values:
+                self.values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            data = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data['buckets'][i] += 1
+            data['sum'] += value
+            data['count'] += 1
+
+
+REGISTRY = dict((histogram.name, histogram) for histogram in (
+    Histogram('drf_request_duration_seconds', 'Time spent handling the request.', DEFAULT_BUCKETS['seconds']),
+    Histogram('drf_db_duration_seconds', 'Time spent in SQL queries per request.', DEFAULT_BUCKETS['seconds']),
+    Histogram('drf_db_queries', 'Number of SQL queries per request.', DEFAULT_BUCKETS['queries']),
+    Histogram('drf_serialization_duration_seconds', 'Time spent in serializer to_representation per request.', DEFAULT_BUCKETS['seconds']),
+    Histogram('drf_render_duration_seconds', 'Time spent rendering the response body.', DEFAULT_BUCKETS['seconds']),
+    Histogram('drf_response_size_bytes', 'Size of the response body.', DEFAULT_BUCKETS['bytes']),
+    Histogram('drf_db_pool_wait_seconds', 'Time spent waiting for a pooled database connection.', DEFAULT_BUCKETS['seconds']),
+))
+
+# name -> (documentation, callable returning [(labels, value)]), sampled at flush time
+GAUGES = {}
+
+
+def register_gauge(name, documentation, func):
+    GAUGES[name] = (documentation, func)
+
+
+def observe(name, value, **labels):
+    REGISTRY[name].observe(value, **labels)
+
+
+def metrics_dir():
+    return getattr(django_settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'webizcafe-metrics'))
+
+
+def snapshot():
+    with _lock:
+        histograms = dict((name, {'buckets': list(h.buckets), 'values': json.loads(json.dumps(h.values))})
+                          for name, h in REGISTRY.items())
+    gauges = dict((name, dict((json.dumps(sorted(labels.items())), value) for labels, value in func()))
+                  for name, (documentation, func) in GAUGES.items())
+    return {'pid': os.getpid(), 'histograms': histograms, 'gauges': gauges}
+
+
+def snapshot_name():
+    """
+    Process unique name of this worker's snapshot file (the pid alone can be
+    reused). Made on first use in each process, never at import: preloaded
+    workers import this module in the master before they are forked.
+    """
+    pid = os.getpid()
+    name = _snapshot_names.get(pid)
+    if name is None:
+        _snapshot_names.clear()
+        name = _snapshot_names[pid] = 'metrics-%d-%s.json' % (pid, uuid.uuid4().hex[:8])
+    return name
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def flush(force=False):
+    """ Write this worker's snapshot, at most every METRICS_FLUSH_INTERVAL seconds """
+    now = time.time()
+    if not force and now - _last_flush[0] < getattr(django_settings, 'METRICS_FLUSH_INTERVAL', 1.0):
+        return
+    _last_flush[0] = now
+
+    directory = metrics_dir()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    _write(os.path.join(directory, snapshot_name()), snapshot())
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.rename(tmp, path)
+
+
+def _merge(merged, histograms):
+    """ add the ``histograms`` of a snapshot to ``merged`` """
+    for name, histogram in histograms.items():
+        target = merged.setdefault(name, {'buckets': histogram['buckets'], 'values': {}})
+        for key, value in histogram['values'].items():
+            if key not in target['values']:
+                target['values'][key] = {'buckets': [0] * len(histogram['buckets']), 'sum': 0.0, 'count': 0}
+            total = target['values'][key]
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], value['buckets'])]
+            total['sum'] += value['sum']
+            total['count'] += value['count']
+
+
+@contextmanager
+def _locked(directory, operation):
+    """ flock ``directory``: compact holds it exclusively, collect shared """
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, operation)
+        yield
+
+
+def compact():
+    """
+    Fold the snapshots of exited workers into the EXITED file and delete them.
+    EXITED names the snapshots it holds until they are gone, so a scrape dying
+    in between does not count them twice. Returns the number folded.
+    """
+    directory = metrics_dir()
+    if not os.path.isdir(directory):
+        return 0
+    paths = glob.glob(os.path.join(directory, 'metrics-*-*.json'))
+    # metrics-<pid>-<suffix>.json, see snapshot_name
+    dead = [path for path in paths if not _alive(int(os.path.basename(path).split('-')[1]))]
+    if not dead:
+        return 0
+    with _locked(directory, fcntl.LOCK_EX):
+        path = os.path.join(directory, EXITED)
+        exited = _read(path) or {'histograms': {}, 'snapshots': []}
+        names = set(os.path.basename(p) for p in glob.glob(os.path.join(directory, 'metrics-*-*.json')))
+        folded = set(exited['snapshots']) & names
+        for snapshot_path in dead:
+            name = os.path.basename(snapshot_path)
+            if name in folded or name not in names:
+                continue
+            data = _read(snapshot_path)
+            if data is not None:
+                _merge(exited['histograms'], data['histograms'])
+            folded.add(name)
+        exited['snapshots'] = sorted(folded)
+        _write(path, exited)
+        for name in folded:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    return len(folded)
+
+
+def collect():
+    """
+    Merge the snapshots of all workers. Histograms of exited workers are kept
+    (they are cumulative), gauges only count live workers.
+    """
+    merged = {}
+    gauges = {}
+    directory = metrics_dir()
+    if not os.path.isdir(directory):
+        return merged, gauges
+    compact()
+    # not while a snapshot moves into EXITED, it would count twice or not at all
+    with _locked(directory, fcntl.LOCK_SH):
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            data = _read(path)
+            if data is None:
+                continue
+            if 'pid' in data and _alive(data['pid']):
+                for name, values in data['gauges'].items():
+                    target = gauges.setdefault(name, {})
+                    for key, value in values.items():
+                        target[key] = target.get(key, 0) + value
+            _merge(merged, data['histograms'])
+    return merged, gauges
+
+
+def _labels(key, **extra):
+    items = [(k, v) for k, v in json.loads(key)] + sorted(extra.items())
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+
+
+def render(merged, gauges):
+    lines = []
+    for name in sorted(gauges):
+        lines.append('# HELP %s %s' % (name, GAUGES[name][0] if name in GAUGES else name))
+        lines.append('# TYPE %s gauge' % name)
+        for key, value in sorted(gauges[name].items()):
+            lines.append('%s%s %r' % (name, _labels(key), value))
+    for name in sorted(merged):
+        histogram = merged[name]
+        lines.append('# HELP %s %s' % (name, REGISTRY[name].documentation if name in REGISTRY else name))
+        lines.append('# TYPE %s histogram' % name)
+        for key, value in sorted(histogram['values'].items()):
+            for bound, count in zip(histogram['buckets'], value['buckets']):
+                lines.append('%s_bucket%s %d' % (name, _labels(key, le=repr(float(bound))), count))
+            lines.append('%s_bucket%s %d' % (name, _labels(key, le='+Inf'), value['count']))
+            lines.append('%s_sum%s %r' % (name, _labels(key), value['sum']))
+            lines.append('%s_count%s %d' % (name, _labels(key), value['count']))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """ Prometheus scrape endpoint aggregated across all workers """
+    allowed = getattr(django_settings, 'METRICS_ALLOWED_IPS', None)
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    flush(force=True)
+    return HttpResponse(render(*collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,128 @@
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings as django_settings
+from django.db import connections
+from rest_framework import serializers
+
+from drf import metrics, profiling
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class _RequestTimer(object):
+
+    def __init__(self):
+        self.start = time.time()
+        self.serialization = 0.0
+        self.render = 0.0
+        self.depth = 0
+
+
+def _timed_data(data):
+    """ Accumulate the time of the outermost ``serializer.data`` call of the request """
+    @functools.wraps(data)
+    def wrapper(self):
+        timer = getattr(_local, 'timer', None)
+        if timer is None or timer.depth:
+            return data(self)
+        timer.depth += 1
+        start = time.time()
+        try:
+            return data(self)
+        finally:
+            timer.serialization += time.time() - start
+            timer.depth -= 1
+    return wrapper
+
+
+def _install_serializer_timing():
+    if not getattr(serializers.BaseSerializer, '_metrics_timed', False):
+        serializers.BaseSerializer.data = property(_timed_data(serializers.BaseSerializer.data.fget))
+        serializers.BaseSerializer._metrics_timed = True
+
+
+class RequestMetricsMiddleware(object):
+    """
+    Record per view duration, SQL query count and time, serialization and
+    render time and response size into the histograms of drf.metrics.
+    With METRICS_SERVER_TIMING the values are also sent as a
+    ``Server-Timing`` response header.
+    Keep it first in MIDDLEWARE_CLASSES so it sees the whole request.
+    """
+
+    def __init__(self):
+        _install_serializer_timing()
+
+    def process_request(self, request):
+        _local.timer = _RequestTimer()
+        for alias in connections:
+            connections[alias].force_debug_cursor = True
+
+    def process_template_response(self, request, response):
+        timer = getattr(_local, 'timer', None)
+        if timer is not None:
+            start = time.time()
+
+            def rendered(response):
+                timer.render += time.time() - start
+            response.add_post_render_callback(rendered)
+        return response
+
+    def process_response(self, request, response):
+        timer = getattr(_local, 'timer', None)
+        if timer is None:
+            return response
+        _local.timer = None
+
+        duration = time.time() - timer.start
+        queries = 0
+        db_time = 0.0
+        for alias in connections:
+            connection = connections[alias]
+            connection.force_debug_cursor = False
+            queries += len(connection.queries_log)
+            db_time += sum(float(query['time']) for query in connection.queries_log)
+        size = 0 if response.streaming else len(response.content)
+
+        match = getattr(request, 'resolver_match', None)
+        labels = {
+            'view': match.url_name if match and match.url_name else 'unmatched',
+            'method': request.method,
+        }
+        metrics.observe('drf_request_duration_seconds', duration, **labels)
+        metrics.observe('drf_db_duration_seconds', db_time, **labels)
+        metrics.observe('drf_db_queries', queries, **labels)
+        metrics.observe('drf_serialization_duration_seconds', timer.serialization, **labels)
+        metrics.observe('drf_render_duration_seconds', timer.render, **labels)
+        metrics.observe('drf_response_size_bytes', size, **labels)
+        metrics.flush()
+
+        if getattr(django_settings, 'METRICS_SERVER_TIMING', False):
+            response['Server-Timing'] = ', '.join('%s;dur=%.1f' % (name, seconds * 1000) for name, seconds in (
+                ('db', db_time), ('serialize', timer.serialization), ('render', timer.render), ('total', duration)))
+        return response
+
+
+class FieldProfilingMiddleware(object):
+    """
+    Log a ranked per field serializer profile for requests with
+    ``?profile=fields`` (only with DEBUG or for staff sessions).
+    Must come after AuthenticationMiddleware.
+    """
+
+    def process_request(self, request):
+        if request.GET.get('profile') == 'fields' and (django_settings.DEBUG or request.user.is_staff):
+            request.field_profile = profiling.start()
+
+    def process_response(self, request, response):
+        field_profile = getattr(request, 'field_profile', None)
+        if field_profile is not None:
+            profiling.stop(field_profile)
+            logger.info('serializer field profile of %s %s\n%s',
+                        request.method, request.get_full_path(), field_profile.report())
+        return response
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# (name, columns and predicate) matching the querysets of drf/views.py,
+# see `manage.py checkindexes`
+INDEXES = (
+    ('drf_post_author_updated_idx', 'drf_post (author_id, updated DESC)'),
+    ('drf_post_city_posttype_price_idx', 'drf_post (city, posttype, price)'),
+    ('drf_comment_post_toplevel_idx', 'drf_comment (post_id) WHERE parent_id IS NULL'),
+    ('drf_comment_author_updated_idx', 'drf_comment (author_id, updated DESC)'),
+    ('drf_booking_post_begin_end_idx', 'drf_booking (post_id, "begin", "end")'),
+    ('drf_author_active_idx', 'drf_author (id) WHERE is_active'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf', '0006_job'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX %s ON %s' % (name, definition),
+            'DROP INDEX IF EXISTS %s' % name,
+        )
+        for name, definition in INDEXES
+    ]
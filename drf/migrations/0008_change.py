@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(editable=False)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='change',
+            index_together=set([('model', 'object_id')]),
+        ),
+        # existing objects, oldest first, so a first sync from 0 sees everything
+        migrations.RunSQL(
+            '''
+            INSERT INTO drf_change (model, object_id, deleted, created)
+            SELECT model, object_id, false, now() FROM (
+                SELECT 'post' AS model, id AS object_id, updated FROM drf_post
+                UNION ALL SELECT 'comment', id, updated FROM drf_comment
+                UNION ALL SELECT 'booking', id, updated FROM drf_booking
+            ) AS existing
+            ORDER BY updated
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf', '0008_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('post', models.OneToOneField(related_name='trending', primary_key=True, serialize=False, to='drf.Post')),
+                ('city', models.CharField(max_length=20)),
+                ('posttype', models.CharField(max_length=20)),
+                ('score', models.FloatField(db_index=True)),
+                ('updated', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='trendingscore',
+            index_together=set([('city', 'posttype', 'score'), ('city', 'score'), ('posttype', 'score')]),
+        ),
+    ]
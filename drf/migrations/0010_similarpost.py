@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf', '0009_trendingscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarPost',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('post', models.ForeignKey(related_name='similar_posts', to='drf.Post')),
+                ('similar', models.ForeignKey(related_name='+', to='drf.Post')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='similarpost',
+            unique_together=set([('post', 'rank')]),
+        ),
+    ]
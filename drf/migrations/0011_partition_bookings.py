@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# drf_booking becomes a table partitioned by month of "begin" (PostgreSQL 11+),
+# see drf/partitions.py. Its primary key has to include "begin"; ids stay
+# unique through the sequence. Indexes are those of 0001 and 0007.
+# Statements are separated by blank lines, the DO block has semicolons inside.
+FORWARD = [statement.strip() for statement in '''
+ALTER TABLE drf_booking RENAME TO drf_booking_unpartitioned
+
+CREATE TABLE drf_booking (LIKE drf_booking_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE ("begin")
+
+CREATE TABLE drf_booking_default PARTITION OF drf_booking DEFAULT
+
+DO $$
+DECLARE
+    month timestamptz;
+BEGIN
+    FOR month IN SELECT generate_series(
+        date_trunc('month', COALESCE((SELECT min("begin") FROM drf_booking_unpartitioned), now()) AT TIME ZONE 'UTC'),
+        date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+        interval '1 month'
+    ) AT TIME ZONE 'UTC' LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF drf_booking FOR VALUES FROM (%L) TO (%L)',
+                       'drf_booking_p' || to_char(month AT TIME ZONE 'UTC', 'YYYYMM'),
+                       month, (month AT TIME ZONE 'UTC' + interval '1 month') AT TIME ZONE 'UTC');
+    END LOOP;
+END $$
+
+INSERT INTO drf_booking SELECT * FROM drf_booking_unpartitioned
+
+ALTER SEQUENCE drf_booking_id_seq OWNED BY drf_booking.id
+
+DROP TABLE drf_booking_unpartitioned
+
+ALTER TABLE drf_booking ADD PRIMARY KEY (id, "begin")
+
+ALTER TABLE drf_booking ADD CONSTRAINT drf_booking_author_id_fk FOREIGN KEY (author_id)
+    REFERENCES drf_author (id) DEFERRABLE INITIALLY DEFERRED
+
+ALTER TABLE drf_booking ADD CONSTRAINT drf_booking_post_id_fk FOREIGN KEY (post_id)
+    REFERENCES drf_post (id) DEFERRABLE INITIALLY DEFERRED
+
+CREATE INDEX drf_booking_author_id_idx ON drf_booking (author_id)
+
+CREATE INDEX drf_booking_post_id_idx ON drf_booking (post_id)
+
+CREATE INDEX drf_booking_post_begin_end_idx ON drf_booking (post_id, "begin", "end")
+'''.split('\n\n')]
+
+BACKWARD = [statement.strip() for statement in '''
+ALTER TABLE drf_booking RENAME TO drf_booking_partitioned
+
+CREATE TABLE drf_booking (LIKE drf_booking_partitioned INCLUDING DEFAULTS)
+
+INSERT INTO drf_booking SELECT * FROM drf_booking_partitioned
+
+ALTER SEQUENCE drf_booking_id_seq OWNED BY drf_booking.id
+
+DROP TABLE drf_booking_partitioned
+
+ALTER TABLE drf_booking ADD PRIMARY KEY (id)
+
+ALTER TABLE drf_booking ADD CONSTRAINT drf_booking_author_id_fk FOREIGN KEY (author_id)
+    REFERENCES drf_author (id) DEFERRABLE INITIALLY DEFERRED
+
+ALTER TABLE drf_booking ADD CONSTRAINT drf_booking_post_id_fk FOREIGN KEY (post_id)
+    REFERENCES drf_post (id) DEFERRABLE INITIALLY DEFERRED
+
+CREATE INDEX drf_booking_author_id_idx ON drf_booking (author_id)
+
+CREATE INDEX drf_booking_post_id_idx ON drf_booking (post_id)
+
+CREATE INDEX drf_booking_post_begin_end_idx ON drf_booking (post_id, "begin", "end")
+'''.split('\n\n')]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf', '0010_similarpost'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, BACKWARD),
+    ]
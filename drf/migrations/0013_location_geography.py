@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.gis.db.models.fields
+from django.db import models, migrations
+
+
+# drf_location.geography is geometry with (lng lat) axes, locations being
+# stored as POINT(lat lng), see drf/geo.py. A trigger keeps it up to date and
+# it is indexed. The migration runs in one transaction holding the ALTER
+# TABLE lock, so the existing rows are left to `manage.py backfillgeography`,
+# which commits batch by batch.
+
+FORWARD = [statement.strip() for statement in '''
+ALTER TABLE drf_location ADD COLUMN geography geography(GEOMETRY, 4326) NULL
+
+CREATE FUNCTION drf_location_geography() RETURNS trigger AS $$
+BEGIN
+    NEW.geography := ST_FlipCoordinates(NEW.geometry)::geography;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+
+CREATE TRIGGER drf_location_geography BEFORE INSERT OR UPDATE OF geometry ON drf_location
+    FOR EACH ROW EXECUTE PROCEDURE drf_location_geography()
+'''.split('\n\n')]
+
+INDEX = 'CREATE INDEX drf_location_geography_id ON drf_location USING GIST (geography)'
+
+BACKWARD = [
+    'DROP TRIGGER IF EXISTS drf_location_geography ON drf_location',
+    'DROP FUNCTION IF EXISTS drf_location_geography()',
+    'ALTER TABLE drf_location DROP COLUMN IF EXISTS geography',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf', '0012_booking_version'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(FORWARD, BACKWARD),
+                migrations.RunSQL(INDEX, migrations.RunSQL.noop),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='location',
+                    name='geography',
+                    field=django.contrib.gis.db.models.fields.GeometryField(srid=4326, geography=True, null=True, editable=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf', '0013_location_geography'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalKey',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('source', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=20)),
+                ('external_id', models.CharField(max_length=200)),
+                ('object_id', models.IntegerField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='externalkey',
+            unique_together=set([('source', 'model', 'external_id')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# (name, columns) of the incremental export windows, see drf/exports.py
+INDEXES = (
+    ('drf_post_updated_id_idx', 'drf_post (updated, id)'),
+    ('drf_comment_updated_id_idx', 'drf_comment (updated, id)'),
+    ('drf_booking_updated_id_idx', 'drf_booking (updated, id)'),
+    ('drf_location_updated_id_idx', 'drf_location (updated, id)'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf', '0014_externalkey'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX %s ON %s' % (name, definition),
+            'DROP INDEX IF EXISTS %s' % name,
+        )
+        for name, definition in INDEXES
+    ]
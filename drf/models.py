@@ -14,6 +14,8 @@ class Author(AbstractUser):
 
 class Location(models.Model):
     geometry = models.GeometryField(editable=False)
+    # geometry with (lng lat) axes as geography, kept by a trigger, see drf/geo.py
+    geography = models.GeometryField(geography=True, editable=False, null=True)
     address = models.CharField(unique=True, max_length=200)
     created = models.DateTimeField(editable=False)
     updated = models.DateTimeField(editable=False)
@@ -93,9 +95,18 @@ class Comment(models.Model):
     created = models.DateTimeField(editable=False)
     updated = models.DateTimeField(editable=False)
 
+    # the rating as loaded or last saved, to tell rating changes apart (drf/signals.py)
+    _initial_rating = None
+
     def __unicode__(self):
         return self.content
 		
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        comment = super(Comment, cls).from_db(db, field_names, values)
+        comment._initial_rating = comment.__dict__.get('rating')
+        return comment
+
     def save(self, *args, **kwargs):
         ''' On save, update timestamps '''
         if not self.id:
@@ -105,19 +116,127 @@ class Comment(models.Model):
 
 
 class Booking(models.Model):
+    PROPOSED = 'proposed'
+    CONFIRMED = 'confirmed'
+    CANCELLED = 'cancelled'
+
     author = models.ForeignKey(Author, blank=False, editable=False, related_name='bookings')
     post = models.ForeignKey(Post, blank=False, editable=False, related_name='bookings')
     begin = models.DateTimeField(editable=True)
     end = models.DateTimeField(editable=True)
     title = models.CharField(max_length=1000, default='booking title')
-    status = models.CharField(max_length=20, default='proposed')
+    status = models.CharField(max_length=20, default=PROPOSED)
+    # bumped by every write, see drf/transitions.py
+    version = models.PositiveIntegerField(default=1, editable=False)
     created = models.DateTimeField(editable=False)
     updated = models.DateTimeField(editable=False)
 
+    # the status as loaded or last saved, to tell status changes apart (drf/signals.py)
+    _initial_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        booking = super(Booking, cls).from_db(db, field_names, values)
+        booking._initial_status = booking.__dict__.get('status')
+        return booking
+
     def save(self, *args, **kwargs):
-        ''' On save, update timestamps '''
+        ''' On save, update timestamps and the version '''
         if not self.id:
             self.created = timezone.now()
+        else:
+            self.version += 1
         self.updated = timezone.now()
         return super(Booking, self).save(*args, **kwargs)
 
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    name = models.CharField(max_length=200)
+    payload = models.TextField(default='{}')
+    status = models.CharField(max_length=20, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    last_error = models.TextField(blank=True, null=True)
+    duration = models.FloatField(blank=True, null=True)
+    created = models.DateTimeField(editable=False)
+    updated = models.DateTimeField(editable=False)
+
+    class Meta:
+        index_together = [('status', 'run_at')]
+
+    def __unicode__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        ''' On save, update timestamps '''
+        if not self.id:
+            self.created = timezone.now()
+        if not self.run_at:
+            self.run_at = self.created
+        self.updated = timezone.now()
+        return super(Job, self).save(*args, **kwargs)
+
+
+class Change(models.Model):
+    """
+    Change log behind the delta sync endpoint. An object keeps a single row,
+    re-inserted on every save or delete, so the id is a monotonic change
+    sequence and deleted objects are left as tombstones.
+    """
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+    created = models.DateTimeField(editable=False)
+
+    class Meta:
+        index_together = [('model', 'object_id')]
+
+    def save(self, *args, **kwargs):
+        ''' On save, update timestamps '''
+        if not self.id:
+            self.created = timezone.now()
+        return super(Change, self).save(*args, **kwargs)
+
+
+class TrendingScore(models.Model):
+    """
+    Forward decayed activity score of a post (see drf/trending.py), with the
+    post's city and posttype copied for the per city and posttype rankings.
+    """
+    post = models.OneToOneField(Post, primary_key=True, related_name='trending')
+    city = models.CharField(max_length=20)
+    posttype = models.CharField(max_length=20)
+    score = models.FloatField(db_index=True)
+    updated = models.DateTimeField()
+
+    class Meta:
+        index_together = [('city', 'posttype', 'score'), ('city', 'score'), ('posttype', 'score')]
+
+
+class SimilarPost(models.Model):
+    """ the ``rank``-th most similar post of a post, see drf/similar.py """
+    post = models.ForeignKey(Post, related_name='similar_posts')
+    similar = models.ForeignKey(Post, related_name='+')
+    rank = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = [('post', 'rank')]
+
+
+class ExternalKey(models.Model):
+    """ the id a row imported by ``manage.py importdata`` has in its source, see drf/imports.py """
+    source = models.CharField(max_length=50)
+    model = models.CharField(max_length=20)
+    external_id = models.CharField(max_length=200)
+    object_id = models.IntegerField()
+
+    class Meta:
+        unique_together = [('source', 'model', 'external_id')]
@@ -0,0 +1,25 @@
+import simplejson
+from django.conf import settings as django_settings
+from django.utils import six
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from drf.renderers import FastJSONRenderer
+
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    JSONParser on simplejson's C scanner. The body is decoded first so
+    strings always come out as unicode, as with the stdlib parser.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', django_settings.DEFAULT_CHARSET)
+
+        try:
+            data = stream.read().decode(encoding)
+            return simplejson.loads(data)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % six.text_type(exc))
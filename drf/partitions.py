@@ -0,0 +1,181 @@
+"""
+Monthly range partitions of the booking table on ``begin`` (migration 0011,
+PostgreSQL 11 or later).
+Every month has its partition ``drf_booking_pYYYYMM``; bookings of months
+without one land in ``drf_booking_default`` until ``ensure`` creates it and
+moves them over. Partitions are created ``BOOKING_PARTITION_MONTHS_AHEAD``
+months ahead by ``manage.py bookingpartitions`` and, when a booking of an
+unknown month is saved, by a job. ``archive`` detaches the partitions older
+than ``BOOKING_ARCHIVE_AFTER_MONTHS``.
+
+Queries only skip partitions when they bound ``begin``. Bookings last at most
+``BOOKING_MAX_DAYS``, so the querysets of ``overlapping`` and ``ending_after``
+bound it from below as well.
+"""
+
+import gzip
+import os
+import re
+from datetime import date, datetime, timedelta
+
+from django.conf import settings as django_settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from drf import sync
+from drf.models import Booking
+
+TABLE = Booking._meta.db_table
+DEFAULT_PARTITION = TABLE + '_default'
+PARTITION = re.compile(r'^%s_p(\d{4})(\d{2})$' % TABLE)
+
+_known = set()
+
+
+def max_duration():
+    return timedelta(days=getattr(django_settings, 'BOOKING_MAX_DAYS', 90))
+
+
+def overlapping(queryset, begin, end):
+    """ the bookings of ``queryset`` overlapping [begin, end] """
+    return queryset.filter(begin__lte=end, end__gte=begin, begin__gte=begin - max_duration())
+
+
+def ending_after(queryset, when):
+    """ the bookings of ``queryset`` which end after ``when`` """
+    return queryset.filter(end__gte=when, begin__gte=when - max_duration())
+
+
+def month_of(when):
+    """ the month of a date or of an aware datetime in UTC, like the partition bounds """
+    if isinstance(when, datetime) and timezone.is_aware(when):
+        when = when.astimezone(timezone.utc)
+    return date(when.year, when.month, 1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month):
+    return '%s_p%04d%02d' % (TABLE, month.year, month.month)
+
+
+def _cursor():
+    return connections[Booking.objects.db].cursor()
+
+
+def months():
+    """ the months which have a partition, oldest first """
+    cursor = _cursor()
+    try:
+        cursor.execute('''
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+        ''', [TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    found = []
+    for name in names:
+        match = PARTITION.match(name)
+        if match:
+            found.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(found)
+
+
+def ensure(wanted):
+    """ create the partitions of the months ``wanted`` which have none; returns the new months """
+    existing = set(months())
+    created = []
+    for month in sorted(set(wanted) - existing):
+        params = [_bound(month), _bound(next_month(month))]
+        with transaction.atomic(using=Booking.objects.db):
+            cursor = _cursor()
+            try:
+                cursor.execute('SELECT EXISTS (SELECT 1 FROM %s WHERE "begin" >= %%s AND "begin" < %%s)'
+                               % DEFAULT_PARTITION, params)
+                stranded = cursor.fetchone()[0]
+                if stranded:
+                    # the default partition may not keep rows of the new range
+                    cursor.execute('ALTER TABLE %s DETACH PARTITION %s' % (TABLE, DEFAULT_PARTITION))
+                cursor.execute('CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%%s) TO (%%s)'
+                               % (partition_name(month), TABLE), params)
+                if stranded:
+                    cursor.execute('''
+                        WITH moved AS (DELETE FROM {default} WHERE "begin" >= %s AND "begin" < %s RETURNING *)
+                        INSERT INTO {table} SELECT * FROM moved
+                    '''.format(default=DEFAULT_PARTITION, table=TABLE), params)
+                    cursor.execute('ALTER TABLE %s ATTACH PARTITION %s DEFAULT' % (TABLE, DEFAULT_PARTITION))
+            finally:
+                cursor.close()
+        created.append(month)
+    _known.update(wanted)
+    return created
+
+
+def ensure_ahead(now=None):
+    """ partitions from this month to BOOKING_PARTITION_MONTHS_AHEAD months ahead """
+    month = month_of(now or timezone.now())
+    ahead = getattr(django_settings, 'BOOKING_PARTITION_MONTHS_AHEAD', 3)
+    return ensure([add_months(month, i) for i in range(ahead + 1)])
+
+
+def missing_partition(when):
+    """
+    whether the month of ``when`` has no partition yet. The catalog is read
+    once per month and process, and a missing month is reported only once.
+    """
+    month = month_of(when)
+    if month in _known:
+        return False
+    _known.update(months())
+    missing = month not in _known
+    _known.add(month)
+    return missing
+
+
+def archive(before, dump_dir=None):
+    """
+    Detach the partitions of the months before ``before`` (a date). They are
+    moved to the ``BOOKING_ARCHIVE_SCHEMA`` schema, or with ``dump_dir``
+    written there as gzipped CSV and dropped. Sync clients get tombstones for
+    the archived bookings. Returns [(partition, bookings), ...].
+    """
+    schema = getattr(django_settings, 'BOOKING_ARCHIVE_SCHEMA', 'archive')
+    archived = []
+    for month in months():
+        if next_month(month) > before:
+            break
+        name = partition_name(month)
+        with transaction.atomic(using=Booking.objects.db):
+            cursor = _cursor()
+            try:
+                cursor.execute('SELECT id FROM %s' % name)
+                pks = [row[0] for row in cursor.fetchall()]
+                cursor.execute('ALTER TABLE %s DETACH PARTITION %s' % (TABLE, name))
+                if dump_dir:
+                    with gzip.open(os.path.join(dump_dir, '%s.csv.gz' % name), 'wb') as f:
+                        cursor.copy_expert('COPY %s TO STDOUT WITH CSV HEADER' % name, f)
+                    cursor.execute('DROP TABLE %s' % name)
+                else:
+                    cursor.execute('CREATE SCHEMA IF NOT EXISTS %s' % schema)
+                    cursor.execute('ALTER TABLE %s SET SCHEMA %s' % (name, schema))
+            finally:
+                cursor.close()
+            for start in range(0, len(pks), 10000):
+                sync.record_many(Booking, pks[start:start + 10000], deleted=True)
+        _known.discard(month)
+        archived.append((name, len(pks)))
+    return archived
@@ -9,3 +9,18 @@ class IsAuthorOrReadOnly(IsAuthenticatedOrReadOnly):
     def has_object_permission(self, request, view, obj):
         return request.method in SAFE_METHODS or obj.author == request.user
 
+
+
+class IsBookingPartyOrReadOnly(IsAuthenticatedOrReadOnly):
+    """
+    Custom permission to only allow the guest (author of a booking) and the
+    host (author of its post) to edit it, and only the guest to delete it.
+    drf/transitions.py decides which changes each of them may make.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        if request.method in SAFE_METHODS:
+            return True
+        if request.method == 'DELETE':
+            return obj.author_id == request.user.pk
+        return request.user.pk in (obj.author_id, obj.post.author_id)
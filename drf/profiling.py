@@ -0,0 +1,129 @@
+"""
+Opt-in per field profiler for the serializers in ``drf/serializers.py``.
+While a profile is active, ``get_attribute`` and ``to_representation`` of every
+field of those serializers are timed and aggregated by field path, e.g.
+``PostSerializer.images.thumbnail``. ``total`` includes nested fields, ``own``
+excludes them.
+Example Usage:
+    with profiling.profile() as field_profile:
+        PostSerializer(Post.objects.all(), many=True).data
+    print(field_profile.report())
+Per request: add ``?profile=fields`` (DEBUG or staff only, see
+FieldProfilingMiddleware); over a benchmark run: ``benchmark --profile-fields``.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings as django_settings
+from rest_framework import serializers
+
+_local = threading.local()
+
+
+class FieldProfile(object):
+
+    def __init__(self):
+        self.stats = {}
+        self.stack = []
+
+    def call(self, path, func, args, kwargs, count):
+        self.stack.append(0.0)
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            children = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            stat = self.stats.setdefault(path, [0, 0.0, 0.0])
+            if count:
+                stat[0] += 1
+            stat[1] += elapsed
+            stat[2] += elapsed - children
+
+    def ranked(self, key='own'):
+        index = {'calls': 0, 'total': 1, 'own': 2}[key]
+        return sorted(self.stats.items(), key=lambda item: item[1][index], reverse=True)
+
+    def as_dict(self):
+        return dict((path, {'calls': calls, 'total_ms': total * 1000, 'own_ms': own * 1000})
+                    for path, (calls, total, own) in self.stats.items())
+
+    def report(self, limit=30, key='own'):
+        lines = ['%-60s %8s %10s %10s' % ('field', 'calls', 'total ms', 'own ms')]
+        for path, (calls, total, own) in self.ranked(key)[:limit]:
+            lines.append('%-60s %8d %10.2f %10.2f' % (path, calls, total * 1000, own * 1000))
+        return '\n'.join(lines)
+
+
+def _path(field):
+    path = getattr(field, '_profile_path', None)
+    if path is None:
+        names = []
+        node = field
+        while node.parent is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        # the root of a many=True serializer is its ListSerializer
+        names.append(type(getattr(node, 'child', node)).__name__)
+        path = field._profile_path = '.'.join(reversed(names))
+    return path
+
+
+def _wrap(field, method_name):
+    original = getattr(field, method_name)
+
+    def wrapper(*args, **kwargs):
+        field_profile = getattr(_local, 'profile', None)
+        if field_profile is None:
+            return original(*args, **kwargs)
+        return field_profile.call(_path(field), original, args, kwargs, method_name == 'to_representation')
+    setattr(field, method_name, wrapper)
+
+
+def _profiled_fields(fields):
+    def wrapper(self):
+        built = hasattr(self, '_fields')
+        result = fields(self)
+        modules = getattr(django_settings, 'SERIALIZER_PROFILING_MODULES', ('drf.serializers',))
+        if not built and getattr(_local, 'profile', None) is not None and type(self).__module__ in modules:
+            for field in result.values():
+                # proxies such as RecursiveField forward these to the serializer they build
+                if hasattr(type(field), 'PROXIED_ATTRS'):
+                    continue
+                _wrap(field, 'get_attribute')
+                _wrap(field, 'to_representation')
+        return result
+    return wrapper
+
+
+def install():
+    if not getattr(serializers.Serializer, '_fields_profiled', False):
+        serializers.Serializer.fields = property(_profiled_fields(serializers.Serializer.fields.fget))
+        serializers.Serializer._fields_profiled = True
+
+
+def start():
+    """ Activate a new profile for the current thread and return it """
+    install()
+    field_profile = FieldProfile()
+    field_profile.previous = getattr(_local, 'profile', None)
+    _local.profile = field_profile
+    return field_profile
+
+
+def stop(field_profile):
+    _local.profile = field_profile.previous
+
+
+@contextmanager
+def profile():
+    field_profile = start()
+    try:
+        yield field_profile
+    finally:
+        stop(field_profile)
@@ -0,0 +1,122 @@
+import datetime
+import decimal
+
+import simplejson
+from django.utils import six
+from django.utils.functional import Promise
+from rest_framework import renderers
+from rest_framework.compat import SHORT_SEPARATORS, LONG_SEPARATORS, INDENT_SEPARATORS
+from rest_framework.utils import encoders
+
+
+def _datetime(obj):
+    # same representation as rest_framework.utils.encoders.JSONEncoder
+    representation = obj.isoformat()
+    if obj.microsecond:
+        representation = representation[:23] + representation[26:]
+    if representation.endswith('+00:00'):
+        representation = representation[:-6] + 'Z'
+    return representation
+
+
+def _date(obj):
+    return obj.isoformat()
+
+
+class FastJSONEncoder(encoders.JSONEncoder):
+    """
+    ``default`` for simplejson: the types our serializers and views hand to
+    the renderer are looked up by exact type, anything else goes through the
+    isinstance chain of DRF's encoder.
+    """
+    converters = {
+        datetime.datetime: _datetime,
+        datetime.date: _date,
+        # raw Decimals (e.g. aggregates) are written as exact JSON numbers by simplejson itself
+    }
+
+    def default(self, obj):
+        converter = self.converters.get(type(obj))
+        if converter is not None:
+            return converter(obj)
+        if isinstance(obj, Promise):
+            return six.text_type(obj)
+        return super(FastJSONEncoder, self).default(obj)
+
+
+_default = FastJSONEncoder().default
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer on simplejson's C encoder, which also escapes unicode
+    strings in C on python 2 (the stdlib falls back to python there).
+    Decimals which reach the renderer unconverted are written exactly
+    instead of through float.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+
+        if indent is None:
+            separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        else:
+            separators = INDENT_SEPARATORS
+
+        ret = simplejson.dumps(
+            data, default=_default, use_decimal=True, namedtuple_as_object=False,
+            indent=indent, ensure_ascii=self.ensure_ascii, separators=separators
+        )
+
+        # see JSONRenderer.render
+        if isinstance(ret, six.text_type):
+            ret = ret.replace(u'\u2028', u'\\u2028').replace(u'\u2029', u'\\u2029')
+            return bytes(ret.encode('utf-8'))
+        return ret
+
+
+class CalendarRenderer(renderers.BaseRenderer):
+    """
+    Lets views stream ``text/calendar`` responses through content negotiation;
+    only error details ever go through ``render``.
+    """
+    media_type = 'text/calendar'
+    format = 'ics'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = data.get('detail', '')
+        return (data or '').encode(self.charset)
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Lets views stream newline delimited JSON (drf/exports.py); only error
+    details ever go through ``render``, as one line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return FastJSONRenderer().render(data) + b'\n'
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    Lets views stream ``text/csv`` responses (drf/exports.py); only error
+    details ever go through ``render``.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = data.get('detail', '')
+        return (data or '').encode(self.charset)
@@ -0,0 +1,74 @@
+"""
+Read replica routing.
+``ReplicaRoutingMiddleware`` marks safe requests to the read views listed in
+``settings.REPLICA_READ_VIEWS``; while a request is marked, ``ReplicaRouter``
+sends its reads to one of ``settings.REPLICA_DATABASES``. Writes, ``/me/``
+views and every request of a client which wrote within the last
+``REPLICA_STICKY_SECONDS`` stay on the primary, so clients read their own writes.
+"""
+
+import hashlib
+import random
+import threading
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+
+_local = threading.local()
+
+PRIMARY = 'default'
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replicas():
+    return getattr(django_settings, 'REPLICA_DATABASES', ())
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if getattr(_local, 'use_replica', False) and replicas():
+            return random.choice(replicas())
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in replicas()
+
+
+def _client_key(request):
+    """ identify the client without touching the database (no user lookup) """
+    identity = (request.META.get('HTTP_AUTHORIZATION') or
+                request.COOKIES.get(django_settings.SESSION_COOKIE_NAME) or
+                request.META.get('REMOTE_ADDR', ''))
+    return 'replica-pin:%s' % hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def pinned(request):
+    return PIN_COOKIE in request.COOKIES or cache.get(_client_key(request)) is not None
+
+
+class ReplicaRoutingMiddleware(object):
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = getattr(request, 'resolver_match', None)
+        _local.use_replica = (
+            request.method in SAFE_METHODS and
+            match is not None and
+            match.url_name in getattr(django_settings, 'REPLICA_READ_VIEWS', ()) and
+            not pinned(request)
+        )
+
+    def process_response(self, request, response):
+        _local.use_replica = False
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            seconds = getattr(django_settings, 'REPLICA_STICKY_SECONDS', 5)
+            cache.set(_client_key(request), 1, seconds)
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds)
+        return response
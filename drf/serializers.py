@@ -1,5 +1,5 @@
 from geopy import geocoders
-from django.db.models import Q
+from django.db.models import Manager, Q, QuerySet
 from django.conf import settings as django_settings
 
 from datetime import datetime
@@ -17,6 +17,27 @@ from rest_framework_recursive.fields import RecursiveField
 
 from drf.models import Author, Post, PostImage, Comment, Booking, Location, BoxedLocation
 from drf.fields import HyperlinkedSorlImageField
+from drf.tasks import geocode_location
+from drf import partitions
+
+
+class PkOrderedListSerializer(serializers.ListSerializer):
+    """
+    nested list of related objects in primary key order, so that it is
+    stable and the same as the one of drf/fastserializers.py
+    """
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.order_by('pk')
+        return super(PkOrderedListSerializer, self).to_representation(data)
+
+
+class PkOrderedManyRelatedField(serializers.ManyRelatedField):
+    """ many=True related field listing the related objects in primary key order """
+    def get_attribute(self, instance):
+        relationship = super(PkOrderedManyRelatedField, self).get_attribute(instance)
+        return relationship.order_by('pk') if isinstance(relationship, QuerySet) else relationship
+
 
 class AuthorSerializer(serializers.ModelSerializer):
     posts = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
@@ -65,13 +86,15 @@ class PostImageSerializer(serializers.ModelSerializer):
         '400x260',
         options={"crop": "center"},
         source='image',
-        read_only=True
+        read_only=True,
+        defer=True
     )
-    fullsize = HyperlinkedSorlImageField('1140x668', source='image', read_only=True)
+    fullsize = HyperlinkedSorlImageField('1140x668', source='image', read_only=True, defer=True)
 
     class Meta:
         model = PostImage
         fields = ('id', 'image', 'thumbnail', 'fullsize', 'author', 'post', 'created', 'updated')
+        list_serializer_class = PkOrderedListSerializer
 		
 
 class LocationSerializer(gis_serializers.GeoFeatureModelSerializer):
@@ -84,20 +107,12 @@ class LocationSerializer(gis_serializers.GeoFeatureModelSerializer):
         fields = ['address', 'detail', 'created', 'updated']
 
     def create(self, validated_data):
-        g = geocoders.GoogleV3(django_settings.GOOGLE_API_KEY)
-        try:
-            res = g.geocode(validated_data['address'], exactly_one=False)
-            address, (lat, lng)= res[0]
-        except:
-            lat=0
-            lng=0
-
-        coordinate = GEOSGeometry('POINT(%f %f)' % (lat,lng))
+        # the coordinate is filled in by a background job, see drf.tasks
         location = Location.objects.create(
             address=validated_data['address'],
-            geometry=coordinate
+            geometry=GEOSGeometry('POINT(0 0)')
         )
-        location.save()
+        geocode_location.delay(location.pk)
         return location
 
 
@@ -115,8 +130,10 @@ class BoxedLocationSerializer(gis_serializers.GeoFeatureModelSerializer):
 
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    bookings = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
-    comments = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    bookings = PkOrderedManyRelatedField(child_relation=serializers.PrimaryKeyRelatedField(read_only=True),
+                                         read_only=True)
+    comments = PkOrderedManyRelatedField(child_relation=serializers.PrimaryKeyRelatedField(read_only=True),
+                                         read_only=True)
     images = PostImageSerializer(required=False, many=True, read_only=True)
     location = LocationSerializer(required=True)
 
@@ -142,6 +159,18 @@ class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ('id', 'author', 'post', 'parent', 'children', 'content', 'rating', 'created', 'updated')	
+        list_serializer_class = PkOrderedListSerializer
+
+
+class FlatCommentSerializer(serializers.ModelSerializer):
+    """ comment without its nested children, for the sync endpoint """
+    author = serializers.ReadOnlyField(source='author.username')
+    post = serializers.PrimaryKeyRelatedField(read_only=True)
+    parent = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'author', 'post', 'parent', 'content', 'rating', 'created', 'updated')
 
 
 class BookingSerializer(serializers.ModelSerializer):
@@ -150,10 +179,46 @@ class BookingSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Booking
-        fields = ('id', 'author', 'post', 'begin', 'end', 'title', 'status', 'created', 'updated')
+        fields = ('id', 'author', 'post', 'begin', 'end', 'title', 'status', 'version', 'created', 'updated')
+        read_only_fields = ('version',)
 
     def validate(self, data):
-        if Booking.objects.filter( begin__lte=data['end'], end__gte=data['begin'], post__pk=self.initial_data['postid'] ).exists():
-            raise serializers.ValidationError("Overlapping dates")
+        if 'begin' in data or 'end' in data:
+            begin = data.get('begin', getattr(self.instance, 'begin', None))
+            end = data.get('end', getattr(self.instance, 'end', None))
+            if end - begin > partitions.max_duration():
+                raise serializers.ValidationError("Bookings can't be longer than %d days" % partitions.max_duration().days)
+            if self.instance is None:
+                others = Booking.objects.filter(post__pk=self.initial_data['postid'])
+            else:
+                others = Booking.objects.filter(post__pk=self.instance.post_id).exclude(pk=self.instance.pk)
+            # cancelled bookings are final and free their dates
+            if partitions.overlapping(others.exclude(status=Booking.CANCELLED), begin, end).exists():
+                raise serializers.ValidationError("Overlapping dates")
+        if self.instance is None and data.get('status', Booking.PROPOSED) != Booking.PROPOSED:
+            # later statuses are reached through drf/transitions.py
+            raise serializers.ValidationError("New bookings are proposed")
         return super(BookingSerializer, self).validate(data)
 
+
+
+class BookingSeriesSerializer(serializers.Serializer):
+    """ a first occurrence and an RFC 5545 recurrence rule, expanded by drf/series.py """
+    postid = serializers.IntegerField()
+    title = serializers.CharField(max_length=1000, default='booking title')
+    begin = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    rrule = serializers.CharField()
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if data['end'] < data['begin']:
+            raise serializers.ValidationError("end is before begin")
+        if data['end'] - data['begin'] > partitions.max_duration():
+            raise serializers.ValidationError("Bookings can't be longer than %d days" % partitions.max_duration().days)
+        from drf import series
+        try:
+            data['occurrences'] = series.expand(data['rrule'], data['begin'], data['end'])
+        except series.InvalidRule as e:
+            raise serializers.ValidationError({'rrule': [str(e)]})
+        return data
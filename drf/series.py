@@ -0,0 +1,183 @@
+"""
+Recurring booking series: an RFC 5545 recurrence rule (``FREQ=WEEKLY;COUNT=10``)
+is expanded server side from the first occurrence, all occurrences are
+checked against the bookings of the post in one query, and the ones without
+conflict are inserted with one statement.
+Occurrences repeat in the local time of ``TIME_ZONE``, so a weekly booking
+keeps its hour across daylight saving changes. An occurrence at a local time
+the change skips moves forward by the gap, one at a repeated time takes the
+first of the two.
+"""
+
+import re
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import pytz
+except ImportError:
+    pytz = None
+from dateutil import rrule
+from django.conf import settings as django_settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from drf import bundles, events, partitions, sync, trending
+from drf.jobs import enqueue
+from drf.models import Post, Booking
+from drf.tasks import create_booking_partition
+
+UTC_UNTIL = re.compile(r'UNTIL=(\d{8}T\d{6})Z', re.IGNORECASE)
+
+
+class InvalidRule(ValueError):
+    pass
+
+
+def _local(value):
+    return timezone.make_naive(value, timezone.get_current_timezone())
+
+
+def _aware(value):
+    tz = timezone.get_current_timezone()
+    if pytz is None or not hasattr(tz, 'localize'):
+        return timezone.make_aware(value, tz)
+    try:
+        return tz.localize(value, is_dst=None)
+    except pytz.AmbiguousTimeError:
+        return tz.localize(value, is_dst=True)
+    except pytz.NonExistentTimeError:
+        # the offset before the change, e.g. 02:30 CET is 03:30 CEST
+        return tz.normalize(tz.localize(value, is_dst=False))
+
+
+def expand(rule, begin, end, limit=None):
+    """ [(begin, end), ...] of every occurrence of ``rule`` starting with [begin, end] """
+    limit = limit or getattr(django_settings, 'BOOKING_SERIES_MAX_OCCURRENCES', 200)
+    rule = rule.strip()
+    if rule.upper().startswith('RRULE:'):
+        rule = rule[6:]
+    # occurrences are expanded in naive local time, so is UNTIL
+    rule = UTC_UNTIL.sub(lambda match: 'UNTIL=' + _local(
+        datetime.strptime(match.group(1), '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc)).strftime('%Y%m%dT%H%M%S'),
+        rule)
+    if 'COUNT=' not in rule.upper() and 'UNTIL=' not in rule.upper():
+        raise InvalidRule('the rule needs a COUNT or an UNTIL')
+    try:
+        starts = rrule.rrulestr(rule, dtstart=_local(begin))
+    except (ValueError, TypeError) as e:
+        raise InvalidRule('invalid recurrence rule: %s' % e)
+
+    duration = end - begin
+    occurrences = []
+    for start in starts:
+        if len(occurrences) == limit:
+            raise InvalidRule('the rule has more than %d occurrences' % limit)
+        start = _aware(start)
+        occurrences.append((start, start + duration))
+    return occurrences
+
+
+def conflicts(post_id, occurrences):
+    """ [[conflicting booking id, ...] per occurrence] in one query; cancelled bookings conflict with nothing """
+    if not occurrences:
+        return []
+    begins = [begin for begin, end in occurrences]
+    ends = [end for begin, end in occurrences]
+    sql = '''
+        SELECT occurrence.n, booking.id
+        FROM unnest(%s::timestamptz[], %s::timestamptz[]) WITH ORDINALITY AS occurrence ("begin", "end", n)
+        JOIN {booking} booking ON booking.post_id = %s
+            AND booking."begin" <= occurrence."end" AND booking."end" >= occurrence."begin"
+            AND booking.status <> %s
+        WHERE booking."begin" >= %s AND booking."begin" <= %s
+        ORDER BY occurrence.n, booking."begin"
+    '''.format(booking=Booking._meta.db_table)
+    # constant bounds, so only the partitions of the series are read
+    params = [begins, ends, post_id, Booking.CANCELLED, min(begins) - partitions.max_duration(), max(ends)]
+    found = [[] for occurrence in occurrences]
+    cursor = connections[Booking.objects.db].cursor()
+    try:
+        cursor.execute(sql, params)
+        for n, booking_id in cursor.fetchall():
+            found[n - 1].append(booking_id)
+    finally:
+        cursor.close()
+    return found
+
+
+def _insert(bookings):
+    """ INSERT ``bookings`` in one statement and set their ids; bulk_create of Django 1.8 does not """
+    fields = [field for field in Booking._meta.concrete_fields if not field.primary_key]
+    connection = connections[Booking.objects.db]
+    row = '(%s)' % ', '.join(['%s'] * len(fields))
+    sql = 'INSERT INTO %s (%s) VALUES %s RETURNING id' % (
+        Booking._meta.db_table,
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        ', '.join([row] * len(bookings)))
+    params = []
+    for booking in bookings:
+        params.extend(field.get_db_prep_save(getattr(booking, field.attname), connection) for field in fields)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        for booking, (pk,) in zip(bookings, cursor.fetchall()):
+            booking.pk = pk
+    finally:
+        cursor.close()
+
+
+def book(author, post_id, title, occurrences, dry_run=False):
+    """
+    Book every occurrence which overlaps neither a booking of the post nor an
+    earlier occurrence. Returns the report: {'created', 'conflicts',
+    'occurrences': [{'occurrence', 'begin', 'end', 'status', 'booking',
+    'conflicts_with' (booking ids), 'overlaps' (earlier occurrences)}, ...]}
+    """
+    now = timezone.now()
+    items, bookings = [], []
+    with transaction.atomic():
+        # concurrent series of the same post wait for each other
+        host_id = Post.objects.select_for_update().filter(pk=post_id).values_list('author_id', flat=True).first()
+        if host_id is None:
+            raise Post.DoesNotExist
+        accepted = []
+        for n, ((begin, end), existing) in enumerate(zip(occurrences, conflicts(post_id, occurrences)), 1):
+            overlaps = [m for m, booking in accepted if booking.begin <= end and booking.end >= begin]
+            item = OrderedDict((
+                ('occurrence', n),
+                ('begin', begin),
+                ('end', end),
+                ('status', 'conflict' if existing or overlaps else 'created'),
+                ('booking', None),
+                ('conflicts_with', existing),
+                ('overlaps', overlaps),
+            ))
+            items.append(item)
+            if item['status'] == 'created':
+                booking = Booking(author=author, post_id=post_id, title=title, begin=begin, end=end,
+                                  created=now, updated=now)
+                accepted.append((n, booking))
+        bookings = [booking for n, booking in accepted]
+        if bookings and not dry_run:
+            _insert(bookings)
+            sync.record_many(Booking, [booking.pk for booking in bookings])
+            for n, booking in accepted:
+                items[n - 1]['booking'] = booking.pk
+
+    if bookings and not dry_run:
+        # what the post_save hooks of drf/signals.py do for single bookings
+        bundles.invalidate(post_id)
+        trending.record(post_id, trending.weight('booking') * len(bookings))
+        for booking in bookings:
+            channels, event = events.booking_event(booking, host_id)
+            events.broker.publish(channels, event)
+        for month in sorted(set(partitions.month_of(booking.begin) for booking in bookings)):
+            if partitions.missing_partition(month):
+                enqueue(create_booking_partition, (month.year, month.month), unique=True)
+
+    return OrderedDict((
+        ('created', 0 if dry_run else len(bookings)),
+        ('conflicts', len(items) - len(bookings)),
+        ('occurrences', items),
+    ))
@@ -0,0 +1,255 @@
+"""
+Adaptive concurrency limits and load shedding per endpoint cost tier.
+``LOAD_SHEDDING_ROUTES`` puts url names of webizcafe/urls.py into the tiers of
+``LOAD_SHEDDING_TIERS`` (everything else is ``LOAD_SHEDDING_DEFAULT_TIER``).
+Each tier may have at most ``limit`` requests in flight on the host, across
+all workers; more are answered right away with 503 and ``Retry-After``.
+The limit adapts to latency: it grows by 1/limit after every request faster
+than the tier's ``target_latency`` and shrinks by ``backoff`` after every
+slower one, between ``min`` and ``max`` (AIMD).
+
+The counters and limits live in a small memory mapped file shared by the
+worker processes of the host (``LOAD_SHEDDING_FILE``). Every process owns a
+slot of counters, so the requests of a crashed worker are not counted forever.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings as django_settings
+from django.http import HttpResponse
+
+from drf import metrics
+
+SLOTS = 256
+
+DEFAULT_TIER = {
+    'initial': 4,
+    'min': 1,
+    'max': 16,
+    'target_latency': 0.5,
+    'backoff': 0.9,
+    'retry_after': 1,
+}
+
+
+def tiers():
+    configured = getattr(django_settings, 'LOAD_SHEDDING_TIERS', {'default': {}})
+    return dict((name, dict(DEFAULT_TIER, **options)) for name, options in configured.items())
+
+
+def tier_of(url_name):
+    """ cost tier of a url name, None for exempt urls """
+    if url_name in getattr(django_settings, 'LOAD_SHEDDING_EXEMPT', ()):
+        return None
+    routes = getattr(django_settings, 'LOAD_SHEDDING_ROUTES', {})
+    return routes.get(url_name, getattr(django_settings, 'LOAD_SHEDDING_DEFAULT_TIER', 'default'))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class SharedCounters(object):
+    """
+    Per tier limits (doubles) followed by ``SLOTS`` process slots of
+    (pid, in flight per tier) in a memory mapped file, updated under flock.
+    """
+
+    def __init__(self, path, tiers):
+        self.tiers = tiers
+        self.names = sorted(tiers)
+        self.header = struct.Struct('=%dd' % len(self.names))
+        self.slot = struct.Struct('=i%di' % len(self.names))
+        size = self.header.size + SLOTS * self.slot.size
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size != size:
+                # new file, or written with other tiers: start over
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.map = mmap.mmap(self.fd, size)
+        # flock does not exclude threads of the same process
+        self.lock = threading.Lock()
+        self.index = None
+        self.shed = dict((name, 0) for name in self.names)
+
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _offset(self, index):
+        return self.header.size + index * self.slot.size
+
+    def _read(self, index):
+        values = self.slot.unpack_from(self.map, self._offset(index))
+        return values[0], list(values[1:])
+
+    def _write(self, index, pid, counts):
+        self.slot.pack_into(self.map, self._offset(index), pid, *counts)
+
+    def _own_slot(self):
+        """ index of this process' slot, claiming a free or dead one first; None when all are taken """
+        if self.index is not None:
+            return self.index
+        pid = os.getpid()
+        for index in range(SLOTS):
+            owner, counts = self._read(index)
+            if owner == 0 or owner == pid or not _alive(owner):
+                self._write(index, pid, [0] * len(self.names))
+                self.index = index
+                return index
+        return None
+
+    def limits(self):
+        values = self.header.unpack_from(self.map, 0)
+        return dict((name, value or float(self.tiers[name]['initial'])) for name, value in zip(self.names, values))
+
+    def in_flight(self):
+        """ {tier: requests in flight on the host}, dropping the slots of dead processes """
+        totals = [0] * len(self.names)
+        for index in range(SLOTS):
+            owner, counts = self._read(index)
+            if owner == 0:
+                continue
+            if owner != os.getpid() and not _alive(owner):
+                self._write(index, 0, [0] * len(self.names))
+                continue
+            totals = [a + b for a, b in zip(totals, counts)]
+        return dict(zip(self.names, totals))
+
+    def acquire(self, tier):
+        """ take a slot of ``tier``, False when it is at its limit """
+        with self.locked():
+            index = self._own_slot()
+            if index is None:
+                # more processes than slots: don't shed what we can't count
+                return True
+            if self.in_flight()[tier] + 1 > self.limits()[tier]:
+                self.shed[tier] += 1
+                return False
+            pid, counts = self._read(index)
+            counts[self.names.index(tier)] += 1
+            self._write(index, pid, counts)
+            return True
+
+    def release(self, tier, latency):
+        """ give back a slot of ``tier`` and adapt its limit to ``latency`` """
+        options = self.tiers[tier]
+        with self.locked():
+            index = self._own_slot()
+            if index is None:
+                return
+            pid, counts = self._read(index)
+            position = self.names.index(tier)
+            counts[position] = max(0, counts[position] - 1)
+            self._write(index, pid, counts)
+
+            limits = self.limits()
+            limit = limits[tier]
+            if latency > options['target_latency']:
+                limit = max(float(options['min']), limit * options['backoff'])
+            else:
+                limit = min(float(options['max']), limit + 1.0 / limit)
+            limits[tier] = limit
+            self.header.pack_into(self.map, 0, *[limits[name] for name in self.names])
+
+    def own(self):
+        """ {tier: requests in flight in this process} """
+        if self.index is None:
+            return dict((name, 0) for name in self.names)
+        pid, counts = self._read(self.index)
+        return dict(zip(self.names, counts))
+
+
+_counters = {}
+
+
+def counters():
+    """ the SharedCounters of this process, opened after the fork """
+    pid = os.getpid()
+    if pid not in _counters:
+        _counters.clear()
+        path = getattr(django_settings, 'LOAD_SHEDDING_FILE', '/tmp/webizcafe-shedding')
+        _counters[pid] = SharedCounters(path, tiers())
+    return _counters[pid]
+
+
+def _gauge(values):
+    current = _counters.get(os.getpid())
+    if current is None:
+        return []
+    return [({'tier': tier}, value) for tier, value in values(current).items()]
+
+
+metrics.register_gauge('drf_shedding_in_flight', 'Requests in flight per cost tier.',
+                       lambda: _gauge(lambda c: c.own()))
+metrics.register_gauge('drf_shedding_shed_requests', 'Requests shed with 503 per cost tier.',
+                       lambda: _gauge(lambda c: c.shed))
+
+
+class _Release(object):
+    """ gives back the slot of a streaming response once it is consumed, on close() """
+
+    def __init__(self, tier, start):
+        self.admitted = (tier, start)
+
+    def close(self):
+        if self.admitted is not None:
+            tier, start = self.admitted
+            self.admitted = None
+            counters().release(tier, time.time() - start)
+
+
+class LoadSheddingMiddleware(object):
+    """
+    Admit or shed requests by the cost tier of their url name. Put it right
+    after RequestMetricsMiddleware so shed requests cost next to nothing.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(django_settings, 'LOAD_SHEDDING_ENABLED', False):
+            return None
+        match = getattr(request, 'resolver_match', None)
+        tier = tier_of(match.url_name if match else None)
+        if tier is None:
+            return None
+        shared = counters()
+        if not shared.acquire(tier):
+            response = HttpResponse(json.dumps({'detail': 'Server busy, retry later.'}),
+                                    status=503, content_type='application/json')
+            response['Retry-After'] = str(shared.tiers[tier]['retry_after'])
+            return response
+        request.shedding_tier = (tier, time.time())
+        return None
+
+    def process_response(self, request, response):
+        admitted = getattr(request, 'shedding_tier', None)
+        if admitted is not None:
+            del request.shedding_tier
+            release = _Release(*admitted)
+            if response.streaming:
+                # the work of a streaming response is done while the server consumes it
+                response._closable_objects.append(release)
+            else:
+                release.close()
+        return response
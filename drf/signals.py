@@ -0,0 +1,106 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from drf import bundles, events, facets, partitions, sync, trending
+from drf.jobs import enqueue
+from drf.models import Post, PostImage, Comment, Booking, Location, TrendingScore, SimilarPost
+from drf.tasks import create_booking_partition, generate_thumbnails, refresh_similar_posts
+
+
+@receiver(post_save, sender=PostImage)
+def queue_thumbnails(sender, instance, created, **kwargs):
+    if instance.image:
+        enqueue(generate_thumbnails, (instance.pk,), unique=True)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Location)
+def invalidate_facets(sender, **kwargs):
+    facets.invalidate()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=PostImage)
+@receiver(post_delete, sender=PostImage)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_bundle(sender, instance, **kwargs):
+    bundles.invalidate(instance.pk if sender is Post else instance.post_id)
+
+
+def record_change(sender, instance, **kwargs):
+    sync.record(instance)
+
+
+def record_tombstone(sender, instance, **kwargs):
+    sync.record(instance, deleted=True)
+
+
+for model in sync.SYNCED_MODELS:
+    post_save.connect(record_change, sender=model, dispatch_uid='sync_change_%s' % model.__name__)
+    post_delete.connect(record_tombstone, sender=model, dispatch_uid='sync_tombstone_%s' % model.__name__)
+
+
+@receiver(post_save, sender=Booking)
+def publish_booking_event(sender, instance, created, **kwargs):
+    host_id = Post.objects.filter(pk=instance.post_id).values_list('author_id', flat=True).first()
+    # an instance which was not loaded, e.g. Booking(pk=...), has no known previous status
+    previous = None if created else instance._initial_status or instance.status
+    channels, event = events.booking_event(instance, host_id, previous)
+    events.broker.publish(channels, event)
+    instance._initial_status = instance.status
+
+
+def _cached_post(instance):
+    # the Post of a comment or booking when it was loaded already, else None
+    return getattr(instance, Comment._meta.get_field('post').get_cache_name(), None)
+
+
+@receiver(post_save, sender=Comment)
+def record_comment_trending(sender, instance, created, **kwargs):
+    w = trending.weight('comment') if created else 0
+    if instance.rating and instance.rating != instance._initial_rating:
+        w += trending.weight('rating', instance.rating)
+    trending.record(instance.post_id, w, post=_cached_post(instance))
+    instance._initial_rating = instance.rating
+
+
+@receiver(post_save, sender=Booking)
+def record_booking_trending(sender, instance, created, **kwargs):
+    if created:
+        trending.record(instance.post_id, trending.weight('booking'), post=_cached_post(instance))
+
+
+@receiver(post_save, sender=Post)
+def move_trending_score(sender, instance, created, **kwargs):
+    if not created:
+        TrendingScore.objects.filter(post=instance.pk).exclude(
+            city=instance.city, posttype=instance.posttype).update(city=instance.city, posttype=instance.posttype)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def queue_similar_posts(sender, instance, **kwargs):
+    # comments change the average rating
+    enqueue(refresh_similar_posts, (instance.pk if sender is Post else instance.post_id,), unique=True)
+
+
+@receiver(pre_delete, sender=Post)
+def queue_similar_posts_of_neighbors(sender, instance, **kwargs):
+    # their lists lose this post with its SimilarPost rows
+    for post_id in SimilarPost.objects.filter(similar=instance.pk).values_list('post', flat=True):
+        enqueue(refresh_similar_posts, (post_id, False), unique=True)
+
+
+@receiver(pre_save, sender=Booking)
+def queue_booking_partition(sender, instance, **kwargs):
+    # the booking goes to the default partition meanwhile
+    if instance.begin and partitions.missing_partition(instance.begin):
+        month = partitions.month_of(instance.begin)
+        enqueue(create_booking_partition, (month.year, month.month), unique=True)
@@ -0,0 +1,160 @@
+"""
+Similar posts: for every post the ``SIMILAR_POSTS`` most similar other posts
+are kept in the ``SimilarPost`` table, so the similar posts endpoint is one
+indexed read of (post, rank).
+Candidates are the posts of the ``SIMILAR_CANDIDATES`` nearest locations (a
+KNN scan of the geography index), scored on distance, price and capacity
+closeness, same posttype and average rating with ``SIMILAR_WEIGHTS``.
+A changed post (drf/signals.py queues ``tasks.refresh_similar_posts``) gets
+its own list recomputed and is merged into the lists of its candidates (the
+score is symmetric but for the rating of the post listed). Nearest neighbors
+are not symmetric though: a post may belong in the list of a post that is no
+candidate of its own, and a post scoring lower than before may leave room for
+one that is not listed. Those lists are recomputed by jobs of their own.
+"""
+
+import math
+from collections import namedtuple
+
+from django.conf import settings as django_settings
+from django.db import connections, transaction
+from django.db.models import Avg
+
+from drf.jobs import enqueue
+from drf.models import Post, Comment, Location, SimilarPost
+from drf.tasks import refresh_similar_posts
+
+DEFAULT_WEIGHTS = {
+    'distance': 3.0,
+    'price': 1.0,
+    'capacity': 1.0,
+    'posttype': 2.0,
+    'rating': 1.0,
+}
+
+Features = namedtuple('Features', 'id posttype price capacity lat lng rating')
+
+
+def _setting(name, default):
+    return getattr(django_settings, 'SIMILAR_' + name, default)
+
+
+def distance_km(a, b):
+    """ great circle distance between the locations of two Features """
+    lat1, lng1, lat2, lng2 = map(math.radians, (a.lat, a.lng, b.lat, b.lng))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(min(1.0, math.sqrt(h)))
+
+
+def _closeness(a, b):
+    a, b = float(a), float(b)
+    if a == b:
+        return 1.0
+    return 1.0 - abs(a - b) / max(abs(a), abs(b))
+
+
+def pair_score(a, b):
+    """ the symmetric part of the similarity of two posts """
+    weights = dict(DEFAULT_WEIGHTS, **_setting('WEIGHTS', {}))
+    return (weights['distance'] * math.exp(-distance_km(a, b) / _setting('DISTANCE_KM', 5.0))
+            + weights['price'] * _closeness(a.price, b.price)
+            + weights['capacity'] * _closeness(a.capacity, b.capacity)
+            + weights['posttype'] * (a.posttype == b.posttype))
+
+
+def score(post, other):
+    """ how similar ``other`` is to ``post``; better rated posts come first among equals """
+    weights = dict(DEFAULT_WEIGHTS, **_setting('WEIGHTS', {}))
+    scale = getattr(django_settings, 'COMMENT_RATING_MAX', 5)
+    return pair_score(post, other) + weights['rating'] * min(other.rating or 0, scale) / float(scale)
+
+
+def candidates(post_id):
+    """ (Features of the post, [Features of the posts at its nearest locations]) """
+    post, location = Post._meta, Location._meta
+    # locations are stored as POINT(lat lng), see tasks.geocode_location; the
+    # nearest ones are found in meters on their geography, see drf/geo.py
+    sql = '''
+        WITH origin AS (
+            SELECT {location}.geography FROM {post} JOIN {location} ON {location}.id = {post}.location_id
+            WHERE {post}.id = %s
+        ), near AS (
+            SELECT id, ST_Centroid(geometry) AS center FROM {location}
+            ORDER BY geography <-> (SELECT geography FROM origin) LIMIT %s
+        )
+        SELECT {post}.id, {post}.posttype, {post}.price, {post}.capacity, ST_X(near.center), ST_Y(near.center)
+        FROM near JOIN {post} ON {post}.location_id = near.id
+        UNION
+        SELECT {post}.id, {post}.posttype, {post}.price, {post}.capacity,
+               ST_X(ST_Centroid({location}.geometry)), ST_Y(ST_Centroid({location}.geometry))
+        FROM {post} JOIN {location} ON {location}.id = {post}.location_id WHERE {post}.id = %s
+    '''.format(post=post.db_table, location=location.db_table)
+    cursor = connections[Post.objects.db].cursor()
+    try:
+        cursor.execute(sql, [post_id, _setting('CANDIDATES', 200), post_id])
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    ratings = dict(Comment.objects.filter(post__in=[row[0] for row in rows]).order_by()
+                   .values_list('post').annotate(Avg('rating')))
+    features = [Features(*row, rating=ratings.get(row[0])) for row in rows]
+    origin = [f for f in features if f.id == post_id]
+    if not origin:
+        return None, []
+    return origin[0], [f for f in features if f.id != post_id]
+
+
+def _write(lists):
+    """ replace the SimilarPost rows of every post in {post id: [(score, similar id), ...]} """
+    size = _setting('POSTS', 10)
+    rows = []
+    for post_id, scored in lists.items():
+        best = sorted(scored, key=lambda item: (-item[0], item[1]))[:size]
+        rows.extend(SimilarPost(post_id=post_id, similar_id=similar_id, rank=rank, score=value)
+                    for rank, (value, similar_id) in enumerate(best))
+    with transaction.atomic():
+        SimilarPost.objects.filter(post__in=list(lists)).delete()
+        SimilarPost.objects.bulk_create(rows, batch_size=1000)
+
+
+def refresh(post_id, merge=True):
+    """
+    Recompute the similar posts of ``post_id`` and, with ``merge``, insert it
+    into (or update it in) the lists of its candidates, queueing a refresh of
+    the lists it cannot merge into exactly. Returns the number of lists written.
+    """
+    post, others = candidates(post_id)
+    if post is None:
+        return 0
+    lists = {post_id: [(score(post, other), other.id) for other in others]}
+    if merge:
+        size = _setting('POSTS', 10)
+        nearby = set(other.id for other in others)
+        # posts listing this one without being among its candidates: it may
+        # still be one of theirs, only their own candidates tell
+        for owner in SimilarPost.objects.filter(similar=post_id).exclude(post__in=nearby).values_list('post', flat=True):
+            enqueue(refresh_similar_posts, (owner, False), unique=True)
+        current = {}
+        for owner, similar_id, value in SimilarPost.objects.filter(
+                post__in=list(nearby)).values_list('post', 'similar', 'score'):
+            current.setdefault(owner, []).append((value, similar_id))
+        for other in others:
+            listed = current.get(other.id, [])
+            rest = [item for item in listed if item[1] != post_id]
+            value = score(other, post)
+            if len(rest) == len(listed) and len(rest) >= size and value <= min(rest)[0]:
+                # not listed and not good enough to be
+                continue
+            if len(listed) >= size and any(item[1] == post_id and value < item[0] for item in listed):
+                # scores lower than before, an unlisted post may now be better
+                enqueue(refresh_similar_posts, (other.id, False), unique=True)
+            lists[other.id] = rest + [(value, post_id)]
+    _write(lists)
+    return len(lists)
+
+
+def similar_to(post_id, limit=None):
+    """ [(similar post id, score), ...] best first, one indexed read """
+    queryset = SimilarPost.objects.filter(post=post_id).order_by('rank').values_list('similar', 'score')
+    return list(queryset[:limit or _setting('POSTS', 10)])
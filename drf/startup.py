@@ -0,0 +1,106 @@
+"""
+Worker startup: import time measurement (``manage.py startuptime``) and
+preloading of the application in the gunicorn/uWSGI master, so the forked
+workers start with every module imported and the urlconf, middleware and
+REST framework settings resolved, sharing those pages copy-on-write.
+Only the standard library is imported here, so the timer sees everything else.
+"""
+
+import json
+import resource
+import sys
+import time
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+
+class ImportTimer(object):
+    """ wraps ``__import__`` and records (cumulative, own) seconds of every module loaded meanwhile """
+
+    def __init__(self):
+        self.stats = {}
+        self.stack = []
+        self.original = None
+
+    def install(self):
+        self.original = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        builtins.__import__ = self.original
+
+    def _import(self, name, *args, **kwargs):
+        loaded = len(sys.modules)
+        self.stack.append(0.0)
+        start = time.time()
+        try:
+            return self.original(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            children = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            if len(sys.modules) > loaded:
+                stats = self.stats.setdefault(name, [0.0, 0.0])
+                stats[0] += elapsed
+                stats[1] += elapsed - children
+
+    def ranked(self, limit=None):
+        """ [(module, cumulative, own), ...] slowest own time first """
+        rows = sorted(((name, cumulative, own) for name, (cumulative, own) in self.stats.items()),
+                      key=lambda row: -row[2])
+        return rows[:limit] if limit else rows
+
+
+def rss_kb():
+    """ resident set size of this process in kB """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def preload(application):
+    """ do the lazy work of the first request now, in the master process """
+    from django.core import urlresolvers
+    from django.db import connections
+    from rest_framework.settings import api_settings, IMPORT_STRINGS
+
+    if application._request_middleware is None:
+        application.load_middleware()
+    # imports every view of the urlconf
+    urlresolvers.get_resolver(None).reverse_dict
+    for name in IMPORT_STRINGS:
+        getattr(api_settings, name)
+    # never hand a database connection over to the forked workers
+    connections.close_all()
+
+
+def measure(limit=30):
+    """ start the WSGI application like a worker does, returns timings as a dict """
+    timer = ImportTimer()
+    timer.install()
+    start = time.time()
+    try:
+        from django.core.wsgi import get_wsgi_application
+        application = get_wsgi_application()
+        setup = time.time() - start
+        preload(application)
+    finally:
+        timer.uninstall()
+    return {
+        'setup_seconds': setup,
+        'total_seconds': time.time() - start,
+        'rss_kb': rss_kb(),
+        'modules': len(sys.modules),
+        'imports': timer.ranked(limit),
+    }
+
+
+if __name__ == '__main__':
+    # run in a fresh interpreter by `manage.py startuptime`
+    sys.stdout.write(json.dumps(measure(int(sys.argv[1]))))
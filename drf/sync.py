@@ -0,0 +1,89 @@
+"""
+Incremental delta sync of posts, comments and bookings for offline clients.
+Model save/delete hooks (drf/signals.py) record every change in the ``Change``
+table; ``changes_since(cursor)`` returns what changed after a client's high
+water mark, with tombstones for deleted objects.
+Sequence numbers are assigned at insert time but become visible at commit,
+so the returned cursor never moves past changes made less than
+``SYNC_SETTLE_SECONDS`` before now or before the oldest transaction still
+open (drf/db/activity.py), which may yet commit lower sequence numbers; those
+changes are simply sent again on the next call.
+"""
+
+from django.conf import settings as django_settings
+from django.db import transaction
+from django.utils import timezone
+
+from drf.db import activity
+from drf.models import Post, Comment, Booking, Change
+
+SYNCED_MODELS = {
+    Post: 'post',
+    Comment: 'comment',
+    Booking: 'booking',
+}
+
+
+def serializers():
+    from drf.serializers import PostSerializer, FlatCommentSerializer, BookingSerializer
+    return {
+        'post': (Post, PostSerializer),
+        'comment': (Comment, FlatCommentSerializer),
+        'booking': (Booking, BookingSerializer),
+    }
+
+
+def record(instance, deleted=False):
+    """ Move ``instance`` to the head of the change log """
+    model = SYNCED_MODELS[type(instance)]
+    with transaction.atomic():
+        Change.objects.filter(model=model, object_id=instance.pk).delete()
+        Change.objects.create(model=model, object_id=instance.pk, deleted=deleted)
+
+
+def record_many(model, pks, deleted=False):
+    """ like ``record`` for rows changed with ``QuerySet.update`` or removed in bulk, which sends no signals """
+    name = SYNCED_MODELS[model]
+    with transaction.atomic():
+        Change.objects.filter(model=name, object_id__in=pks).delete()
+        Change.objects.bulk_create([Change(model=name, object_id=pk, deleted=deleted, created=timezone.now())
+                                    for pk in pks])
+
+
+def changes_since(cursor, models=None, limit=500, context=None):
+    """
+    Returns {'cursor': next high water mark, 'has_more': bool, 'changes': [...]}
+    where every change is {'seq', 'model', 'id', 'deleted', 'data'}.
+    """
+    queryset = Change.objects.filter(pk__gt=cursor).order_by('pk')
+    if models:
+        queryset = queryset.filter(model__in=models)
+    rows = list(queryset[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    settled = activity.settled(Change, getattr(django_settings, 'SYNC_SETTLE_SECONDS', 2))
+    next_cursor = cursor
+    for row in rows:
+        if row.created > settled:
+            break
+        next_cursor = row.pk
+
+    data = {}
+    for name, (model, serializer_class) in serializers().items():
+        pks = [row.object_id for row in rows if row.model == name and not row.deleted]
+        if pks:
+            objects = model.objects.filter(pk__in=pks)
+            data[name] = dict((item['id'], item) for item in serializer_class(objects, many=True, context=context).data)
+
+    changes = []
+    for row in rows:
+        change = {'seq': row.pk, 'model': row.model, 'id': row.object_id, 'deleted': row.deleted}
+        if not row.deleted:
+            change['data'] = data.get(row.model, {}).get(row.object_id)
+            if change['data'] is None:
+                # deleted after this page was read, its tombstone follows later
+                continue
+        changes.append(change)
+
+    return {'cursor': next_cursor, 'has_more': has_more, 'changes': changes}
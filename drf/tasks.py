@@ -0,0 +1,59 @@
+"""
+Background tasks, queued with ``<task>.delay(...)`` and run by ``manage.py runjobs``.
+"""
+
+from datetime import date
+
+from geopy import geocoders
+from django.conf import settings as django_settings
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.mail import EmailMultiAlternatives, get_connection
+from sorl.thumbnail import get_thumbnail
+
+from drf.fields import HyperlinkedSorlImageField
+from drf.jobs import task
+from drf.models import Location, PostImage
+
+
+@task
+def geocode_location(location_id):
+    location = Location.objects.get(pk=location_id)
+    g = geocoders.GoogleV3(django_settings.GOOGLE_API_KEY)
+    res = g.geocode(location.address, exactly_one=False)
+    address, (lat, lng) = res[0]
+    location.geometry = GEOSGeometry('POINT(%f %f)' % (lat, lng))
+    location.save()
+
+
+@task
+def refresh_similar_posts(post_id, merge=True):
+    from drf import similar
+    similar.refresh(post_id, merge=merge)
+
+
+@task
+def create_booking_partition(year, month):
+    from drf import partitions
+    partitions.ensure([date(year, month, 1)])
+
+
+@task
+def generate_thumbnails(image_id):
+    """ Render every thumbnail size exposed by PostImageSerializer """
+    from drf.serializers import PostImageSerializer
+
+    image = PostImage.objects.get(pk=image_id)
+    if not image.image:
+        return
+    for field in PostImageSerializer().fields.values():
+        if isinstance(field, HyperlinkedSorlImageField):
+            get_thumbnail(image.image, field.geometry_string, **field.options)
+
+
+@task
+def send_email(subject, body, from_email, to, cc=None, bcc=None, reply_to=None, alternatives=None):
+    connection = get_connection(getattr(django_settings, 'JOBS_EMAIL_BACKEND', None))
+    message = EmailMultiAlternatives(subject, body, from_email, to, bcc=bcc, connection=connection, cc=cc, reply_to=reply_to)
+    for content, mimetype in alternatives or []:
+        message.attach_alternative(content, mimetype)
+    message.send()
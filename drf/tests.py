@@ -1,8 +1,41 @@
-from rest_framework import status
+import decimal
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import date, datetime, timedelta
+from collections import OrderedDict
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import resolve
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, transaction
+from django.db.models.signals import post_init
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import six, timezone
+from rest_framework import serializers, status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
-from drf.views import PostListCreateView
-from drf.models import Author, Post, Location, Comment
+import psycopg2
+from psycopg2 import extensions
+
+from drf import batch, benchmark, bundles, events, exports, geo, imports, jobs, metrics, partitions, profiling, routers, series, shedding, similar, trending
+from drf.startup import ImportTimer
+from drf.db import pool as db_pool
+from drf.db.pool import ConnectionPool, PooledConnection
+from drf.management.commands import checkindexes
+from drf.middleware import FieldProfilingMiddleware
+from drf.parsers import FastJSONParser
+from drf.renderers import FastJSONRenderer
+from drf.serializers import BookingSerializer
+from drf.views import BookingCalendarView, PostListCreateView
+from drf.models import Author, Post, PostImage, Location, Comment, Booking, Change, ExternalKey, Job
 
 
 class PostTests(APITestCase):
@@ -51,3 +84,1018 @@ class PostTests(APITestCase):
         self.assertEqual(Comment.objects.count(), 2)
 
 
+def failing_task(message):
+    raise ValueError(message)
+
+
+def noop_task(*args, **kwargs):
+    pass
+
+
+class JobTests(TestCase):
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = jobs.enqueue(failing_task, ('boom',), max_attempts=2)
+        self.assertEqual(jobs.execute(jobs.claim()), Job.QUEUED)
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(jobs.execute(jobs.claim()), Job.FAILED)
+        self.assertIsNone(jobs.claim())
+
+    def test_unique_job_is_queued_once(self):
+        first = jobs.enqueue(noop_task, (1,), unique=True)
+        second = jobs.enqueue(noop_task, (1,), unique=True)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(jobs.execute(jobs.claim()), Job.DONE)
+        self.assertIsNotNone(Job.objects.get(pk=first.pk).duration)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_percentile_and_compare(self):
+        self.assertIsNone(benchmark.percentile([], 50))
+        self.assertEqual(benchmark.percentile([4, 1, 3, 2], 50), 2)
+        self.assertEqual(benchmark.percentile([4, 1, 3, 2], 95), 4)
+        self.assertEqual(benchmark.percentile([7], 99), 7)
+
+        previous = {'endpoints': {'a': {'p95_ms': 10.0, 'queries': 3}, 'b': {'p95_ms': 10.0, 'queries': 3},
+                                  'c': {'p95_ms': 10.0, 'queries': 3}}}
+        current = {'endpoints': {'a': {'p95_ms': 10.5, 'queries': 3}, 'b': {'p95_ms': 12.0, 'queries': 3},
+                                 'c': {'p95_ms': 9.0, 'queries': 4}, 'new': {'p95_ms': 1.0, 'queries': 1}}}
+        self.assertEqual([(name, regressed) for name, before, after, change, regressed in
+                          benchmark.compare(previous, current, threshold=10.0)],
+                         [('a', False), ('b', True), ('c', True)])
+
+    def test_endpoints_of_generated_data(self):
+        names = dict(benchmark.endpoints())
+        self.assertIn('post-list-create', names)
+        self.assertNotIn('post-detail', names)
+
+        call_command('generatedata', authors=2, posts=1, images=1, comments=1, depth=2, bookings=2, stdout=six.StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 4)
+        names = dict(benchmark.endpoints())
+        self.assertEqual(names['post-detail'], '/api/v1/post/%d/' % Post.objects.order_by('pk')[0].pk)
+        self.assertEqual(names['bookingsearch-list'].split('?')[1], benchmark.QUERY_STRINGS['bookingsearch-list'])
+        for name in benchmark.SKIP:
+            self.assertNotIn(name, names)
+
+        results = benchmark.run(iterations=2, names=['post-detail'])
+        self.assertEqual(list(results['endpoints']), ['post-detail'])
+        self.assertEqual(results['endpoints']['post-detail']['status'], status.HTTP_200_OK)
+        self.assertEqual(results['counts']['Post'], 2)
+
+
+@override_settings(METRICS_DIR=tempfile.mkdtemp(), METRICS_SERVER_TIMING=True, METRICS_ALLOWED_IPS=None)
+class MetricsTests(APITestCase):
+
+    def test_request_is_recorded(self):
+        response = self.client.get('/api/v1/post/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('drf_db_queries_count{method="GET",view="post-list-create"}', response.content.decode('utf-8'))
+
+    def test_snapshot_name_is_per_process(self):
+        name = metrics.snapshot_name()
+        self.assertEqual(metrics.snapshot_name(), name)
+        # a worker forked from a preloading master
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write, metrics.snapshot_name().encode('ascii'))
+            finally:
+                os._exit(0)
+        os.close(write)
+        child = os.read(read, 200).decode('ascii')
+        os.close(read)
+        os.waitpid(pid, 0)
+        self.assertNotEqual(child, name)
+        self.assertTrue(child.startswith('metrics-%d-' % pid))
+        self.assertEqual(metrics.snapshot_name(), name)
+
+    @override_settings(METRICS_DIR=tempfile.mkdtemp())
+    def test_exited_workers_are_folded(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                metrics.observe('drf_db_queries', 3, view='exited')
+                metrics.flush(force=True)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        metrics.flush(force=True)
+        key = json.dumps([('view', 'exited')])
+        for scrape in range(2):
+            merged, gauges = metrics.collect()
+            self.assertEqual(merged['drf_db_queries']['values'][key]['count'], 1)
+        self.assertEqual(sorted(os.listdir(metrics.metrics_dir())),
+                         sorted(['.lock', metrics.EXITED, metrics.snapshot_name()]))
+
+
+class SlowField(serializers.IntegerField):
+
+    def to_representation(self, value):
+        time.sleep(0.005)
+        return value
+
+
+class ProfiledRoomSerializer(serializers.Serializer):
+    seats = SlowField()
+
+
+class ProfiledPostSerializer(serializers.Serializer):
+    title = serializers.CharField()
+    room = ProfiledRoomSerializer()
+
+
+@override_settings(SERIALIZER_PROFILING_MODULES=('drf.tests',))
+class FieldProfilingTests(TestCase):
+
+    def test_field_timings(self):
+        data = [{'title': 'a', 'room': {'seats': 2}}] * 3
+        with profiling.profile() as field_profile:
+            ProfiledPostSerializer(data, many=True).data
+        stats = field_profile.as_dict()
+        self.assertEqual(sorted(stats), ['ProfiledPostSerializer.room', 'ProfiledPostSerializer.room.seats',
+                                         'ProfiledPostSerializer.title'])
+        self.assertEqual(stats['ProfiledPostSerializer.room.seats']['calls'], 3)
+        self.assertGreaterEqual(stats['ProfiledPostSerializer.room.seats']['own_ms'], 15)
+        room = stats['ProfiledPostSerializer.room']
+        self.assertGreaterEqual(room['total_ms'], stats['ProfiledPostSerializer.room.seats']['total_ms'])
+        self.assertLess(room['own_ms'], 15)
+        self.assertEqual(field_profile.ranked()[0][0], 'ProfiledPostSerializer.room.seats')
+
+        # serializers built outside a profile are not timed
+        ProfiledPostSerializer(data, many=True).data
+        self.assertEqual(field_profile.as_dict()['ProfiledPostSerializer.title']['calls'], 3)
+
+    def test_middleware_only_profiles_when_enabled(self):
+        middleware = FieldProfilingMiddleware()
+        request = RequestFactory().get('/api/v1/post/', {'profile': 'fields'})
+        request.user = AnonymousUser()
+        with override_settings(DEBUG=False):
+            middleware.process_request(request)
+        self.assertFalse(hasattr(request, 'field_profile'))
+
+        request.user = Author(is_staff=True)
+        middleware.process_request(request)
+        self.assertIs(profiling._local.profile, request.field_profile)
+        middleware.process_response(request, HttpResponse())
+        self.assertIsNone(profiling._local.profile)
+
+        request = RequestFactory().get('/api/v1/post/')
+        request.user = Author(is_staff=True)
+        middleware.process_request(request)
+        self.assertFalse(hasattr(request, 'field_profile'))
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_READ_VIEWS=('post-list-create',))
+class ReplicaRouterTests(TestCase):
+
+    def route(self, request, url_name):
+        request.resolver_match = type('Match', (object,), {'url_name': url_name})()
+        middleware = routers.ReplicaRoutingMiddleware()
+        middleware.process_view(request, None, (), {})
+        db = routers.ReplicaRouter().db_for_read(Post)
+        return db, middleware.process_response(request, HttpResponse())
+
+    def test_reads_go_to_replica_until_client_writes(self):
+        factory = RequestFactory(HTTP_AUTHORIZATION='JWT abc')
+        self.assertEqual(self.route(factory.get('/api/v1/post/'), 'post-list-create')[0], 'replica1')
+        self.assertEqual(self.route(factory.get('/api/v1/me/'), 'author-detail')[0], 'default')
+
+        db, response = self.route(factory.post('/api/v1/post/'), 'post-list-create')
+        self.assertEqual(db, 'default')
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.route(factory.get('/api/v1/post/'), 'post-list-create')[0], 'default')
+        self.assertEqual(routers.ReplicaRouter().db_for_read(Post), 'default')
+
+
+class FakeConnection(object):
+    closed = False
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+
+    def test_connections_are_bounded_and_reused(self):
+        pool = ConnectionPool('test', size=1, timeout=0.01, health_check_interval=60, max_lifetime=60)
+        connect = lambda: PooledConnection(FakeConnection(), 'read committed')
+
+        first = pool.checkout(connect)
+        self.assertRaises(psycopg2.OperationalError, pool.checkout, connect)
+        pool.checkin(first.connection)
+        self.assertIs(pool.checkout(connect), first)
+        self.assertEqual(pool.stats['created'], 1)
+        self.assertEqual(pool.stats['timeouts'], 1)
+
+    def test_pool_follows_connection_settings(self):
+        settings_dict = {'NAME': 'webizcafe', 'HOST': 'db', 'OPTIONS': {}, 'POOL': {'SIZE': 1}}
+        connect = lambda: PooledConnection(FakeConnection(), 'read committed')
+        try:
+            pool = db_pool.get_pool('pooltest', settings_dict)
+            self.assertIs(db_pool.get_pool('pooltest', dict(settings_dict)), pool)
+            idle = pool.checkout(connect)
+            pool.checkin(idle.connection)
+
+            other = db_pool.get_pool('pooltest', dict(settings_dict, NAME='test_webizcafe'))
+            self.assertIsNot(other, pool)
+            self.assertTrue(idle.connection.closed)
+            busy = other.checkout(connect)
+            self.assertIsNot(busy, idle)
+
+            self.assertIsNot(db_pool.get_pool('pooltest', dict(settings_dict, OPTIONS={'sslmode': 'require'})), other)
+            other.checkin(busy.connection)
+            self.assertTrue(busy.connection.closed)
+        finally:
+            for key in [key for key in db_pool._pools if key[0] == 'pooltest']:
+                del db_pool._pools[key]
+
+
+SAMPLE_PLAN = json.loads('''[{"Plan": {
+    "Node Type": "Limit", "Total Cost": 52.1, "Plans": [
+        {"Node Type": "Nested Loop", "Parent Relationship": "Outer", "Plans": [
+            {"Node Type": "Index Scan", "Relation Name": "drf_post", "Index Name": "drf_post_author_updated_idx"},
+            {"Node Type": "Seq Scan", "Relation Name": "drf_location", "Filter": "(id = drf_post.location_id)"}
+        ]}
+    ]
+}}]''')
+
+
+class CheckIndexesTests(TestCase):
+
+    def test_seq_scans(self):
+        plan = SAMPLE_PLAN[0]['Plan']
+        self.assertEqual(checkindexes.seq_scans(plan), ['drf_location'])
+        del plan['Plans'][0]['Plans'][1]
+        self.assertEqual(checkindexes.seq_scans(plan), [])
+
+    def test_hot_paths_are_the_view_querysets(self):
+        self.assertRaises(CommandError, checkindexes.hot_paths)
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='explain', geometry=GEOSGeometry('POINT(39.9 116.4)'))
+        post = Post.objects.create(author=host, location=location, city='beijing', price=10, capacity=2)
+        Booking.objects.create(author=host, post=post, begin=timezone.now(), end=timezone.now())
+
+        paths = dict(checkindexes.hot_paths())
+        sql = str(paths['authorpost-list'].query)
+        self.assertIn('"drf_post"."author_id" = %d' % host.pk, sql)
+        self.assertIn('ORDER BY "drf_post"."updated" DESC LIMIT 1000', sql)
+        self.assertIn('"drf_comment"."parent_id" IS NULL', str(paths['postcomment-list'].query))
+        self.assertIn('"drf_post"."city" IN (beijing)', str(paths['post-list-create filter'].query))
+        self.assertEqual(list(paths['post distance filter']), [post])
+
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            sql, params = paths['authorpost-list'].query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            plan = (plan if isinstance(plan, list) else json.loads(plan))[0]['Plan']
+        self.assertEqual(checkindexes.seq_scans(plan), [])
+
+
+class PostFacetTests(APITestCase):
+
+    def test_facet_counts(self):
+        author = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        for i, (city, price, capacity) in enumerate([('beijing', 50, 4), ('beijing', 700, 30), ('shanghai', 60, 4)]):
+            location = Location.objects.create(address='facet %d' % i, geometry=GEOSGeometry('POINT(0 0)'))
+            Post.objects.create(author=author, location=location, city=city, price=price, capacity=capacity)
+
+        response = self.client.get('/api/v1/post/facets/', {'max_capacity': 10})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['city'], {'beijing': 1, 'shanghai': 1})
+        self.assertEqual(response.data['price']['0-100'], 2)
+
+        Post.objects.filter(city='shanghai').update(capacity=50)
+        Post.objects.get(city='shanghai').save()
+        response = self.client.get('/api/v1/post/facets/', {'max_capacity': 10})
+        self.assertEqual(response.data['count'], 1)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTests(APITestCase):
+
+    def test_changes_and_tombstones(self):
+        author = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='sync', geometry=GEOSGeometry('POINT(0 0)'))
+        post = Post.objects.create(author=author, location=location, price=10, capacity=2)
+        comment = Comment.objects.create(author=author, post=post, rating=5)
+
+        response = self.client.get('/api/v1/sync/', {'since': 0})
+        self.assertEqual([(c['model'], c['id']) for c in response.data['changes']],
+                         [('post', post.pk), ('comment', comment.pk)])
+        cursor = response.data['cursor']
+
+        comment_pk = comment.pk
+        comment.delete()
+        response = self.client.get('/api/v1/sync/', {'since': cursor})
+        self.assertEqual(response.data['changes'],
+                         [{'seq': response.data['cursor'], 'model': 'comment', 'id': comment_pk, 'deleted': True}])
+
+    def test_cursor_waits_for_open_transactions(self):
+        author = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='sync', geometry=GEOSGeometry('POINT(0 0)'))
+        other = psycopg2.connect(**connection.get_connection_params())
+        try:
+            # a change of a long transaction, committing after later ones were read
+            cursor = other.cursor()
+            cursor.execute("INSERT INTO %s (model, object_id, deleted, created) VALUES ('post', 0, false, now()) "
+                           "RETURNING id" % Change._meta.db_table)
+            pending, = cursor.fetchone()
+            time.sleep(0.01)
+            post = Post.objects.create(author=author, location=location, price=10, capacity=2)
+            response = self.client.get('/api/v1/sync/', {'since': pending - 1})
+            self.assertEqual([c['id'] for c in response.data['changes']], [post.pk])
+            self.assertLess(response.data['cursor'], pending)
+        finally:
+            other.rollback()
+            other.close()
+        response = self.client.get('/api/v1/sync/', {'since': pending - 1})
+        self.assertGreater(response.data['cursor'], pending)
+
+    def test_limit_must_be_positive(self):
+        for limit in ('0', '-2', 'x'):
+            response = self.client.get('/api/v1/sync/', {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, limit)
+
+
+@override_settings(EVENTS_TRANSPORT='local')
+class BookingEventTests(TestCase):
+
+    def test_status_transition_is_published_to_post_and_host(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        guest = Author.objects.create_user(username='guest', email='guest@example.com', password='test')
+        location = Location.objects.create(address='events', geometry=GEOSGeometry('POINT(0 0)'))
+        post = Post.objects.create(author=host, location=location, price=10, capacity=2)
+
+        channels = ['post:%s' % post.pk, 'author:%s' % host.pk]
+        subscription = events.broker.subscribe(channels)
+        try:
+            booking = Booking.objects.create(author=guest, post=post, begin=timezone.now(), end=timezone.now())
+            booking.status = 'confirmed'
+            booking.save()
+            self.assertEqual(subscription.get_nowait()['type'], 'booking.created')
+            event = subscription.get_nowait()
+            self.assertEqual((event['type'], event['previous_status']), ('booking.status', 'proposed'))
+
+            booking = Booking.objects.get(pk=booking.pk)
+            booking.status = 'cancelled'
+            booking.save()
+            event = subscription.get_nowait()
+            self.assertEqual((event['type'], event['previous_status']), ('booking.status', 'confirmed'))
+            self.assertTrue(subscription.empty())
+            # loading bookings runs no receivers
+            self.assertFalse(post_init.has_listeners(Booking))
+        finally:
+            events.broker.unsubscribe(channels, subscription)
+
+
+class BookingCalendarTests(APITestCase):
+
+    def test_feed_and_conditional_get(self):
+        author = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='ics', geometry=GEOSGeometry('POINT(0 0)'))
+        post = Post.objects.create(author=author, location=location, price=10, capacity=2)
+        Booking.objects.create(author=author, post=post, title='team, weekly', begin=timezone.now(), end=timezone.now())
+
+        url = '/api/v1/post/%d/booking/calendar.ics' % post.pk
+        response = self.client.get(url)
+        body = b''.join(response.streaming_content)
+        self.assertIn(b'SUMMARY:team\\, weekly\r\n', body)
+        self.assertIn(b'STATUS:TENTATIVE', body)
+
+        etag = response['ETag']
+        for header in (etag, '"other", %s' % etag, 'W/%s' % etag, '*'):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED, header)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, status.HTTP_200_OK)
+
+    def test_feed_must_name_its_bookings(self):
+        view = BookingCalendarView()
+        self.assertRaises(AssertionError, view.get_queryset)
+        self.assertRaises(AssertionError, view.get_calendar_name)
+
+
+class FastListSerializerTests(APITestCase):
+
+    def test_values_serializers_match_model_serializers(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        guest = Author.objects.create_user(username='guest', email='guest@example.com', password='test')
+        location = Location.objects.create(address='parity', geometry=GEOSGeometry('POINT(39.9 116.4)'))
+        post = Post.objects.create(author=host, location=location, title=u'caf\xe9', price='12.5', capacity=3)
+        other = Post.objects.create(author=host, location=location, content=None, price=7, capacity=1)
+        for p in (post, other):
+            for i in range(2):
+                comment = Comment.objects.create(author=guest, post=p, content='top %d' % i, rating=4)
+                for j in range(2):
+                    reply = Comment.objects.create(author=host, post=p, parent=comment, content='reply', rating=5)
+                Comment.objects.create(author=guest, post=p, parent=reply, rating=3)
+            for i in range(3):
+                Booking.objects.create(author=guest, post=p, begin=timezone.now(), end=timezone.now())
+        # updated rows move in the table, so unordered related lists would come out in another order
+        for model in (Comment, Booking):
+            for instance in model.objects.filter(post=post).order_by('pk')[:2]:
+                instance.save()
+        self.client.force_authenticate(user=host)
+
+        urls = ('/api/v1/post/', '/api/v1/me/post/', '/api/v1/post/%d/comment/' % post.pk, '/api/v1/me/comment/',
+                '/api/v1/post/%d/booking/' % post.pk, '/api/v1/me/booking/')
+        for url in urls:
+            with override_settings(FAST_LIST_SERIALIZERS=False):
+                expected = self.client.get(url)
+            with override_settings(FAST_LIST_SERIALIZERS=True):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = json.loads(response.content.decode('utf-8'))
+            self.assertGreater(len(data['results'] if isinstance(data, dict) else data), 1, url)
+            self.assertEqual(response.content, expected.content, url)
+
+
+class FastJSONTests(TestCase):
+
+    def test_renderer_matches_stock_renderer(self):
+        data = [OrderedDict((
+            ('title', u'caf\xe9 \u2028 "quoted"'),
+            ('price', '12.50'),
+            ('geometry', OrderedDict((('type', 'Point'), ('coordinates', (39.912345678, 116.4))))),
+            ('created', timezone.now()),
+            ('date', timezone.now().date()),
+            ('content', None),
+        ))]
+        for media_type in ('application/json', 'application/json; indent=4'):
+            self.assertEqual(FastJSONRenderer().render(data, media_type, {}), JSONRenderer().render(data, media_type, {}))
+
+    def test_decimal_is_exact(self):
+        content = FastJSONRenderer().render({'price': decimal.Decimal('12.50')})
+        self.assertEqual(content, b'{"price":12.50}')
+        self.assertEqual(FastJSONParser().parse(six.BytesIO(content)), {'price': 12.5})
+
+
+class StartupTests(TestCase):
+
+    def test_production_profile_is_lean(self):
+        from webizcafe.settings import production
+        self.assertFalse(production.DEBUG)
+        for app in ('django.contrib.admindocs', 'rest_framework_swagger', 'django_nose'):
+            self.assertNotIn(app, production.INSTALLED_APPS)
+        self.assertIn('drf', production.INSTALLED_APPS)
+
+    def test_import_timer_records_new_modules(self):
+        sys.modules.pop('colorsys', None)
+        timer = ImportTimer()
+        timer.install()
+        try:
+            import colorsys
+        finally:
+            timer.uninstall()
+        self.assertEqual([row[0] for row in timer.ranked()], ['colorsys'])
+
+
+class LoadSheddingTests(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self.tiers = {'heavy': dict(shedding.DEFAULT_TIER, initial=1, min=1, max=2, target_latency=0.1, retry_after=5)}
+
+    def test_limit_adapts_to_latency(self):
+        counters = shedding.SharedCounters(self.path, self.tiers)
+        self.assertTrue(counters.acquire('heavy'))
+        self.assertFalse(counters.acquire('heavy'))
+        counters.release('heavy', 0.01)
+        self.assertEqual(counters.limits()['heavy'], 2.0)
+        self.assertTrue(counters.acquire('heavy'))
+        self.assertTrue(counters.acquire('heavy'))
+        self.assertFalse(counters.acquire('heavy'))
+        counters.release('heavy', 1.0)
+        self.assertAlmostEqual(counters.limits()['heavy'], 1.8)
+        self.assertEqual(counters.in_flight(), {'heavy': 1})
+
+    def test_middleware_sheds_with_retry_after(self):
+        with override_settings(LOAD_SHEDDING_ENABLED=True, LOAD_SHEDDING_FILE=self.path, LOAD_SHEDDING_TIERS=self.tiers,
+                               LOAD_SHEDDING_ROUTES={'authorpost-list': 'heavy'}):
+            shedding._counters.clear()
+            middleware = shedding.LoadSheddingMiddleware()
+            first = RequestFactory().get('/api/v1/me/post/')
+            second = RequestFactory().get('/api/v1/me/post/')
+            first.resolver_match = second.resolver_match = resolve('/api/v1/me/post/')
+            self.assertIsNone(middleware.process_view(first, None, (), {}))
+            response = middleware.process_view(second, None, (), {})
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(response['Retry-After'], '5')
+            middleware.process_response(first, HttpResponse())
+            self.assertEqual(shedding.counters().in_flight(), {'heavy': 0})
+
+            # a streaming response holds its slot until it is consumed and closed
+            self.assertIsNone(middleware.process_view(second, None, (), {}))
+            response = middleware.process_response(second, StreamingHttpResponse(iter([b'a', b'b'])))
+            self.assertEqual(shedding.counters().in_flight(), {'heavy': 1})
+            self.assertEqual(b''.join(response.streaming_content), b'ab')
+            response.close()
+            response.close()
+            self.assertEqual(shedding.counters().in_flight(), {'heavy': 0})
+            shedding._counters.clear()
+
+
+@override_settings(BUNDLE_CACHE_SECONDS={}, BUNDLE_QUERY_BUDGET_STRICT=True)
+class PostBundleTests(APITestCase):
+
+    def setUp(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='bundle', geometry=GEOSGeometry('POINT(0 0)'))
+        self.post = Post.objects.create(author=host, location=location, price=10, capacity=2)
+        for rating in (5, 4, 4):
+            thread = Comment.objects.create(author=host, post=self.post, rating=rating)
+            reply = Comment.objects.create(author=host, post=self.post, parent=thread, rating=3)
+            Comment.objects.create(author=host, post=self.post, parent=reply, rating=3)
+        Booking.objects.create(author=host, post=self.post, begin=timezone.now(), end=timezone.now() + timedelta(days=1))
+        Booking.objects.create(author=host, post=self.post, begin=timezone.now() - timedelta(days=2),
+                               end=timezone.now() - timedelta(days=1))
+
+    def test_bundle_sections(self):
+        response = self.client.get('/api/v1/post/%d/bundle/' % self.post.pk, {'threads': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['post']['id'], self.post.pk)
+        comments = response.data['comments']
+        self.assertTrue(comments['has_more'])
+        self.assertEqual([thread['rating'] for thread in comments['threads']], [5, 4])
+        self.assertEqual(len(comments['threads'][0]['children'][0]['children']), 1)
+        self.assertEqual(len(response.data['bookings']), 1)
+        self.assertEqual(response.data['ratings']['count'], 9)
+        self.assertEqual(response.data['ratings']['distribution']['3'], 6)
+
+    @override_settings(COMMENT_RATING_MAX=5)
+    def test_ratings_outside_the_scale(self):
+        for rating in (9, 0):
+            Comment.objects.create(author=self.post.author, post=self.post, rating=rating)
+        ratings = bundles.ratings_section(self.post.pk)
+        self.assertEqual(list(ratings['distribution']), ['1', '2', '3', '4', '5'])
+        self.assertEqual((ratings['count'], ratings['average']), (10, 3.6))
+        self.assertEqual(ratings['distribution']['5'], 2)
+
+    def test_sizes_must_be_positive(self):
+        url = '/api/v1/post/%d/bundle/' % self.post.pk
+        for params in ({'threads': 0}, {'threads': -1}, {'bookings': -5}, {'bookings': 'x'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+        response = self.client.get(url, {'threads': 1, 'bookings': 500})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['comments']['threads']), 1)
+
+    def test_query_budget(self):
+        with self.assertRaises(bundles.QueryBudgetExceeded):
+            with bundles.QueryBudget(1, strict=True):
+                list(Post.objects.all())
+                list(Comment.objects.all())
+        with override_settings(BUNDLE_QUERY_BUDGET=2):
+            response = self.client.get('/api/v1/post/%d/bundle/' % self.post.pk)
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@override_settings(BATCH_CONCURRENCY=1)
+class BatchTests(APITestCase):
+
+    def test_batch(self):
+        # sub-requests run inline here: worker threads would not see the test transaction
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='batch', geometry=GEOSGeometry('POINT(0 0)'))
+        post = Post.objects.create(author=host, location=location, price=10, capacity=2)
+        self.client.force_authenticate(user=host)
+        response = self.client.post('/api/v1/batch/', {'requests': [
+            {'id': 'me', 'url': '/api/v1/me/'},
+            {'id': 'post', 'method': 'GET', 'url': '/api/v1/post/%d/' % post.pk},
+            {'id': 'create', 'method': 'POST', 'url': '/api/v1/post/'},
+            {'id': 'missing', 'url': '/api/v1/nowhere/'},
+            {'id': 'stream', 'url': '/api/v1/me/booking/stream/'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        responses = dict((item['id'], item) for item in response.data['responses'])
+        self.assertEqual(responses['me']['status'], 200)
+        self.assertEqual(responses['me']['body']['username'], 'host')
+        self.assertEqual(responses['post']['body']['id'], post.pk)
+        self.assertEqual(responses['create']['status'], 405)
+        self.assertEqual(responses['missing']['status'], 404)
+        self.assertEqual(responses['stream']['status'], 400)
+
+        with override_settings(BATCH_MAX_REQUESTS=1):
+            response = self.client.post('/api/v1/batch/', {'requests': [{'url': '/api/v1/me/'}] * 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_failing_sub_request_hides_the_error(self):
+        def execute(request, item):
+            raise DatabaseError('relation "secret" does not exist')
+        original, batch.execute = batch.execute, execute
+        try:
+            responses = batch.run(None, [{'id': 'broken', 'url': '/api/v1/me/'}])
+        finally:
+            batch.execute = original
+        self.assertEqual((responses[0]['status'], responses[0]['body']), (500, {'detail': 'Internal server error'}))
+
+
+@override_settings(TRENDING_REFRESH_SECONDS=0)
+class TrendingTests(APITestCase):
+
+    def test_board_and_decay(self):
+        board = trending.Board(2)
+        for post_id, w in ((1, 1.0), (2, 2.0), (3, 0.5), (1, 2.0)):
+            board.add(post_id, trending.log_score(w))
+        self.assertEqual(board.ranked(), [1, 2])
+        board.add(4, trending.log_score(5.0))
+        self.assertEqual(board.ranked(), [4, 1])
+
+        now = timezone.now()
+        with override_settings(TRENDING_HALF_LIFE=3600):
+            score = trending.log_add(trending.log_score(1.0, now - timedelta(hours=1)), trending.log_score(1.0, now))
+            self.assertAlmostEqual(trending.current(score, now), 1.5)
+
+    def test_rating_scale(self):
+        with override_settings(COMMENT_RATING_MAX=5, TRENDING_WEIGHTS={'rating': 2.0}):
+            self.assertEqual(trending.weight('rating', 5), 2.0)
+            self.assertEqual(trending.weight('rating', 10), 2.0)
+            self.assertEqual(trending.weight('rating', 1), 0.4)
+
+    def test_loaded_comments_remember_their_rating(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='rating', geometry=GEOSGeometry('POINT(0 0)'))
+        post = Post.objects.create(author=host, location=location, price=10, capacity=2)
+        comment = Comment.objects.create(author=host, post=post, rating=3)
+        self.assertEqual(comment._initial_rating, 3)
+        self.assertEqual(Comment.objects.get(pk=comment.pk)._initial_rating, 3)
+        self.assertIsNone(Comment(rating=4)._initial_rating)
+        # loading comments runs no receivers
+        self.assertFalse(post_init.has_listeners(Comment))
+
+    def test_failed_flush_keeps_pending(self):
+        class FailingCursor(object):
+            def execute(self, sql, params):
+                raise DatabaseError('flush failed')
+
+            def close(self):
+                pass
+
+        class FailingConnection(object):
+            in_atomic_block = False
+
+            def cursor(self):
+                return FailingCursor()
+
+        tracker = trending.Tracker()
+        tracker.record(1, 'paris', 'office', trending.log_score(1.0))
+        connections, trending.connections = trending.connections, {DEFAULT_DB_ALIAS: FailingConnection()}
+        try:
+            self.assertRaises(DatabaseError, tracker.flush)
+        finally:
+            trending.connections = connections
+        self.assertEqual(list(tracker.pending), [1])
+
+    def test_trending_ordering(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='trending', geometry=GEOSGeometry('POINT(0 0)'))
+        quiet, commented, booked = [Post.objects.create(author=host, location=location, price=10, capacity=2,
+                                                        city=city) for city in ('paris', 'paris', 'rome')]
+        Comment.objects.create(author=host, post=commented, rating=5)
+        Booking.objects.create(author=host, post=booked, begin=timezone.now(), end=timezone.now())
+
+        response = self.client.get('/api/v1/post/', {'ordering': 'trending'})
+        self.assertEqual([post['id'] for post in response.data['results']], [booked.pk, commented.pk])
+        response = self.client.get('/api/v1/post/', {'ordering': 'trending', 'city': 'paris'})
+        self.assertEqual([post['id'] for post in response.data['results']], [commented.pk])
+
+
+class SimilarPostTests(APITestCase):
+
+    def test_similar_posts(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        here = Location.objects.create(address='here', geometry=GEOSGeometry('POINT(39.90 116.40)'))
+        near = Location.objects.create(address='near', geometry=GEOSGeometry('POINT(39.91 116.41)'))
+        far = Location.objects.create(address='far', geometry=GEOSGeometry('POINT(31.23 121.47)'))
+        post = Post.objects.create(author=host, location=here, price=100, capacity=10)
+        twin = Post.objects.create(author=host, location=near, price=110, capacity=10)
+        remote = Post.objects.create(author=host, location=far, price=100, capacity=10)
+        other = Post.objects.create(author=host, location=near, price=900, capacity=80, posttype='meeting')
+        for pk in (post.pk, twin.pk, remote.pk, other.pk):
+            similar.refresh(pk)
+
+        response = self.client.get('/api/v1/post/%d/similar/' % post.pk)
+        self.assertEqual([item['post']['id'] for item in response.data], [twin.pk, remote.pk, other.pk])
+        self.assertGreater(response.data[0]['similarity'], response.data[1]['similarity'])
+
+        # merged into the neighbors' lists when it changes
+        post.price = 900
+        post.posttype = 'meeting'
+        post.save()
+        similar.refresh(post.pk)
+        self.assertEqual(similar.similar_to(other.pk)[0][0], post.pk)
+
+        self.assertEqual(self.client.get('/api/v1/post/0/similar/').status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/api/v1/post/%d/similar/' % post.pk, {'limit': -1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stale_lists_are_recomputed(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        here = Location.objects.create(address='here', geometry=GEOSGeometry('POINT(39.90 116.40)'))
+        far = Location.objects.create(address='far', geometry=GEOSGeometry('POINT(31.23 121.47)'))
+        post = Post.objects.create(author=host, location=here, price=100, capacity=10)
+        remote = Post.objects.create(author=host, location=far, price=100, capacity=10)
+        similar.refresh(remote.pk)
+        self.assertEqual(similar.similar_to(remote.pk)[0][0], post.pk)
+
+        # the remote post is no candidate of this one anymore, its own list decides
+        with override_settings(SIMILAR_CANDIDATES=0):
+            similar.refresh(post.pk)
+        self.assertEqual(similar.similar_to(remote.pk)[0][0], post.pk)
+        payloads = [json.loads(payload) for payload in
+                    Job.objects.filter(name='drf.tasks.refresh_similar_posts').values_list('payload', flat=True)]
+        self.assertIn([remote.pk, False], [payload['args'] for payload in payloads])
+
+
+class BookingPartitionTests(APITestCase):
+
+    def test_months(self):
+        self.assertEqual(partitions.add_months(date(2016, 11, 1), 3), date(2017, 2, 1))
+        self.assertEqual(partitions.add_months(date(2016, 1, 1), -1), date(2015, 12, 1))
+        eastern = timezone.get_fixed_timezone(-300)
+        self.assertEqual(partitions.month_of(datetime(2016, 10, 31, 22, tzinfo=eastern)), date(2016, 11, 1))
+
+    def test_partitions_and_pruning(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='partitions', geometry=GEOSGeometry('POINT(0 0)'))
+        post = Post.objects.create(author=host, location=location, price=10, capacity=2)
+        begin = timezone.now() + timedelta(days=3 * 365)
+        booking = Booking.objects.create(author=host, post=post, begin=begin, end=begin + timedelta(days=1))
+
+        month = partitions.month_of(begin)
+        self.assertEqual(partitions.ensure([month]), [month])
+        cursor = connection.cursor()
+        cursor.execute('SELECT id FROM %s' % partitions.partition_name(month))
+        self.assertEqual(cursor.fetchall(), [(booking.pk,)])
+        sql, params = partitions.overlapping(Booking.objects.all(), begin, begin).query.sql_with_params()
+        cursor.execute('EXPLAIN ' + sql, params)
+        plan = ' '.join(row[0] for row in cursor.fetchall())
+        self.assertIn(partitions.partition_name(month), plan)
+        self.assertNotIn(partitions.DEFAULT_PARTITION, plan)
+
+        serializer = BookingSerializer(data={'postid': post.pk, 'begin': begin, 'end': begin + timedelta(days=365)})
+        self.assertFalse(serializer.is_valid())
+
+
+class BookingSeriesTests(APITestCase):
+
+    def test_series(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='series', geometry=GEOSGeometry('POINT(0 0)'))
+        post = Post.objects.create(author=host, location=location, price=10, capacity=2)
+        begin = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        taken = Booking.objects.create(author=host, post=post, begin=begin + timedelta(days=7, hours=1),
+                                       end=begin + timedelta(days=7, hours=3))
+        self.client.force_authenticate(user=host)
+        data = {'postid': post.pk, 'title': 'weekly', 'begin': begin, 'end': begin + timedelta(hours=2),
+                'rrule': 'FREQ=WEEKLY;COUNT=4'}
+
+        response = self.client.post('/api/v1/booking/series/', dict(data, dry_run=True), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Booking.objects.count(), 1)
+
+        response = self.client.post('/api/v1/booking/series/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['created'], response.data['conflicts']), (3, 1))
+        self.assertEqual(response.data['occurrences'][1]['conflicts_with'], [taken.pk])
+        self.assertEqual(Booking.objects.filter(post=post, title='weekly').count(), 3)
+
+        response = self.client.post('/api/v1/booking/series/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        daily = dict(data, begin=begin + timedelta(days=60), end=begin + timedelta(days=61, hours=1),
+                     rrule='FREQ=DAILY;COUNT=3')
+        response = self.client.post('/api/v1/booking/series/', daily, format='json')
+        self.assertEqual([item['overlaps'] for item in response.data['occurrences']], [[], [1], []])
+
+    @unittest.skipIf(series.pytz is None, 'pytz is not installed')
+    @override_settings(TIME_ZONE='Europe/Paris')
+    def test_daylight_saving_changes(self):
+        paris = timezone.get_current_timezone()
+        # 02:30 is skipped on 2016-03-27 and repeated on 2016-10-30
+        begin = paris.localize(datetime(2016, 3, 26, 2, 30))
+        occurrences = series.expand('FREQ=DAILY;COUNT=3', begin, begin + timedelta(hours=1))
+        self.assertEqual([timezone.localtime(start).hour for start, end in occurrences], [2, 3, 2])
+        begin = paris.localize(datetime(2016, 10, 29, 2, 30))
+        occurrences = series.expand('FREQ=DAILY;COUNT=2', begin, begin + timedelta(hours=1))
+        self.assertEqual(occurrences[1][0] - occurrences[0][0], timedelta(hours=24))
+
+
+class BookingTransitionTests(APITestCase):
+
+    def test_compare_and_swap(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        guest = Author.objects.create_user(username='guest', email='guest@example.com', password='test')
+        location = Location.objects.create(address='transitions', geometry=GEOSGeometry('POINT(0 0)'))
+        post = Post.objects.create(author=host, location=location, price=10, capacity=2)
+        begin = timezone.now() + timedelta(days=1)
+        booking = Booking.objects.create(author=guest, post=post, begin=begin, end=begin + timedelta(days=1))
+        url = '/api/v1/booking/%s/' % booking.pk
+
+        self.client.force_authenticate(user=guest)
+        response = self.client.get(url)
+        self.assertEqual(response['ETag'], '"%s-1"' % booking.pk)
+        response = self.client.patch(url, {'status': 'confirmed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=host)
+        response = self.client.patch(url, {'status': 'confirmed'}, format='json', HTTP_IF_MATCH='"%s-1"' % booking.pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['version'], response['ETag']), (2, '"%s-2"' % booking.pk))
+        response = self.client.patch(url, {'status': 'cancelled'}, format='json', HTTP_IF_MATCH='"%s-1"' % booking.pk)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.patch(url, {'status': 'proposed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        self.client.force_authenticate(user=guest)
+        response = self.client.patch(url, {'title': 'stale', 'version': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.patch(url, {'title': 'moved', 'version': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Booking.objects.get(pk=booking.pk).version, 3)
+
+    def test_cancelled_booking_frees_its_dates(self):
+        host = Author.objects.create_user(username='host', email='host@example.com', password='test')
+        location = Location.objects.create(address='cancelled', geometry=GEOSGeometry('POINT(0 0)'))
+        post = Post.objects.create(author=host, location=location, price=10, capacity=2)
+        begin = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        end = begin + timedelta(hours=2)
+        booking = Booking.objects.create(author=host, post=post, begin=begin, end=end)
+        self.assertFalse(BookingSerializer(data={'postid': post.pk, 'begin': begin, 'end': end}).is_valid())
+        self.assertEqual(series.conflicts(post.pk, [(begin, end)]), [[booking.pk]])
+
+        booking.status = Booking.CANCELLED
+        booking.save()
+        self.assertTrue(BookingSerializer(data={'postid': post.pk, 'begin': begin, 'end': end}).is_valid())
+        self.assertEqual(series.conflicts(post.pk, [(begin, end)]), [[]])
+        ExternalKey.objects.create(source='partner', model='post', external_id='p1', object_id=post.pk)
+        bookings = tempfile.NamedTemporaryFile(suffix='.ndjson', delete=False)
+        bookings.write(json.dumps({'id': 'b1', 'post': 'p1', 'author': 'host',
+                                   'begin': begin.strftime('%Y-%m-%dT%H:%M:%S'),
+                                   'end': end.strftime('%Y-%m-%dT%H:%M:%S')}).encode('utf-8'))
+        bookings.close()
+        self.addCleanup(os.remove, bookings.name)
+        job = imports.run('partner', bookings=bookings.name)
+        self.assertEqual((job.report()['bookings created'], job.rejects), (1, []))
+
+
+class GeographyTests(APITestCase):
+
+    def test_backfill(self):
+        location = Location.objects.create(address='backfill', geometry=GEOSGeometry('POINT(59.9 10.7)'))
+        cursor = connection.cursor()
+        # a row from before migration 0013
+        cursor.execute('ALTER TABLE drf_location DISABLE TRIGGER drf_location_geography')
+        cursor.execute('UPDATE drf_location SET geography = NULL WHERE id = %s', [location.pk])
+        cursor.execute('ALTER TABLE drf_location ENABLE TRIGGER drf_location_geography')
+        call_command('backfillgeography', batch=1, stdout=six.StringIO())
+        cursor.execute('SELECT ST_X(geography::geometry), ST_Y(geography::geometry) FROM drf_location WHERE id = %s',
+                       [location.pk])
+        self.assertEqual(cursor.fetchone(), (10.7, 59.9))
+
+    def test_point(self):
+        point = geo.point(59.9, 10.7)
+        self.assertEqual((point.x, point.y, point.srid), (10.7, 59.9, 4326))
+        self.assertRaises(ValueError, geo.point, 116.4, 39.9)
+
+    def test_distance_in_meters(self):
+        author = Author.objects.create_user(username='geo', email='geo@example.com', password='test')
+        # 0.1 degree of longitude is about 5.6 km at 60N but 11.1 km at the equator
+        north = Location.objects.create(address='north', geometry=GEOSGeometry('POINT(60 10.1)'))
+        Location.objects.create(address='equator', geometry=GEOSGeometry('POINT(0 10.1)'))
+        Post.objects.create(author=author, location=north, price=10, capacity=2)
+
+        response = self.client.get('/api/v1/locations/within_distance_of_point/?point=60,10&dist=6000')
+        features = response.data['results']['features']
+        self.assertEqual([feature['properties']['address'] for feature in features], ['north'])
+        response = self.client.get('/api/v1/post/?point=0,10&dist=6000')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 0)
+        response = self.client.get('/api/v1/post/?point=60,10&dist=6000')
+        self.assertEqual(response.data['count'], 1)
+        response = self.client.get('/api/v1/post/?point=north')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportTests(APITestCase):
+
+    def write(self, suffix, text):
+        f = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+        f.write(text.encode('utf-8'))
+        f.close()
+        return f.name
+
+    def test_read(self):
+        path = self.write('.csv', u'id,price,address\n1,10,"a, b"\n2,\n3,12,caf\u00e9\n')
+        self.assertEqual(list(imports.read(path, ('id', 'address', 'lat'))), [
+            (2, [u'1', u'a, b', None], None), (3, None, 'expected 3 fields, found 2'), (4, [u'3', u'caf\u00e9', None], None)])
+        path = self.write('.ndjson', u'{"id": 1, "images": ["a.jpg", "b.jpg"]}\n\n{"id": \n')
+        self.assertEqual(list(imports.read(path, ('id', 'images'))), [
+            (1, [u'1', u'a.jpg|b.jpg'], None), (3, None, 'invalid JSON')])
+
+    def test_import(self):
+        Author.objects.create_user(username='partner', email='partner@example.com', password='test')
+        posts = self.write('.csv', u'id,title,price,capacity,city,address,lat,lng,images\n'
+                                   u'p1,desk,10.50,4,oslo,1 main street,59.9,10.7,a.jpg|b.jpg\n'
+                                   u'p2,room,cheap,4,oslo,2 main street,59.9,10.8,\n'
+                                   u'p3,studio,20,2,oslo,3 main street,,,\n')
+        geocode = self.write('.csv', u'address,lat,lng\n3 main street,59.8,10.6\n')
+        bookings = self.write('.ndjson', u'{"id": "b1", "post": "p1", "begin": "2016-03-01T10:00:00", "end": "2016-03-01T12:00:00"}\n'
+                                         u'{"id": "b2", "post": "p1", "begin": "2016-03-01T11:00:00", "end": "2016-03-01T13:00:00"}\n'
+                                         u'{"id": "b3", "post": "p9", "begin": "2016-03-02T11:00:00", "end": "2016-03-02T13:00:00"}\n')
+
+        job = imports.run('partner', posts=posts, bookings=bookings, geocode=geocode, default_author='partner')
+        report = job.report()
+        self.assertEqual((report['posts created'], report['locations created'], report['images imported']), (2, 2, 2))
+        self.assertEqual(report['bookings created'], 1)
+        self.assertEqual(sorted((line, reason) for name, line, reason in job.rejects),
+                         [(2, 'overlaps an earlier line'), (3, 'invalid price'), (3, 'unknown post')])
+        post = Post.objects.get(title='desk')
+        self.assertEqual(list(post.images.order_by('pk').values_list('image', flat=True)), ['a.jpg', 'b.jpg'])
+        self.assertEqual(post.location.geometry.x, 59.9)
+
+        job = imports.run('partner', posts=posts, default_author='partner')
+        self.assertEqual((job.report()['posts created'], job.report()['posts updated']), (0, 0))
+        self.assertEqual(PostImage.objects.filter(post=post).count(), 2)
+
+    def test_long_ids_are_rejected(self):
+        Author.objects.create_user(username='partner', email='partner@example.com', password='test')
+        posts = self.write('.csv', u'id,title,price,capacity,city,address,lat,lng\n'
+                                   u'%s,desk,10,4,oslo,1 main street,59.9,10.7\n'
+                                   u'p2,room,10,4,oslo,2 main street,59.9,10.8\n' % ('p' * 201))
+        job = imports.run('partner', posts=posts, default_author='partner')
+        self.assertEqual(job.report()['posts created'], 1)
+        self.assertEqual([(line, reason) for name, line, reason in job.rejects], [(2, 'id longer than 200 characters')])
+
+        with six.assertRaisesRegex(self, CommandError, 'longer than 50'):
+            call_command('importdata', '--source', 'p' * 51, '--posts', posts, stdout=six.StringIO())
+
+
+class ExportTests(APITestCase):
+
+    def test_encoders(self):
+        when = datetime(2016, 3, 1, 10, tzinfo=timezone.utc)
+        row = (1, u'caf\u00e9, "bar"', decimal.Decimal('10.50'), None, when)
+        self.assertEqual(exports._csv(('id',))(row), u'1,"caf\u00e9, ""bar""",10.50,,2016-03-01T10:00:00Z\r\n'.encode('utf-8'))
+        self.assertEqual(exports._ndjson(('id', 'title', 'price', 'content', 'updated'))(row),
+                         u'{"id":1,"title":"caf\u00e9, \\"bar\\"","price":10.50,"content":null,'
+                         u'"updated":"2016-03-01T10:00:00Z"}\n'.encode('utf-8'))
+        self.assertEqual(exports.parse_time('2016-03-01T10:00:00'), when)
+        self.assertRaises(ValueError, exports.parse_time, 'yesterday')
+
+    def test_export(self):
+        admin = Author.objects.create_user(username='admin', email='admin@example.com', password='test')
+        admin.is_staff = True
+        admin.save()
+        location = Location.objects.create(address='export', geometry=GEOSGeometry('POINT(59.9 10.7)'))
+        old = Post.objects.create(author=admin, location=location, price=10, capacity=2, title='old')
+        Post.objects.filter(pk=old.pk).update(updated=timezone.now() - timedelta(days=2))
+        Post.objects.create(author=admin, location=location, price=20, capacity=4, title='new')
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        until = (timezone.now() + timedelta(minutes=1)).isoformat()
+
+        self.client.force_authenticate(user=Author.objects.create_user(username='analyst', password='test'))
+        self.assertEqual(self.client.get('/api/v1/export/post/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=admin)
+        response = self.client.get('/api/v1/export/post/', {'until': until})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['old', 'new'])
+        response = self.client.get('/api/v1/export/post/', {'format': 'csv', 'since': since, 'until': until})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('id,author,location,title'))
+        response = self.client.get('/api/v1/export/location/', {'until': until})
+        geometry = GEOSGeometry(json.loads(b''.join(response.streaming_content).decode('utf-8'))['geometry'])
+        self.assertEqual((geometry.x, geometry.y), (59.9, 10.7))
+
+    @override_settings(EXPORT_SETTLE_SECONDS=0)
+    def test_until_waits_for_open_transactions(self):
+        other = psycopg2.connect(**connection.get_connection_params())
+        try:
+            cursor = other.cursor()
+            cursor.execute('SELECT now()')
+            started, = cursor.fetchone()
+            time.sleep(0.01)
+            self.assertLessEqual(exports.default_until(), started)
+        finally:
+            other.close()
+        self.assertGreater(exports.default_until(), started)
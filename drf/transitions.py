@@ -0,0 +1,122 @@
+"""
+Booking status transitions and optimistic concurrency.
+
+``status`` moves along ``TRANSITIONS``: the host (author of the post) confirms
+a proposed booking, either party cancels it, and cancelled bookings are
+final. The other fields are the guest's (author of the booking).
+Every write bumps ``Booking.version``. ``update`` writes with one
+compare-and-swap UPDATE on the version the booking was read at, so a
+concurrent change fails fast with 409 (or 412 when the client sent
+``If-Match``) instead of being overwritten, and no row lock is waited for.
+The ETag of a booking is ``"<id>-<version>"``.
+"""
+
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import exceptions, status
+
+from drf import bundles, events, partitions, sync
+from drf.jobs import enqueue
+from drf.models import Booking
+from drf.tasks import create_booking_partition
+
+GUEST = 'guest'
+HOST = 'host'
+
+# {status: {next status: roles allowed to move there}}
+TRANSITIONS = {
+    Booking.PROPOSED: {Booking.CONFIRMED: (HOST,), Booking.CANCELLED: (GUEST, HOST)},
+    Booking.CONFIRMED: {Booking.CANCELLED: (GUEST, HOST)},
+    Booking.CANCELLED: {},
+}
+
+
+class Conflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The booking was changed meanwhile, reload it.'
+
+
+class InvalidTransition(Conflict):
+    default_detail = 'Invalid status transition.'
+
+
+class PreconditionFailed(exceptions.APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The booking does not match If-Match, reload it.'
+
+
+def etag(booking):
+    return '"%s-%s"' % (booking.pk, booking.version)
+
+
+def etag_matches(header, tag):
+    """ whether an If-Match or If-None-Match ``header``, a list of tags or ``*``, names ``tag`` """
+    tags = [item.strip() for item in header.split(',')]
+    # tags name exact versions, so weak tags compare like strong ones
+    tags = [item[2:] if item.startswith('W/') else item for item in tags]
+    return '*' in tags or tag in tags
+
+
+def check_if_match(header, booking):
+    """ raise PreconditionFailed unless the If-Match ``header`` names the current version """
+    if not etag_matches(header, etag(booking)):
+        raise PreconditionFailed
+
+
+def roles(booking, user, host_id):
+    found = set()
+    if booking.author_id == user.pk:
+        found.add(GUEST)
+    if host_id == user.pk:
+        found.add(HOST)
+    return found
+
+
+def check(booking, changes, user, host_id):
+    """ raise unless ``user`` may apply ``changes`` (field: value) to ``booking`` """
+    if not changes:
+        return
+    allowed = roles(booking, user, host_id)
+    if booking.status == Booking.CANCELLED:
+        raise InvalidTransition('Cancelled bookings are final.')
+    if 'status' in changes:
+        new = changes['status']
+        if new not in TRANSITIONS:
+            raise InvalidTransition('Unknown status %s.' % new)
+        if new not in TRANSITIONS[booking.status]:
+            raise InvalidTransition('A %s booking can not become %s.' % (booking.status, new))
+        if not allowed & set(TRANSITIONS[booking.status][new]):
+            raise exceptions.PermissionDenied('Only the %s can make a booking %s.'
+                                              % (' or '.join(TRANSITIONS[booking.status][new]), new))
+    if set(changes) - set(['status']) and GUEST not in allowed:
+        raise exceptions.PermissionDenied('Only the guest can change the booking.')
+
+
+def update(booking, changes, host_id, precondition=False):
+    """
+    Write ``changes`` to ``booking`` if it still is at the version it was read
+    at, and apply them to the instance. Raises PreconditionFailed with
+    ``precondition`` (the client sent If-Match), Conflict otherwise.
+    """
+    previous_status = booking.status
+    now = timezone.now()
+    # begin is part of the key and bounds the partition to touch
+    written = Booking.objects.filter(pk=booking.pk, begin=booking.begin, version=booking.version).update(
+        version=F('version') + 1, updated=now, **changes)
+    if not written:
+        raise PreconditionFailed if precondition else Conflict
+    for name, value in changes.items():
+        setattr(booking, name, value)
+    booking.version += 1
+    booking.updated = now
+
+    # what the post_save hooks of drf/signals.py do, QuerySet.update sends no signals
+    sync.record_many(Booking, [booking.pk])
+    bundles.invalidate(booking.post_id)
+    channels, event = events.booking_event(booking, host_id, previous_status)
+    events.broker.publish(channels, event)
+    booking._initial_status = booking.status
+    if 'begin' in changes and partitions.missing_partition(booking.begin):
+        month = partitions.month_of(booking.begin)
+        enqueue(create_booking_partition, (month.year, month.month), unique=True)
+    return booking
@@ -0,0 +1,265 @@
+"""
+Trending posts: time decayed activity scores kept up to date by comment,
+rating and booking events (drf/signals.py) instead of aggregating comments
+and bookings on demand.
+
+Scores use forward decay: an event of weight w at time t adds
+w * exp(rate * (t - EPOCH)) to the score of its post, stored as a logarithm,
+so older scores never have to be decayed again and still compare correctly;
+``rate`` follows from ``TRENDING_HALF_LIFE`` (seconds).
+Every process adds events to its pending scores and to the boards it holds,
+bounded top-K rankings per (city, posttype) with '*' for any. Pending scores
+are written to the ``TrendingScore`` table every ``TRENDING_FLUSH_SECONDS``,
+and boards are reloaded from it (K rows of an index) every
+``TRENDING_REFRESH_SECONDS``, so the workers share one ranking.
+``manage.py trending`` rebuilds the table from history and prunes posts whose
+score decayed away.
+"""
+
+import atexit
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings as django_settings
+from django.db import connections, router
+from django.utils import timezone
+
+from drf.models import Post, Comment, Booking, TrendingScore
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(2016, 1, 1, tzinfo=timezone.utc)
+
+ANY = '*'
+
+DEFAULT_WEIGHTS = {
+    'comment': 1.0,
+    'rating': 1.0,
+    'booking': 3.0,
+}
+
+
+def _setting(name, default):
+    return getattr(django_settings, 'TRENDING_' + name, default)
+
+
+def rate():
+    """ decay rate per second """
+    return math.log(2) / _setting('HALF_LIFE', 24 * 3600)
+
+
+def weight(kind, rating=None):
+    weights = dict(DEFAULT_WEIGHTS, **_setting('WEIGHTS', {}))
+    if kind == 'rating':
+        # stars out of COMMENT_RATING_MAX, nothing counts for more than the maximum
+        scale = getattr(django_settings, 'COMMENT_RATING_MAX', 5)
+        return weights['rating'] * min(rating, scale) / float(scale)
+    return weights[kind]
+
+
+def log_score(w, when=None):
+    """ forward decayed logarithm of an event of weight ``w`` at ``when`` """
+    return math.log(w) + rate() * ((when or timezone.now()) - EPOCH).total_seconds()
+
+
+def log_add(a, b):
+    """ log(exp(a) + exp(b)) without overflow """
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def current(score, now=None):
+    """ the decayed score at ``now`` of a stored logarithm """
+    return math.exp(score - rate() * ((now or timezone.now()) - EPOCH).total_seconds())
+
+
+class Board(object):
+    """ the top ``size`` posts by score; adding to a full board evicts the lowest """
+
+    def __init__(self, size, rows=()):
+        self.size = size
+        self.scores = {}
+        self._ranked = None
+        for post_id, score in rows:
+            self.add(post_id, score)
+
+    def add(self, post_id, score):
+        if post_id in self.scores:
+            self.scores[post_id] = log_add(self.scores[post_id], score)
+        elif len(self.scores) < self.size:
+            self.scores[post_id] = score
+        else:
+            lowest = min(self.scores, key=self.scores.get)
+            if score <= self.scores[lowest]:
+                return
+            del self.scores[lowest]
+            self.scores[post_id] = score
+        self._ranked = None
+
+    def ranked(self):
+        """ post ids, highest score first """
+        if self._ranked is None:
+            self._ranked = sorted(self.scores, key=lambda post_id: (-self.scores[post_id], post_id))
+        return self._ranked
+
+
+def board_keys(city, posttype):
+    return ((city, posttype), (city, ANY), (ANY, posttype), (ANY, ANY))
+
+
+class Tracker(object):
+    """ pending scores and loaded boards of this process """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.boards = {}
+        self.flushed = time.time()
+
+    def _add_pending(self, post_id, score):
+        # with self.lock held
+        if post_id in self.pending:
+            self.pending[post_id] = log_add(self.pending[post_id], score)
+        else:
+            self.pending[post_id] = score
+
+    def record(self, post_id, city, posttype, score):
+        with self.lock:
+            self._add_pending(post_id, score)
+            for key in board_keys(city, posttype):
+                if key in self.boards:
+                    self.boards[key][1].add(post_id, score)
+            due = time.time() - self.flushed > _setting('FLUSH_SECONDS', 30)
+        # the scores of other requests would be lost with the caller's transaction if it rolled back;
+        # they wait for the next event recorded outside one, a board refresh or the exit
+        if due and not connections[router.db_for_write(TrendingScore)].in_atomic_block:
+            self.flush()
+
+    def flush(self):
+        """ add the pending scores to the TrendingScore table; they stay pending if that fails """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed = time.time()
+        if not pending:
+            return 0
+        table, post = TrendingScore._meta.db_table, Post._meta.db_table
+        values = ', '.join(['(%s, %s)'] * len(pending))
+        sql = '''
+            INSERT INTO {table} (post_id, city, posttype, score, updated)
+            SELECT post.id, post.city, post.posttype, pending.score, now()
+            FROM (VALUES {values}) AS pending (post_id, score)
+            JOIN {post} post ON post.id = pending.post_id
+            ON CONFLICT (post_id) DO UPDATE SET
+                score = GREATEST({table}.score, EXCLUDED.score)
+                        + LN(1 + EXP(-ABS({table}.score - EXCLUDED.score))),
+                city = EXCLUDED.city, posttype = EXCLUDED.posttype, updated = EXCLUDED.updated
+        '''.format(table=table, post=post, values=values)
+        params = []
+        for post_id, score in pending.items():
+            params.extend((post_id, score))
+        try:
+            cursor = connections[router.db_for_write(TrendingScore)].cursor()
+            try:
+                cursor.execute(sql, params)
+            finally:
+                cursor.close()
+        except Exception:
+            with self.lock:
+                for post_id, score in pending.items():
+                    self._add_pending(post_id, score)
+            raise
+        return len(pending)
+
+    def board(self, city=ANY, posttype=ANY):
+        key = (city, posttype)
+        with self.lock:
+            loaded = self.boards.get(key)
+        if loaded is None or time.time() - loaded[0] > _setting('REFRESH_SECONDS', 60):
+            self.flush()
+            queryset = TrendingScore.objects.all()
+            if city != ANY:
+                queryset = queryset.filter(city=city)
+            if posttype != ANY:
+                queryset = queryset.filter(posttype=posttype)
+            size = _setting('SIZE', 100)
+            rows = queryset.order_by('-score', 'post').values_list('post', 'score')[:size]
+            loaded = (time.time(), Board(size, rows))
+            with self.lock:
+                self.boards[key] = loaded
+        return loaded[1]
+
+    def top(self, city=ANY, posttype=ANY):
+        """ ids of the trending posts of a city and posttype, highest first """
+        return list(self.board(city, posttype).ranked())
+
+
+tracker = Tracker()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        tracker.flush()
+    except Exception:
+        logger.exception('could not flush trending scores')
+
+
+def record(post_id, w, when=None, post=None):
+    """ an event of weight ``w`` (see ``weight``) on a post, the Post itself if it is at hand """
+    if w <= 0:
+        return
+    if post is not None:
+        city, posttype = post.city, post.posttype
+    else:
+        row = Post.objects.filter(pk=post_id).values_list('city', 'posttype').first()
+        if row is None:
+            return
+        city, posttype = row
+    tracker.record(post_id, city, posttype, log_score(w, when))
+
+
+def rebuild(now=None):
+    """
+    Recompute all scores from the comments, ratings and bookings of the last
+    ``TRENDING_REBUILD_DAYS``, replacing the table. Returns the number of posts.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(days=_setting('REBUILD_DAYS', 30))
+    events = {}
+    for post_id, created, rating in Comment.objects.filter(created__gte=since).values_list('post', 'created', 'rating'):
+        events.setdefault(post_id, []).append(log_score(weight('comment'), created))
+        if rating:
+            events[post_id].append(log_score(weight('rating', rating), created))
+    for post_id, created in Booking.objects.filter(created__gte=since).values_list('post', 'created'):
+        events.setdefault(post_id, []).append(log_score(weight('booking'), created))
+
+    posts = dict((pk, (city, posttype)) for pk, city, posttype in
+                 Post.objects.filter(pk__in=list(events)).values_list('pk', 'city', 'posttype'))
+    scores = []
+    for post_id, logs in events.items():
+        if post_id not in posts:
+            continue
+        score = logs[0]
+        for event in logs[1:]:
+            score = log_add(score, event)
+        city, posttype = posts[post_id]
+        scores.append(TrendingScore(post_id=post_id, city=city, posttype=posttype, score=score, updated=now))
+
+    TrendingScore.objects.all().delete()
+    TrendingScore.objects.bulk_create(scores, batch_size=1000)
+    with tracker.lock:
+        tracker.boards.clear()
+    return len(scores)
+
+
+def prune(now=None):
+    """ delete the posts whose score decayed below ``TRENDING_MIN_SCORE`` """
+    threshold = math.log(_setting('MIN_SCORE', 0.01)) + rate() * ((now or timezone.now()) - EPOCH).total_seconds()
+    queryset = TrendingScore.objects.filter(score__lt=threshold)
+    deleted = queryset.count()
+    queryset.delete()
+    return deleted
@@ -1,10 +1,14 @@
+import time
+
 import django_filters
-from django.db import models
+from django.db import connection, models
+from django.http import Http404, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
 from django.db.models import Q
 from django.conf import settings as django_settings
 from django.contrib.auth.tokens import default_token_generator
 
-from rest_framework import permissions, mixins, renderers, status, response, generics, views, filters, pagination
+from rest_framework import permissions, mixins, renderers, serializers, status, response, generics, views, filters, pagination
 from rest_framework.reverse import reverse
 from rest_framework.decorators import detail_route
 from rest_framework.authtoken.models import Token
@@ -16,8 +20,15 @@ from rest_framework_gis.pagination import GeoJsonPagination
 
 from drf.models import Author, Post, PostImage, Comment, Booking, Location, BoxedLocation
 from drf.serializers import AuthorSerializer, PostSerializer, PostImageSerializer, CommentSerializer, BookingSerializer
+from drf.serializers import BookingSeriesSerializer
 from drf.serializers import LocationSerializer, BoxedLocationSerializer
-from drf.permissions import IsAuthorOrReadOnly
+from drf.fastserializers import PostValuesSerializer, CommentValuesSerializer, BookingValuesSerializer
+from drf.permissions import IsAuthorOrReadOnly, IsBookingPartyOrReadOnly
+from drf import batch, bundles, events, exports, facets, ical, partitions, series, similar, sync, transitions, trending
+from drf.renderers import CalendarRenderer, CSVRenderer, NDJSONRenderer
+from drf.geo import DistanceFilter
+from drf.jobs import enqueue
+from drf.tasks import refresh_similar_posts
 
 class APIRootView(views.APIView):
     """
@@ -88,6 +99,25 @@ class AuthorDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Response({'status': 'password reset'})
    
 
+class ValuesListMixin(object):
+    """
+    list() built from .values() rows by ``values_serializer_class`` (see
+    drf/fastserializers.py) instead of model instances, when the
+    FAST_LIST_SERIALIZERS setting is on
+    """
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if self.values_serializer_class is None or not getattr(django_settings, 'FAST_LIST_SERIALIZERS', False):
+            return super(ValuesListMixin, self).list(request, *args, **kwargs)
+        serializer = self.values_serializer_class(context=self.get_serializer_context())
+        rows = serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
+
+
 class ListFilter(django_filters.CharFilter):
     def sanitize(self, value_list):
         return [v for v in value_list if v != u'']
@@ -117,21 +147,131 @@ class PostFilter(django_filters.FilterSet):
         fields = ['posttype', 'city', 'min_price', 'max_price', 'min_capacity', 'max_capacity', 'min_rating', 'latest_updated']
 
 
-class PostListCreateView(generics.ListCreateAPIView):
+class PostListCreateView(ValuesListMixin, generics.ListCreateAPIView):
     """
     List and Create post endpoint
+    query params: ordering=trending lists the posts with the most recent
+    comments, ratings and bookings first; point=<lat>,<lng> and dist (meters)
+    the posts located within dist of point
     Allowed request method: Get (list), Post (create)
     """
     queryset = Post.objects.all()
     serializer_class = PostSerializer
+    values_serializer_class = PostValuesSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
-    filter_backends = (filters.DjangoFilterBackend, filters.SearchFilter,)
+    filter_backends = (filters.DjangoFilterBackend, filters.SearchFilter, DistanceFilter,)
+    distance_filter_field = 'location__geography'
     filter_class = PostFilter
     search_fields= ('title', 'content', 'comment__content')
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('ordering') == 'trending':
+            response = self.trending(request)
+        else:
+            response = super(PostListCreateView, self).list(request, *args, **kwargs)
+        if request.query_params.get('facets') and isinstance(response.data, dict):
+            response.data['facets'] = facets.cached_count(self.filter_queryset(self.get_queryset()), request.query_params)
+        return response
+
+    def trending(self, request):
+        """
+        the filtered posts among the trending ones (drf/trending.py), best
+        first; the board is the one of the city and posttype filtered on, if
+        a single one is, so this costs O(TRENDING_SIZE) whatever the table size
+        """
+        board = [values[0] if len(values) == 1 else trending.ANY
+                 for values in (request.query_params.get(name, '').split(',') for name in ('city', 'posttype'))]
+        ranked = trending.tracker.top(*board)
+        rank = dict((pk, position) for position, pk in enumerate(ranked))
+        queryset = self.filter_queryset(self.get_queryset()).filter(pk__in=ranked).order_by()
+        if getattr(django_settings, 'FAST_LIST_SERIALIZERS', False):
+            serializer = self.values_serializer_class(context=self.get_serializer_context())
+            rows = sorted(serializer.values(queryset), key=lambda row: rank[row['id']])
+            serialize = serializer.serialize
+        else:
+            rows = sorted(queryset, key=lambda post: rank[post.pk])
+            serialize = lambda page: self.get_serializer(page, many=True).data
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize(page))
+        return Response(serialize(rows))
+
+
+class PostFacetView(generics.GenericAPIView):
+    """
+    Post search facet counts endpoint
+    counts per city, posttype, price and capacity bucket for the PostFilter
+    parameters given (same as the post list, or add facets=1 to the post list)
+    Allowed request method: Get
+    """
+    queryset = Post.objects.all()
+    permission_classes = (permissions.AllowAny,)
+    filter_backends = PostListCreateView.filter_backends
+    distance_filter_field = PostListCreateView.distance_filter_field
+    filter_class = PostFilter
+    search_fields = PostListCreateView.search_fields
+
+    def get(self, request, format=None):
+        return Response(facets.cached_count(self.filter_queryset(self.get_queryset()), request.query_params))
+
+
+class PostBundleView(views.APIView):
+    """
+    Post page bundle endpoint: post with images and location, the first
+    ``threads`` top-level comment threads, the next ``bookings`` upcoming
+    bookings and rating aggregates, within a fixed query budget
+    query params: threads (default 10, max 50), bookings (default 20, max 100)
+    Allowed request method: Get
+    """
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request, pk, format=None):
+        try:
+            # None for the defaults of drf/bundles.py
+            threads = min(int(request.query_params['threads']), 50) if 'threads' in request.query_params else None
+            bookings = min(int(request.query_params['bookings']), 100) if 'bookings' in request.query_params else None
+        except ValueError:
+            return Response({'detail': 'threads and bookings must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if (threads is not None and threads < 1) or (bookings is not None and bookings < 1):
+            return Response({'detail': 'threads and bookings must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        context = {'request': request, 'format': format, 'view': self}
+        return Response(bundles.build(int(pk), context, threads=threads, bookings=bookings))
+
+
+class PostSimilarView(views.APIView):
+    """
+    Similar posts endpoint: nearby posts of close price and capacity, same
+    posttype and good ratings first, read from the precomputed SimilarPost
+    table (drf/similar.py)
+    query params: limit (default and max SIMILAR_POSTS)
+    Allowed request method: Get
+    """
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request, pk, format=None):
+        size = getattr(django_settings, 'SIMILAR_POSTS', 10)
+        try:
+            limit = min(int(request.query_params.get('limit', size)), size)
+        except ValueError:
+            return Response({'detail': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'detail': 'limit must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        ranked = similar.similar_to(int(pk), limit)
+        if not ranked:
+            if not Post.objects.filter(pk=pk).exists():
+                raise Http404
+            # not computed yet, e.g. created before the table was
+            enqueue(refresh_similar_posts, (int(pk),), unique=True)
+            return Response([])
+        serializer = PostValuesSerializer({'request': request, 'format': format, 'view': self})
+        rows = list(serializer.values(Post.objects.filter(pk__in=[post_id for post_id, score in ranked])))
+        posts = dict((row['id'], item) for row, item in zip(rows, serializer.serialize(rows)))
+        return Response([{'similarity': round(score, 4), 'post': posts[post_id]}
+                         for post_id, score in ranked if post_id in posts])
+
 
 class LargeResultsSetPagination(pagination.PageNumberPagination):
     page_size = 1000
@@ -139,12 +279,13 @@ class LargeResultsSetPagination(pagination.PageNumberPagination):
     max_page_size = 10000
 
 
-class AuthorPostListView(generics.ListAPIView):
+class AuthorPostListView(ValuesListMixin, generics.ListAPIView):
     """
     List and Create post endpoint
     Allowed request method: Get (list)
     """
     serializer_class = PostSerializer
+    values_serializer_class = PostValuesSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = LargeResultsSetPagination
     def get_queryset(self):
@@ -200,23 +341,25 @@ class CommentCreateView(generics.CreateAPIView):
         return serializer.save(author=self.request.user, post=post)
 
 
-class PostCommentListView(generics.ListAPIView):
+class PostCommentListView(ValuesListMixin, generics.ListAPIView):
     """
     List Post Comment endpoint
     Allowed request method: Get
     """
     serializer_class = CommentSerializer
+    values_serializer_class = CommentValuesSerializer
     permission_classes = (permissions.AllowAny,)
     def get_queryset(self):
         return Comment.objects.filter(post__pk=self.kwargs['pk'], parent=None)
 
 
-class AuthorCommentListView(generics.ListAPIView):
+class AuthorCommentListView(ValuesListMixin, generics.ListAPIView):
     """
     List Post Booking endpoint
     Allowed request method: Get
     """
     serializer_class = CommentSerializer
+    values_serializer_class = CommentValuesSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = LargeResultsSetPagination
     def get_queryset(self):
@@ -248,56 +391,300 @@ class BookingCreateView(generics.CreateAPIView):
         return serializer.save(author=self.request.user, post=post)
 
 
-class PostBookingListView(generics.ListAPIView):
+class BookingSeriesCreateView(views.APIView):
+    """
+    Create a recurring booking series endpoint
+    request body: postid, title, begin and end of the first occurrence, rrule
+    (e.g. FREQ=WEEKLY;COUNT=10) and dry_run to only get the report
+    response: created and conflicts counts and the status, booking id and
+    conflicts of every occurrence; 409 when none could be booked
+    Allowed request method: Post
+    """
+    permission_classes = [permissions.IsAuthenticated,]
+
+    def post(self, request, format=None):
+        serializer = BookingSeriesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            report = series.book(request.user, data['postid'], data['title'], data['occurrences'], data['dry_run'])
+        except Post.DoesNotExist:
+            raise Http404
+        if data['dry_run']:
+            code = status.HTTP_200_OK
+        elif report['created']:
+            code = status.HTTP_201_CREATED
+        else:
+            code = status.HTTP_409_CONFLICT
+        return Response(report, status=code)
+
+
+def booking_window(queryset, params):
+    """
+    the bookings of ``queryset`` ending after the ``from`` and beginning
+    before the ``to`` query parameters, which only read the booking
+    partitions of those months (drf/partitions.py)
+    """
+    field = serializers.DateTimeField()
+    if params.get('from'):
+        queryset = partitions.ending_after(queryset, field.to_internal_value(params['from']))
+    if params.get('to'):
+        queryset = queryset.filter(begin__lt=field.to_internal_value(params['to']))
+    return queryset
+
+
+class PostBookingListView(ValuesListMixin, generics.ListAPIView):
     """
     List Post Booking endpoint
+    query params: from, to (datetimes) to list the bookings of that time only
     Allowed request method: Get
     """
     serializer_class = BookingSerializer
+    values_serializer_class = BookingValuesSerializer
     permission_classes = (permissions.AllowAny,)
     def get_queryset(self):
-        return Booking.objects.filter(post__pk=self.kwargs['pk'])
+        return booking_window(Booking.objects.filter(post__pk=self.kwargs['pk']), self.request.query_params)
 
 
-class AuthorBookingListView(generics.ListAPIView):
+class AuthorBookingListView(ValuesListMixin, generics.ListAPIView):
     """
     List Post Booking endpoint
+    query params: from, to (datetimes) to list the bookings of that time only
     Allowed request method: Get
     """
     serializer_class = BookingSerializer
+    values_serializer_class = BookingValuesSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = LargeResultsSetPagination
     def get_queryset(self):
         user = self.request.user
-        return Booking.objects.filter(author=user).order_by('-updated')
+        return booking_window(Booking.objects.filter(author=user), self.request.query_params).order_by('-updated')
+
+
+def event_stream_response(channels):
+    # don't hold a pooled database connection for the lifetime of the stream
+    connection.close()
+    response = StreamingHttpResponse(events.stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class PostBookingStreamView(views.APIView):
+    """
+    Post Booking event stream endpoint (server-sent events)
+    events: booking.created, booking.updated, booking.status
+    Allowed request method: Get
+    """
+    permission_classes = (permissions.AllowAny,)
 
+    def get(self, request, pk, format=None):
+        return event_stream_response(['post:%s' % pk])
 
-class BookingSearchView(generics.ListAPIView):
+
+class AuthorBookingStreamView(views.APIView):
+    """
+    Booking event stream of the current user, as guest and as host (server-sent events)
+    events: booking.created, booking.updated, booking.status
+    Allowed request method: Get
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, format=None):
+        return event_stream_response(['author:%s' % request.user.pk])
+
+
+class BookingCalendarView(generics.GenericAPIView):
+    """
+    Base of the streamed iCalendar booking feeds, answering conditional GETs
+    (If-None-Match / If-Modified-Since) with 304 from one aggregate query;
+    feeds set or override ``queryset`` and ``calendar_name``
+    """
+    renderer_classes = (CalendarRenderer, renderers.JSONRenderer)
+    calendar_name = None
+
+    def get_calendar_name(self):
+        assert self.calendar_name is not None, (
+            "'%s' should either include a `calendar_name` attribute, "
+            "or override the `get_calendar_name()` method." % self.__class__.__name__
+        )
+        return self.calendar_name
+
+    def get(self, request, format=None, **kwargs):
+        queryset = ical.window(self.get_queryset())
+        etag, last_modified = ical.version(queryset)
+        modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if transitions.etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag) or (
+                'HTTP_IF_NONE_MATCH' not in request.META and modified_since and last_modified and
+                ical.timestamp(last_modified) <= modified_since):
+            response = HttpResponseNotModified()
+        else:
+            response = StreamingHttpResponse(ical.feed(queryset, self.get_calendar_name()),
+                                             content_type='text/calendar; charset=utf-8')
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(ical.timestamp(last_modified))
+        return response
+
+
+class PostBookingCalendarView(BookingCalendarView):
+    """
+    Post Booking iCalendar feed endpoint
+    Allowed request method: Get
+    """
+    permission_classes = (permissions.AllowAny,)
+
+    def get_queryset(self):
+        return Booking.objects.filter(post__pk=self.kwargs['pk'])
+
+    def get_calendar_name(self):
+        return 'webizcafe post %s bookings' % self.kwargs['pk']
+
+
+class AuthorBookingCalendarView(BookingCalendarView):
+    """
+    iCalendar feed of the current user's bookings
+    Allowed request method: Get
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Booking.objects.filter(author=self.request.user)
+
+    def get_calendar_name(self):
+        return 'webizcafe bookings of %s' % self.request.user.username
+
+
+class BookingSearchView(ValuesListMixin, generics.ListAPIView):
     """
     booking datetime list endpoint
     request method: Get (to list all booking datetime)
     search field: timefrom and timeto
     """
     serializer_class = BookingSerializer
+    values_serializer_class = BookingValuesSerializer
 
     def get_queryset(self):
         queryset = Booking.objects.all()
         timefrom = self.request.query_params.get('from', None)
         timeto = self.request.query_params.get('to', None)
         if timefrom is not None and timeto is not None:
-            queryset = queryset.filter( Q(end__lte=timefrom) | Q(begin_gte=timeto) )
+            queryset = queryset.filter( Q(end__lte=timefrom) | Q(begin__gte=timeto) )
         return queryset
 
 
 class BookingDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, Update, and Delete booking endpoint
-    Allowed request method: Get, Post, Delete
+    responses carry the ETag of the booking version; updates are written with
+    compare and swap on the version read (drf/transitions.py), so concurrent
+    changes fail with 409, or with 412 when If-Match no longer matches.
+    The host confirms, either party cancels, the guest edits and deletes.
+    Allowed request method: Get, Put, Patch, Delete
     """
-    queryset = Booking.objects.all()
+    queryset = Booking.objects.select_related('post')
     serializer_class = BookingSerializer
-    permission_classes = [IsAuthorOrReadOnly]
+    permission_classes = [IsBookingPartyOrReadOnly]
+
+    def booking_response(self, booking):
+        response = Response(self.get_serializer(booking).data)
+        response['ETag'] = transitions.etag(booking)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.booking_response(self.get_object())
+
+    def update(self, request, *args, **kwargs):
+        booking = self.get_object()
+        precondition = 'HTTP_IF_MATCH' in request.META
+        if precondition:
+            transitions.check_if_match(request.META['HTTP_IF_MATCH'], booking)
+        elif hasattr(request.data, 'get') and request.data.get('version') not in (None, ''):
+            if str(request.data['version']) != str(booking.version):
+                raise transitions.Conflict
+        serializer = self.get_serializer(booking, data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        changes = dict((name, value) for name, value in serializer.validated_data.items()
+                       if getattr(booking, name) != value)
+        transitions.check(booking, changes, request.user, booking.post.author_id)
+        if changes:
+            transitions.update(booking, changes, booking.post.author_id, precondition)
+        return self.booking_response(booking)
+
+    def perform_destroy(self, instance):
+        if 'HTTP_IF_MATCH' in self.request.META:
+            transitions.check_if_match(self.request.META['HTTP_IF_MATCH'], instance)
+        instance.delete()
+
+
+
+class SyncView(views.APIView):
+    """
+    Delta sync endpoint for offline clients
+    returns posts, comments and bookings created, updated or deleted since the
+    high water mark ``since`` (0 for a full sync), ``cursor`` is the next one
+    query params: since, models (comma separated post,comment,booking), limit
+    Allowed request method: Get
+    """
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request, format=None):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(int(request.query_params.get('limit', 500)), 5000)
+        except ValueError:
+            return Response({'detail': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'detail': 'limit must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        models = [m for m in request.query_params.get('models', '').split(',') if m]
+        return Response(sync.changes_since(since, models=models, limit=limit, context={'request': request}))
+
+
+class BatchView(views.APIView):
+    """
+    Batch endpoint: runs read sub-requests against the other endpoints
+    concurrently, authenticated as the batch request
+    request body: {"requests": [{"id": "posts", "method": "GET", "url": "/api/v1/me/post/"}, ...]}
+    response: {"responses": [{"id", "method", "url", "status", "duration_ms", "body"}, ...], "duration_ms"}
+    Allowed request method: Post
+    """
+    permission_classes = (permissions.AllowAny,)
 
+    def post(self, request, format=None):
+        items = request.data.get('requests') if hasattr(request.data, 'get') else None
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return Response({'detail': 'requests must be a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = getattr(django_settings, 'BATCH_MAX_REQUESTS', 20)
+        if len(items) > limit:
+            return Response({'detail': 'at most %d requests per batch' % limit}, status=status.HTTP_400_BAD_REQUEST)
+        start = time.time()
+        responses = batch.run(request, items)
+        return Response({'responses': responses, 'duration_ms': round((time.time() - start) * 1000, 2)})
+
+
+class ExportView(views.APIView):
+    """
+    Bulk export endpoint for analytics: all posts, comments, bookings or
+    locations streamed from a server-side cursor (drf/exports.py) as NDJSON,
+    or CSV with format=csv
+    query params: since, until (ISO 8601) select the rows by updated; the
+    X-Export-Until header is the since of the next incremental export
+    Allowed request method: Get (admin users)
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (NDJSONRenderer, CSVRenderer, renderers.JSONRenderer)
+
+    def get(self, request, model, format=None):
+        try:
+            since = exports.parse_time(request.query_params.get('since'))
+            until = exports.parse_time(request.query_params.get('until')) or exports.default_until()
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        kind = request.accepted_renderer.format if request.accepted_renderer.format in exports.FORMATS else 'ndjson'
+        response = StreamingHttpResponse(exports.export(model, kind, since, until), content_type=exports.FORMATS[kind])
+        response['X-Export-Until'] = until.isoformat()
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (model, kind)
+        return response
 
 
 ####### geodjango gis ###########
@@ -317,12 +704,14 @@ class LocationContainedInBBoxListView(generics.ListAPIView):
 
 
 class LocationWithinDistanceOfPointListView(generics.ListAPIView):
+    """
+    query params: point=<lat>,<lng> and dist in meters, see drf/geo.py
+    """
     model = Location
     serializer_class = LocationSerializer
-    distance_filter_convert_meters = True
     queryset = Location.objects.all()
-    distance_filter_field = 'geometry'
-    filter_backends = (DistanceToPointFilter,)
+    distance_filter_field = 'geography'
+    filter_backends = (DistanceFilter,)
 
 
 class LocationDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -0,0 +1,15 @@
+"""
+Settings profiles:
+    webizcafe.settings.development  base.py as is: DEBUG, admindocs, swagger, nose
+    webizcafe.settings.production   lean profile for the gunicorn/uWSGI workers
+
+DJANGO_SETTINGS_MODULE=webizcafe.settings loads the profile named by the
+WEBIZCAFE_PROFILE environment variable (development by default).
+"""
+
+import os
+
+if os.environ.get('WEBIZCAFE_PROFILE', 'development') == 'production':
+    from .production import *
+else:
+    from .development import *
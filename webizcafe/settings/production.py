@@ -0,0 +1,29 @@
+"""
+Production profile: no DEBUG (which keeps every SQL query in memory), no
+development-only apps, cached templates, JSON only. Keep what the workers
+import small, `python manage.py startuptime` measures it.
+"""
+
+import os
+
+from .base import *
+
+DEBUG = False
+TEMPLATE_DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('WEBIZCAFE_ALLOWED_HOSTS', '45.55.185.118').split(',')
+SECRET_KEY = os.environ.get('WEBIZCAFE_SECRET_KEY', SECRET_KEY)
+
+DEVELOPMENT_APPS = ('django.contrib.admindocs', 'rest_framework_swagger', 'django_nose')
+INSTALLED_APPS = tuple(app for app in INSTALLED_APPS if app not in DEVELOPMENT_APPS)
+
+REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_RENDERER_CLASSES=('drf.renderers.FastJSONRenderer',))
+
+TEST_RUNNER = 'django.test.runner.DiscoverRunner'
+NOSE_ARGS = []
+
+METRICS_SERVER_TIMING = False
+
+TEMPLATES = [dict(TEMPLATES[0], APP_DIRS=False, OPTIONS=dict(TEMPLATES[0]['OPTIONS'], loaders=[
+    ('django.template.loaders.cached.Loader', list(TEMPLATE_LOADERS)),
+]))]
@@ -1,4 +1,5 @@
 from drf import views
+from django.conf import settings
 from django.contrib import admin
 from django.conf.urls import patterns, url, include
 from rest_framework.urlpatterns import format_suffix_patterns
@@ -11,19 +12,31 @@ urlpatterns = patterns('',
     url(r'^api/v1/me/post/$', views.AuthorPostListView.as_view(), name='authorpost-list'),
     url(r'^api/v1/me/comment/$', views.AuthorCommentListView.as_view(), name='authorcomment-list'),
     url(r'^api/v1/me/booking/$', views.AuthorBookingListView.as_view(), name='authorbooking-list'),
+    url(r'^api/v1/me/booking/calendar\.ics$', views.AuthorBookingCalendarView.as_view(), name='authorbooking-calendar'),
+    url(r'^api/v1/me/booking/stream/$', views.AuthorBookingStreamView.as_view(), name='authorbooking-stream'),
 
     url(r'^api/v1/post/$', views.PostListCreateView.as_view(), name='post-list-create'),
+    url(r'^api/v1/post/facets/$', views.PostFacetView.as_view(), name='postfacet-list'),
     url(r'^api/v1/post/(?P<pk>[0-9]+)/$', views.PostDetailView.as_view(), name='post-detail'),
+    url(r'^api/v1/post/(?P<pk>[0-9]+)/bundle/$', views.PostBundleView.as_view(), name='postbundle-detail'),
+    url(r'^api/v1/post/(?P<pk>[0-9]+)/similar/$', views.PostSimilarView.as_view(), name='postsimilar-list'),
     url(r'^api/v1/post/(?P<pk>[0-9]+)/image/$', views.PostImageView.as_view(), name='postimage-detail'),
     url(r'^api/v1/post/(?P<pk>[0-9]+)/comment/$', views.PostCommentListView.as_view(), name='postcomment-list'),
     url(r'^api/v1/post/(?P<pk>[0-9]+)/booking/$', views.PostBookingListView.as_view(), name='postbooking-list'),
+    url(r'^api/v1/post/(?P<pk>[0-9]+)/booking/calendar\.ics$', views.PostBookingCalendarView.as_view(), name='postbooking-calendar'),
+    url(r'^api/v1/post/(?P<pk>[0-9]+)/booking/stream/$', views.PostBookingStreamView.as_view(), name='postbooking-stream'),
 
     url(r'^api/v1/comment/$', views.CommentCreateView.as_view(), name='comment-create'),
     url(r'^api/v1/comment/(?P<pk>[0-9]+)/$', views.CommentDetailView.as_view(), name='comment-detail'),
     url(r'^api/v1/booking/$', views.BookingCreateView.as_view(), name='booking-create'),
+    url(r'^api/v1/booking/series/$', views.BookingSeriesCreateView.as_view(), name='bookingseries-create'),
     url(r'^api/v1/booking/search/$', views.BookingSearchView.as_view(), name='bookingsearch-list'),
     url(r'^api/v1/booking/(?P<pk>[0-9]+)/$', views.BookingDetailView.as_view(), name='booking-detail'),
 
+    url(r'^api/v1/batch/$', views.BatchView.as_view(), name='batch'),
+    url(r'^api/v1/export/(?P<model>post|comment|booking|location)/$', views.ExportView.as_view(), name='export'),
+    url(r'^api/v1/sync/$', views.SyncView.as_view(), name='sync'),
+
     url(r'^api/v1/obtainjwt/$', 'rest_framework_jwt.views.obtain_jwt_token', name='jwt-obtain'),
     url(r'^api/v1/verifyjwt/$', 'rest_framework_jwt.views.verify_jwt_token', name='jwt-verify'),
     url(r'^api/v1/refreshjwt/$', 'rest_framework_jwt.views.refresh_jwt_token', name='jwt-refresh'),
@@ -36,8 +49,17 @@ urlpatterns = patterns('',
     url(r'^api/v1/area/(?P<pk>[0-9]+)/$', views.BoxedLocationDetailView.as_view(), name='boxedlocation-detail'),
 
     url(r'^api/v1/admin/$', include(admin.site.urls)),
-    url(r'^api/v1/docs/', include('rest_framework_swagger.urls')),
 )
 
+# development only, see webizcafe/settings/production.py
+if 'rest_framework_swagger' in settings.INSTALLED_APPS:
+    urlpatterns += patterns('',
+        url(r'^api/v1/docs/', include('rest_framework_swagger.urls')),
+    )
+
 urlpatterns = format_suffix_patterns(urlpatterns, allowed=['json', 'html'])
 
+urlpatterns += patterns('',
+    url(r'^metrics$', 'drf.metrics.metrics_view', name='metrics'),
+)
+
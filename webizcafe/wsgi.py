@@ -2,6 +2,9 @@
 WSGI config for webizcafe project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+The application is preloaded (see drf/startup.py) so that gunicorn with
+``preload_app`` and uWSGI without ``lazy-apps`` fork workers which are ready
+to serve.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/1.8/howto/deployment/wsgi/
@@ -14,3 +17,6 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "webizcafe.settings")
 
 application = get_wsgi_application()
+
+from drf.startup import preload
+preload(application)